@@ -0,0 +1,81 @@
+"""
+Leaderboard cost with many users.
+
+"baseline" is the original /scores: sort every user by points and render
+every line, on each request. The rest is the cached Ranking: rebuilding it
+after invalidate(), a rank lookup, and rendering one page as /scores and
+the ◀️/▶️ buttons do.
+
+    python bench/leaderboard.py [--users 10000] [--repeat 200]
+"""
+import argparse
+import importlib
+import random
+import sys
+import timeit
+from pathlib import Path
+from typing import Any, Dict, List
+
+# The repository root is the package itself.
+_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_ROOT.parent))
+models = importlib.import_module(f"{_ROOT.name}.models")
+leaderboard = importlib.import_module(f"{_ROOT.name}.services.leaderboard")
+handlers = importlib.import_module(f"{_ROOT.name}.handlers.leaderboard")
+
+
+def make_document(users: int) -> Dict[str, Any]:
+    rng = random.Random(17)
+    db: Dict[str, Any] = {"_config": {}}
+    for u in range(users):
+        db[str(100000 + u)] = {"display_name": f"کاربر {u}", "points": rng.randint(0, 500)}
+    return models.Document(db)  # as storage serves it: the Ranking is cached on the document
+
+
+def baseline_text(db: Dict[str, Any]) -> str:
+    scores = []
+    for uid, u in db.items():
+        if uid == "_config":
+            continue
+        scores.append((int(u.get("points", 0)), u.get("display_name") or u.get("username") or uid))
+    scores.sort(key=lambda x: x[0], reverse=True)
+    lines: List[str] = ["لیگ امتیازات تیمی (بر اساس امتیاز)"]
+    for rank, (pts, name) in enumerate(scores, start=1):
+        lines.append(f"{rank}. {name} – {pts} امتیاز ({handlers._format_price(pts)} $)")
+    return "\n".join(lines)
+
+
+def ms(fn, repeat: int) -> float:
+    return min(timeit.repeat(fn, number=1, repeat=repeat)) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    db = make_document(args.users)
+    uids = [k for k in db if k != "_config"]
+    me = uids[len(uids) // 2]
+    board = leaderboard.ranking(db)
+    last_page = board.pages() - 1
+
+    def rebuild() -> None:
+        leaderboard.invalidate(db)
+        leaderboard.ranking(db)
+
+    results = {
+        "baseline /scores": ms(lambda: baseline_text(db), max(1, args.repeat // 20)),
+        "invalidate + rebuild": ms(rebuild, max(1, args.repeat // 20)),
+        "rank lookup (cached)": ms(lambda: leaderboard.ranking(db).rank(me), args.repeat),
+        "first page (cached)": ms(lambda: handlers._page_text(leaderboard.ranking(db), 0, db, me), args.repeat),
+        "last page (cached)": ms(lambda: handlers._page_text(leaderboard.ranking(db), last_page, db, me), args.repeat),
+    }
+    print(f"{args.users} users, {board.pages()} pages")
+    for name, value in results.items():
+        print(f"{name:>22}: {value:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Event-loop blocking of storage, before and after moving its I/O off the loop.
+
+A ticker task sleeps 1 ms at a time and records how late it wakes up while
+a run of single-user updates goes through storage. "baseline" is the
+original read_all/write_all: json.load and json.dump (indent=2) of the
+whole file on the loop for every update. "current" is storage.py as
+configured: transactions, write-behind flush and a compaction.
+
+    python bench/loop_block.py [--users 200] [--days 365] [--updates 20]
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List
+
+# The repository root is the package itself.
+_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_ROOT.parent))
+storage = importlib.import_module(f"{_ROOT.name}.storage")
+config = importlib.import_module(f"{_ROOT.name}.config")
+
+_TICK = 0.001
+
+
+def make_document(users: int, days: int) -> Dict[str, Any]:
+    start = date.today() - timedelta(days=days)
+    db: Dict[str, Any] = {"_config": {"unlimited_dates": [], "checkin_limit": None}}
+    for u in range(users):
+        history = [(start + timedelta(days=d)).isoformat() for d in range(days)]
+        db[str(100000 + u)] = {
+            **json.loads(json.dumps(storage.DEFAULT_USER)),
+            "username": f"user{u}",
+            "display_name": f"کاربر {u}",
+            "active": True,
+            "points": days,
+            "check_ins": [{"datetime": f"{d} 08:{u % 60:02d}"} for d in history],
+            "check_outs": [{"datetime": f"{d} 17:{u % 60:02d}"} for d in history],
+            "ledger": [{"ts": f"{d} 08:{u % 60:02d}", "amount": 1, "reason": "early_bird", "ref": None} for d in history],
+        }
+    return db
+
+
+async def measure(work: Callable[[], Awaitable[None]]) -> Dict[str, float]:
+    """Run `work` while a ticker records how long the loop went without a turn."""
+    lags: List[float] = []
+    done = False
+
+    async def ticker() -> None:
+        loop = asyncio.get_running_loop()
+        while not done:
+            before = loop.time()
+            await asyncio.sleep(_TICK)
+            lags.append(loop.time() - before - _TICK)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)  # let the ticker settle
+    started = time.perf_counter()
+    await work()
+    elapsed = time.perf_counter() - started
+    done = True
+    await task
+    lags.sort()
+    return {
+        "elapsed_ms": elapsed * 1000,
+        "max_block_ms": lags[-1] * 1000 if lags else 0.0,
+        "p99_block_ms": lags[int(len(lags) * 0.99)] * 1000 if lags else 0.0,
+        "blocked_ms": sum(lag for lag in lags if lag > _TICK) * 1000,
+    }
+
+
+async def baseline(updates: int) -> None:
+    for i in range(updates):
+        with open(config.DATA_FILE, "r", encoding="utf-8") as f:
+            db = json.load(f)
+        uid = str(100000 + i)
+        db[uid]["points"] += 1
+        with open(config.DATA_FILE, "w", encoding="utf-8") as f:
+            json.dump(db, f, ensure_ascii=False, indent=2)
+
+
+async def current(updates: int) -> None:
+    await storage.read_all()
+    for i in range(updates):
+        uid = str(100000 + i)
+        async with storage.transaction(uid) as db:
+            db[uid]["points"] += 1
+    await storage.flush()
+    await storage.compact()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--updates", type=int, default=20)
+    args = parser.parse_args()
+
+    db = make_document(args.users, args.days)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        with open(config.DATA_FILE, "w", encoding="utf-8") as f:
+            json.dump(db, f, ensure_ascii=False, indent=2)
+        size = os.path.getsize(config.DATA_FILE) / 1e6
+        print(f"{args.users} users x {args.days} days, {size:.1f} MB, {args.updates} updates")
+        for name, run in (("baseline", baseline), ("current", current)):
+            result = asyncio.run(measure(lambda: run(args.updates)))
+            print(f"{name:>9}: " + "  ".join(f"{k}={v:.1f}" for k, v in result.items()))
+        os.chdir(_ROOT)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Per-record cost of parsing stored 'YYYY-MM-DD HH:MM' timestamps.
+
+"strptime" is the original parse_db_dt: datetime.strptime then localize.
+"parse_db_dt" is the current one (fast path for strict input), and
+"parse_minutes" is what the attendance logs use when they load a record.
+
+    python bench/parse_dt.py [--records 100000] [--repeat 5]
+"""
+import argparse
+import importlib
+import sys
+import timeit
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, List
+
+# The repository root is the package itself.
+_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_ROOT.parent))
+models = importlib.import_module(f"{_ROOT.name}.models")
+time = importlib.import_module(f"{_ROOT.name}.utils.time")
+
+
+def strptime_localize(s: str) -> datetime:
+    return time.localize(datetime.strptime(s, "%Y-%m-%d %H:%M"))
+
+
+def make_records(n: int) -> List[str]:
+    start = datetime(2024, 1, 1, 8, 0)
+    return [(start + timedelta(minutes=37 * i)).strftime("%Y-%m-%d %H:%M") for i in range(n)]
+
+
+def per_record_us(parse: Callable[[str], object], records: List[str], repeat: int) -> float:
+    def run() -> None:
+        for s in records:
+            parse(s)
+
+    return min(timeit.repeat(run, number=1, repeat=repeat)) / len(records) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    records = make_records(args.records)
+    for s in records[:1000]:
+        assert time.parse_db_dt(s) == strptime_localize(s), s
+    print(f"{args.records} records, best of {args.repeat}")
+    baseline = per_record_us(strptime_localize, records, args.repeat)
+    for name, parse in (
+        ("strptime", strptime_localize),
+        ("parse_db_dt", time.parse_db_dt),
+        ("parse_minutes", models.parse_minutes),
+    ):
+        us = baseline if parse is strptime_localize else per_record_us(parse, records, args.repeat)
+        print(f"{name:>13}: {us:.2f} us/record  ({baseline / us:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
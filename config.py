@@ -1,13 +1,44 @@
 from pytz import timezone
 
 # Core settings
-LOCAL_TZ = timezone("Asia/Tehran")   # operational TZ
+USE_ZONEINFO = False                 # True → stdlib zoneinfo instead of pytz
+if USE_ZONEINFO:
+    from zoneinfo import ZoneInfo
+    LOCAL_TZ = ZoneInfo("Asia/Tehran")
+else:
+    LOCAL_TZ = timezone("Asia/Tehran")   # operational TZ
 DATA_FILE = "worker_days_off.json"   # existing JSON store
+STORAGE_BACKEND = "json"              # "json" or "sqlite"
+SQLITE_FILE = "teameto.sqlite3"       # used when STORAGE_BACKEND == "sqlite"
+JOURNAL_FILE = "worker_days_off.journal"   # append-only log of changed records
+JOURNAL_ENABLED = True                # False → every write rewrites DATA_FILE
+JOURNAL_COMPACT_EVERY = 500           # journal records before folding into DATA_FILE
+STORAGE_RESIDENT = True               # parse once, serve from memory, flush write-behind
+WRITE_BEHIND_DELAY = 2.0              # seconds of quiet before flushing dirty records
+WRITE_BEHIND_MAX_DELAY = 10.0         # upper bound on how long a change stays unflushed
 
 # Defaults / business rules
 DEFAULT_CHECKIN_LIMIT = "08:31"       # HH:MM (24h)
+WEEKDAY_CHECKIN_LIMITS = {3: "09:31"} # weekday (Mon=0) → HH:MM; Thursday starts later
+CHECKIN_GRACE_MIN = 0                 # minutes of grace after the limit
 EARLY_BIRD_WINDOW_MIN = 120           # minutes window for early ladder
 
+# Outgoing messages (Telegram limits: ~30 msg/s per bot, ~1 msg/s per chat)
+BROADCAST_CONCURRENCY = 20
+BROADCAST_GLOBAL_PER_SEC = 25
+BROADCAST_PER_CHAT_PER_SEC = 1.0
+BROADCAST_MAX_RETRIES = 3             # RetryAfter retries per message
+OUTBOX_FILE = "outbox.json"           # pending notifications, survives restarts
+OUTBOX_BATCH = 50                     # chats per worker step; higher lanes can cut in between
+DELIVERY_BACKOFF_BASE = 60            # seconds a chat is skipped after its first network failure
+DELIVERY_BACKOFF_MAX = 6 * 3600       # ...doubling per consecutive failure up to this
+DIGEST_ENABLED = False                # coalesce arrival/departure announcements
+DIGEST_WINDOW_SEC = 300               # how long a digest collects events before it is sent
+DIGEST_URGENT_IMMEDIATE = True        # yellow-card arrivals skip the digest
+ARCHIVE_DIR = "archive"               # per-month compressed history (YYYY-MM.json.xz)
+ARCHIVE_KEEP_MONTHS = 1               # closed months kept in the hot store besides the current one
+ARCHIVE_EVERY_SEC = 6 * 3600          # how often the archival job looks for closed months
+
 # Admins (ADD YOUR ADMIN IDS)
 ADMIN_IDS = {5963270398}  # example: General | Aref 🏅
 
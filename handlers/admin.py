@@ -1,8 +1,19 @@
+import asyncio
 from datetime import date
+from typing import Any, Dict, List
 from telegram import Update
 from telegram.ext import ContextTypes
 from ..config import ADMIN_IDS
-from ..storage import read_all, write_all, ensure_config, get_user
+from ..storage import read_all, transaction, ensure_config, get_user, locks
+from ..services.arrivals import invalidate as invalidate_arrivals
+from ..services.attendance import invalidate_policy
+from ..services.leaderboard import invalidate as invalidate_leaderboard
+from ..services.yellow_cards import give_admin_card, remove_card
+from ..models import describe_card, yellow_cards
+from ..services import analytics, archive, delivery, directory, ledger, outbox, simulator, timesheet
+from ..utils.time import now_local
+from .common import resolve_target
+from ..services.broadcast import all_chat_ids
 from uuid import uuid4
 from datetime import datetime
 
@@ -19,12 +30,12 @@ async def unlimit_today(update: Update, context: ContextTypes.DEFAULT_TYPE):
     tg_user = update.effective_user
     if tg_user is None or tg_user.id not in ADMIN_IDS:
         return await msg.reply_text("⛔️ دسترسی ندارید.")
-    db = await read_all()
-    cfg = await ensure_config(db)
-    today = date.today().isoformat()
-    if today not in cfg["unlimited_dates"]:
-        cfg["unlimited_dates"].append(today)
-        await write_all(db)
+    async with transaction("_config") as db:
+        cfg = await ensure_config(db)
+        today = date.today().isoformat()
+        if today not in cfg["unlimited_dates"]:
+            cfg["unlimited_dates"].append(today)
+            invalidate_policy(db)
     await msg.reply_text("امروز محدودیت ورود برداشته شد ✅")
 
 async def notify_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -42,18 +53,9 @@ async def notify_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     message = " ".join(args)
     db = await read_all()
-    count = 0
-
-    for uid in db:
-        if uid == "_config":
-            continue
-        try:
-            await context.bot.send_message(chat_id=int(uid), text=f"📢 {message}")
-            count += 1
-        except Exception:
-            pass
+    queued = outbox.enqueue(all_chat_ids(db), f"📢 {message}", priority=outbox.ADMIN, report_to=tg_user.id)
 
-    await msg.reply_text(f"پیام برای {count} نفر ارسال شد ✅")
+    await msg.reply_text(f"پیام برای ارسال به {queued} نفر در صف قرار گرفت ⏳")
 async def set_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Admin: set or update a user's display name."""
     msg = _msg(update)
@@ -67,29 +69,29 @@ async def set_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if len(args) < 2:
         return await msg.reply_text("❗️ استفاده: /setname <user_id> <display name>")
 
-    target_id = args[0]
+    target_id = await resolve_target(msg, args[0])
+    if target_id is None:
+        return
     new_name = " ".join(args[1:])
 
-    db = await read_all()
-    user = await get_user(db, target_id)
-
-    old_name = user.get("display_name") or user.get("username") or target_id
-    user["display_name"] = new_name
-    await write_all(db)
+    async with transaction(target_id) as db:
+        user = await get_user(db, target_id)
+        old_name = user.get("display_name") or user.get("username") or target_id
+        user["display_name"] = new_name
+        invalidate_leaderboard(db)
+        directory.record(db, target_id)
 
     await msg.reply_text(f"نام کاربر تغییر یافت:\n{old_name} → {new_name}")
 
     # notify user
-    try:
-        await context.bot.send_message(
-            chat_id=int(target_id),
-            text=f"👤 نام شما توسط مدیریت تغییر یافت:\n{new_name}"
-        )
-    except Exception:
-        pass
+    outbox.notify(target_id, f"👤 نام شما توسط مدیریت تغییر یافت:\n{new_name}")
 
 async def remove_yellow(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Admin: remove a yellow card from a user by index."""
+    """
+    Admin: /remove_yellow <user> lists the user's cards;
+    /remove_yellow <user> <card id|number> [refund] removes one,
+    optionally giving back the points it cost.
+    """
     msg = _msg(update)
     if msg is None:
         return
@@ -98,39 +100,57 @@ async def remove_yellow(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return await msg.reply_text("⛔️ دسترسی ندارید.")
 
     args = context.args or []
-    if len(args) < 2:
-        return await msg.reply_text("❗️ استفاده: /remove_yellow <user_id> <index>")
+    if not args:
+        return await msg.reply_text("❗️ استفاده: /remove_yellow <user_id> <card_id> [refund]")
 
-    target_id = args[0]
-    try:
-        index = int(args[1]) - 1
-    except ValueError:
-        return await msg.reply_text("❗️ شماره کارت زرد باید عدد باشد.")
+    target_id = await resolve_target(msg, args[0])
+    if target_id is None:
+        return
 
-    db = await read_all()
-    user = await get_user(db, target_id)
+    if len(args) < 2:
+        db = await read_all()
+        cards = yellow_cards(db[target_id]) if target_id in db else []
+        if not cards:
+            return await msg.reply_text("❗️ این کاربر هیچ کارت زردی ندارد.")
+        lines = ["کارت‌های زرد (شناسه → کارت):"]
+        for i, card in enumerate(cards, start=1):
+            penalty = card.get("penalty")
+            cost = f" (-{penalty})" if penalty else ""
+            lines.append(f"{i}. [{card['id']}] {describe_card(card)}{cost}")
+        return await msg.reply_text("\n".join(lines))
+
+    card_ref = args[1]
+    refund = len(args) > 2 and args[2].lower() in ("refund", "بازگشت")
+
+    async with transaction(target_id) as db:
+        user = db.get(target_id)
+        if user:
+            cards = yellow_cards(user)
+            card_id = card_ref
+            if cards.get(card_id) is None and card_ref.isdigit() and 0 < int(card_ref) <= len(cards):
+                card_id = cards[int(card_ref) - 1]["id"]  # old style: position in the list
+            removed, refunded = remove_card(db, user, card_id, refund=refund)
 
-    cards = user.get("yellow_cards", [])
-    if not cards:
+    if not user:
+        return await msg.reply_text("❗️ کاربر پیدا نشد.")
+    if not cards and removed is None:
         return await msg.reply_text("❗️ این کاربر هیچ کارت زردی ندارد.")
-    if index < 0 or index >= len(cards):
-        return await msg.reply_text("❗️ شماره کارت زرد نامعتبر است.")
-
-    removed = cards.pop(index)
-    await write_all(db)
+    if removed is None:
+        return await msg.reply_text("❗️ شناسه کارت زرد نامعتبر است.")
 
     display = user.get("display_name") or user.get("username") or target_id
+    text = f"⚠️ یک کارت زرد شما توسط مدیریت حذف شد.\n❌ {describe_card(removed)}"
+    reply = f"کارت زرد {removed['id']} برای {display} حذف شد ✅"
+    if refunded:
+        text += f"\n➕ {refunded} امتیاز به حساب شما بازگشت."
+        reply += f"\n{refunded} امتیاز بازگردانده شد."
+    elif refund:
+        reply += "\nجریمه‌ای برای این کارت ثبت نشده بود."
 
     # notify user
-    try:
-        await context.bot.send_message(
-            chat_id=int(target_id),
-            text=f"⚠️ یک کارت زرد شما توسط مدیریت حذف شد.\n❌ {removed}"
-        )
-    except Exception:
-        pass
+    outbox.notify(target_id, text)
 
-    await msg.reply_text(f"کارت زرد شماره {index+1} برای {display} حذف شد ✅")
+    await msg.reply_text(reply)
 
 
 
@@ -147,36 +167,24 @@ async def give_yellow(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if len(args) < 2:
         return await msg.reply_text("❗️ استفاده: /yellow <user_id> <reason>")
 
-    target_id = args[0]
+    target_id = await resolve_target(msg, args[0])
+    if target_id is None:
+        return
     reason = " ".join(args[1:])
 
-    db = await read_all()
-    user = await get_user(db, target_id)
-
-    # record yellow card
-    now = datetime.now().strftime("%Y-%m-%d %H:%M")
-    entry = f"کارت زرد (اداری) در {now}: {reason}"
-    user.setdefault("yellow_cards", []).append(entry)
+    async with transaction(target_id) as db:
+        user = await get_user(db, target_id)
 
-    await write_all(db)
+        give_admin_card(user, reason)
 
     display = user.get("display_name") or user.get("username") or target_id
 
     # notify target user
-    try:
-        await context.bot.send_message(chat_id=int(target_id), text=f"⚠️ شما یک کارت زرد گرفتید: {reason}")
-    except Exception:
-        pass
+    outbox.notify(target_id, f"⚠️ شما یک کارت زرد گرفتید: {reason}")
 
     # broadcast to everyone
     text = f"📢 {display} یک کارت زرد گرفت ({reason})"
-    for uid in db:
-        if uid == "_config":
-            continue
-        try:
-            await context.bot.send_message(chat_id=int(uid), text=text)
-        except Exception:
-            pass
+    outbox.enqueue(all_chat_ids(db), text, priority=outbox.ADMIN)
 
     await msg.reply_text(f"کارت زرد برای {display} ثبت شد ✅")
 
@@ -193,27 +201,21 @@ async def assign_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if len(args) < 2:
         return await msg.reply_text("❗️ استفاده: /task <user_id> <task text>")
 
-    target_id = args[0]
+    target_id = await resolve_target(msg, args[0])
+    if target_id is None:
+        return
     task_text = " ".join(args[1:])
     task_id = str(uuid4())[:8]
 
-    db = await read_all()
-    user = await get_user(db, target_id)
-
-    task_entry = {"id": task_id, "text": task_text}
-    user.setdefault("tasks", []).append(task_entry)
-    await write_all(db)
+    async with transaction(target_id) as db:
+        user = await get_user(db, target_id)
+        task_entry = {"id": task_id, "text": task_text}
+        user.setdefault("tasks", []).append(task_entry)
 
     display = user.get("display_name") or user.get("username") or target_id
 
     # notify target user
-    try:
-        await context.bot.send_message(
-            chat_id=int(target_id),
-            text=f"📌 شما یک مأموریت جدید دارید:\n{task_text}\n(برای مشاهده: 📝 MY TASKS)"
-        )
-    except Exception:
-        pass
+    outbox.notify(target_id, f"📌 شما یک مأموریت جدید دارید:\n{task_text}\n(برای مشاهده: 📝 MY TASKS)")
 
     await msg.reply_text(f"ماموریت برای {display} ثبت شد ✅")
 
@@ -251,23 +253,19 @@ async def activate_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not args:
         return await msg.reply_text("❗️ استفاده: /activate <user_id>")
 
-    target_id = args[0]
-    db = await read_all()
-    user = db.get(target_id)
+    target_id = await resolve_target(msg, args[0])
+    if target_id is None:
+        return
+    async with transaction(target_id) as db:
+        user = db.get(target_id)
+        if user:
+            user["active"] = True
+            invalidate_arrivals(db)
     if not user:
         return await msg.reply_text("❗️ کاربر پیدا نشد.")
 
-    user["active"] = True
-    await write_all(db)
-
     await msg.reply_text(f"✅ کاربر {target_id} فعال شد.")
-    try:
-        await context.bot.send_message(
-            chat_id=int(target_id),
-            text="✅ حساب شما توسط مدیریت فعال شد. حالا می‌توانید از امکانات استفاده کنید."
-        )
-    except Exception:
-        pass
+    outbox.notify(target_id, "✅ حساب شما توسط مدیریت فعال شد. حالا می‌توانید از امکانات استفاده کنید.")
 
 
 async def deactivate_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -281,15 +279,17 @@ async def deactivate_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not args:
         return await msg.reply_text("❗️ استفاده: /deactivate <user_id>")
 
-    target_id = args[0]
-    db = await read_all()
-    user = db.get(target_id)
+    target_id = await resolve_target(msg, args[0])
+    if target_id is None:
+        return
+    async with transaction(target_id) as db:
+        user = db.get(target_id)
+        if user:
+            user["active"] = False
+            invalidate_arrivals(db)
     if not user:
         return await msg.reply_text("❗️ کاربر پیدا نشد.")
 
-    user["active"] = False
-    await write_all(db)
-
     await msg.reply_text(f"❌ کاربر {target_id} غیرفعال شد.")
 
 async def remove_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -305,22 +305,21 @@ async def remove_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not args:
         return await msg.reply_text("❗️ استفاده: /remove_user <user_id>")
 
-    target_id = args[0]
-    db = await read_all()
-    if target_id not in db or target_id == "_config":
+    target_id = await resolve_target(msg, args[0])
+    if target_id is None:
+        return
+    if target_id == "_config":
+        return await msg.reply_text("❗️ کاربر پیدا نشد یا قابل حذف نیست.")
+    async with transaction(target_id) as db:
+        removed = db.pop(target_id, None)
+        invalidate_arrivals(db)
+        invalidate_leaderboard(db)
+        directory.forget(db, target_id)
+    if removed is None:
         return await msg.reply_text("❗️ کاربر پیدا نشد یا قابل حذف نیست.")
-
-    del db[target_id]
-    await write_all(db)
 
     await msg.reply_text(f"کاربر {target_id} با موفقیت حذف شد ✅")
-    try:
-        await context.bot.send_message(
-            chat_id=int(target_id),
-            text="⛔️ حساب شما توسط مدیریت حذف شد. دیگر نمی‌توانید از امکانات استفاده کنید."
-        )
-    except Exception:
-        pass
+    outbox.notify(target_id, "⛔️ حساب شما توسط مدیریت حذف شد. دیگر نمی‌توانید از امکانات استفاده کنید.")
 
 async def list_inactive(update: Update, context: ContextTypes.DEFAULT_TYPE):
     msg = _msg(update)
@@ -343,4 +342,339 @@ async def list_inactive(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if not found:
         return await msg.reply_text("✅ هیچ کاربر غیرفعالی وجود ندارد.")
-    await msg.reply_text("\n".join(lines))
\ No newline at end of file
+    await msg.reply_text("\n".join(lines))
+
+
+async def lock_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin: show which storage locks handlers actually wait on."""
+    msg = _msg(update)
+    if msg is None:
+        return
+    tg_user = update.effective_user
+    if tg_user is None or tg_user.id not in ADMIN_IDS:
+        return await msg.reply_text("⛔️ دسترسی ندارید.")
+
+    lines = ["🔒 رقابت روی قفل‌ها (بیشترین انتظار):"]
+    for key, stat in locks.stats()[:15]:
+        if not stat.contended:
+            continue
+        lines.append(
+            f"{key}: {stat.contended}/{stat.acquired} منتظر، "
+            f"مجموع {stat.wait_total * 1000:.0f}ms، بیشینه {stat.wait_max * 1000:.0f}ms"
+        )
+
+    if len(lines) == 1:
+        return await msg.reply_text("✅ هیچ انتظاری روی قفل‌ها ثبت نشده است.")
+    await msg.reply_text("\n".join(lines))
+
+
+async def outbox_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin: show how much is waiting in the outgoing message queue."""
+    msg = _msg(update)
+    if msg is None:
+        return
+    tg_user = update.effective_user
+    if tg_user is None or tg_user.id not in ADMIN_IDS:
+        return await msg.reply_text("⛔️ دسترسی ندارید.")
+
+    lines = ["📤 صف پیام‌های خروجی:"]
+    for lane, items, messages, age in outbox.metrics():
+        lines.append(f"{lane}: {items} مورد، {messages} پیام، قدیمی‌ترین {age:.0f} ثانیه")
+    await msg.reply_text("\n".join(lines))
+
+
+async def undeliverable_chats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin: chats that broadcasts currently skip, and why."""
+    msg = _msg(update)
+    if msg is None:
+        return
+    tg_user = update.effective_user
+    if tg_user is None or tg_user.id not in ADMIN_IDS:
+        return await msg.reply_text("⛔️ دسترسی ندارید.")
+
+    entries = delivery.entries()
+    if not entries:
+        return await msg.reply_text("✅ همه چت‌ها قابل ارسال هستند.")
+
+    db = await read_all()
+    lines = ["📵 چت‌هایی که پیام دریافت نمی‌کنند:"]
+    for chat_id, entry in entries[:50]:
+        user = db.get(chat_id) or {}
+        name = user.get("display_name") or user.get("username") or chat_id
+        since = datetime.fromtimestamp(entry["since"]).strftime("%Y-%m-%d %H:%M")
+        if entry["status"] == delivery.DEAD:
+            lines.append(f"⛔️ {name} ({chat_id}): {entry['reason']} از {since}")
+        else:
+            retry = datetime.fromtimestamp(entry["retry_at"]).strftime("%H:%M")
+            lines.append(f"⏳ {name} ({chat_id}): {entry['fails']} خطای شبکه، تلاش بعدی {retry}")
+    if len(entries) > 50:
+        lines.append(f"… و {len(entries) - 50} مورد دیگر")
+    await msg.reply_text("\n".join(lines))
+
+
+async def points_ledger(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Admin: /ledger checks every cached balance against the ledger;
+    /ledger <user> [from] [to] lists that user's point entries.
+    """
+    msg = _msg(update)
+    if msg is None:
+        return
+    tg_user = update.effective_user
+    if tg_user is None or tg_user.id not in ADMIN_IDS:
+        return await msg.reply_text("⛔️ دسترسی ندارید.")
+
+    args = context.args or []
+    if not args:
+        db = await read_all()
+        mismatched = ledger.verify(db)
+        if not mismatched:
+            return await msg.reply_text("✅ امتیاز همه کاربران با دفتر امتیازات یکی است.")
+        lines = ["⚠️ مغایرت امتیاز با دفتر:"]
+        for uid, cached, total in mismatched:
+            lines.append(f"{uid}: ذخیره‌شده {cached} / دفتر {total}")
+        return await msg.reply_text("\n".join(lines))
+
+    target_id = await resolve_target(msg, args[0])
+    if target_id is None:
+        return
+    since = args[1] if len(args) > 1 else None
+    until = args[2] if len(args) > 2 else None
+    db = await read_all()
+    user = db.get(target_id)
+    if not user:
+        return await msg.reply_text("❗️ کاربر پیدا نشد.")
+
+    rows = ledger.history(user, since, until)
+    if not rows:
+        return await msg.reply_text("❗️ هیچ تراکنش امتیازی در این بازه نیست.")
+    name = user.get("display_name") or user.get("username") or target_id
+    lines = [f"📒 دفتر امتیازات {name} (موجودی {user.get('points', 0)}):"]
+    if len(rows) > 30:
+        lines.append(f"… {len(rows) - 30} مورد قدیمی‌تر")
+    for e in rows[-30:]:
+        ref = f" ({e['ref']})" if e.get("ref") else ""
+        lines.append(f"{e['ts']}  {e['amount']:+d}  {e['reason']}{ref}")
+    await msg.reply_text("\n".join(lines))
+
+
+async def archive_now(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin: move closed months to the archive files now instead of waiting for the job."""
+    msg = _msg(update)
+    if msg is None:
+        return
+    tg_user = update.effective_user
+    if tg_user is None or tg_user.id not in ADMIN_IDS:
+        return await msg.reply_text("⛔️ دسترسی ندارید.")
+
+    moved = await archive.archive_closed_months()
+    if not moved:
+        return await msg.reply_text("✅ چیزی برای بایگانی نبود.")
+    lines = [f"🗄 بایگانی شد (ماه‌های قبل از {archive.cutoff(now_local().date()).isoformat()[:7]}):"]
+    for field, count in sorted(moved.items()):
+        lines.append(f"{field}: {count}")
+    await msg.reply_text("\n".join(lines))
+
+
+async def export_timesheet(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin: /export <from> <to> [user] sends the timesheet for those days as a gzip CSV."""
+    msg = _msg(update)
+    if msg is None:
+        return
+    tg_user = update.effective_user
+    if tg_user is None or tg_user.id not in ADMIN_IDS:
+        return await msg.reply_text("⛔️ دسترسی ندارید.")
+
+    args = context.args or []
+    if len(args) < 2:
+        return await msg.reply_text("استفاده: /export YYYY-MM-DD YYYY-MM-DD [کاربر]")
+    try:
+        start, end = date.fromisoformat(args[0]), date.fromisoformat(args[1])
+    except ValueError:
+        return await msg.reply_text("❗️ تاریخ‌ها باید به شکل YYYY-MM-DD باشند.")
+    if end < start:
+        return await msg.reply_text("❗️ تاریخ پایان قبل از تاریخ شروع است.")
+
+    db = await read_all()
+    if len(args) > 2:
+        target_id = await resolve_target(msg, args[2])
+        if target_id is None:
+            return
+        if target_id not in db:
+            return await msg.reply_text("❗️ کاربر پیدا نشد.")
+        uids = [target_id]
+    else:
+        uids = sorted(uid for uid, u in db.items() if uid != "_config" and isinstance(u, dict))
+
+    out, count = await timesheet.export(db, start, end, uids)
+    with out:
+        if not count:
+            return await msg.reply_text("❗️ در این بازه هیچ ورود و خروجی ثبت نشده است.")
+        await msg.reply_document(
+            document=out,
+            filename=f"timesheet-{start.isoformat()}-{end.isoformat()}.csv.gz",
+            caption=f"🗂 کارکرد {start.isoformat()} تا {end.isoformat()} ({count} ردیف)",
+        )
+
+
+def _clock(minutes: float) -> str:
+    if minutes != minutes:  # NaN: no data
+        return "—"
+    hour, minute = divmod(int(round(minutes)), 60)
+    return f"{hour:02d}:{minute:02d}"
+
+
+def _percent(rate: float) -> str:
+    return "—" if rate != rate else f"{rate * 100:.0f}%"
+
+
+async def attendance_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin: /stats [from] [to] [user] — attendance figures for the team or one user (default: this month)."""
+    msg = _msg(update)
+    if msg is None:
+        return
+    tg_user = update.effective_user
+    if tg_user is None or tg_user.id not in ADMIN_IDS:
+        return await msg.reply_text("⛔️ دسترسی ندارید.")
+
+    args = context.args or []
+    today = now_local().date()
+    try:
+        start = date.fromisoformat(args[0]) if args else today.replace(day=1)
+        end = date.fromisoformat(args[1]) if len(args) > 1 else today
+    except ValueError:
+        return await msg.reply_text("استفاده: /stats [YYYY-MM-DD] [YYYY-MM-DD] [کاربر]")
+    if end < start:
+        return await msg.reply_text("❗️ تاریخ پایان قبل از تاریخ شروع است.")
+
+    db = await read_all()
+    target_id = None
+    if len(args) > 2:
+        target_id = await resolve_target(msg, args[2])
+        if target_id is None:
+            return
+    # Archives are read and the columns built on a worker thread, over copies of the logs.
+    report = await asyncio.get_running_loop().run_in_executor(
+        None, analytics.report, analytics.snapshot(db), start, end
+    )
+
+    def name(uid: str) -> str:
+        u = db.get(uid) or {}
+        return u.get("display_name") or u.get("username") or uid
+
+    header = f"📊 آمار حضور {start.isoformat()} تا {end.isoformat()}"
+    if target_id is not None:
+        s = report.user(target_id)
+        if s is None or not s["days"]:
+            return await msg.reply_text("❗️ برای این کاربر در این بازه حضوری ثبت نشده است.")
+        return await msg.reply_text("\n".join([
+            f"{header} — {name(target_id)}",
+            f"روزهای حضور: {s['days']}",
+            f"تاخیر: {s['late_days']} روز ({_percent(s['late_rate'])})",
+            f"میانگین ورود: {_clock(s['avg_arrival'])}",
+            f"میانگین کارکرد: {_clock(s['avg_worked'])}",
+            f"اضافه‌کاری: {s['overtime'] // 60} ساعت و {s['overtime'] % 60} دقیقه",
+            f"بهترین زنجیره ورود به‌موقع: {s['best_streak']} (فعلی: {s['current_streak']})",
+        ]))
+
+    team = report.team
+    if not team["days"]:
+        return await msg.reply_text("❗️ در این بازه هیچ حضوری ثبت نشده است.")
+    edges = (0,) + analytics.WORKED_BUCKETS + (24,)
+    histogram = "، ".join(
+        f"{lo}-{hi}h: {int(count)}" for lo, hi, count in zip(edges, edges[1:], report.worked_histogram)
+    )
+    lines = [
+        header,
+        f"کاربران حاضر: {team['users']} | روز-نفر: {team['days']}",
+        f"نرخ تاخیر: {_percent(team['late_rate'])}",
+        f"میانگین ورود: {_clock(team['avg_arrival'])}",
+        f"کارکرد روزانه: میانگین {_clock(team['avg_worked'])}، میانه {_clock(team['median_worked'])}",
+        f"توزیع کارکرد: {histogram}",
+        f"مجموع اضافه‌کاری: {team['overtime'] // 60} ساعت",
+        "",
+        "⏰ بیشترین تاخیر: " + "، ".join(
+            f"{name(uid)} ({_percent(report.user(uid)['late_rate'])})" for uid in report.ranked("late_rate")
+        ),
+        "🔥 بهترین زنجیره: " + "، ".join(
+            f"{name(uid)} ({report.user(uid)['best_streak']})" for uid in report.ranked("best_streak")
+        ),
+        "🏆 بیشترین اضافه‌کاری: " + "، ".join(
+            f"{name(uid)} ({report.user(uid)['overtime'] // 60}h)" for uid in report.ranked("overtime")
+        ),
+    ]
+    await msg.reply_text("\n".join(lines))
+
+
+# /simulate key → (Params keyword, parser)
+_SIM_KEYS = {
+    "limit": ("checkin_limit", lambda v: datetime.strptime(v, "%H:%M").strftime("%H:%M")),
+    "top": ("early_bird_top", int),
+    "eb": ("early_bird_points", int),
+    "window": ("early_bird_window", int),
+    "bonus": ("team_bonus", int),
+    "penalty": ("yellow_penalty", int),
+    "overtime": ("overtime_from", lambda v: datetime.strptime(v, "%H:%M").strftime("%H:%M")),
+}
+_SIM_MAX_SETS = 200
+_SIM_SHOWN = 15
+
+
+async def simulate_rewards(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Admin: /simulate [from] [to] key=v1,v2 ... replays the range under every
+    combination of the given rule values (limit, top, eb, window, bonus,
+    penalty, overtime) and compares points and payout with the current rules.
+    Read-only.
+    """
+    msg = _msg(update)
+    if msg is None:
+        return
+    tg_user = update.effective_user
+    if tg_user is None or tg_user.id not in ADMIN_IDS:
+        return await msg.reply_text("⛔️ دسترسی ندارید.")
+
+    usage = "استفاده: /simulate [YYYY-MM-DD] [YYYY-MM-DD] " + " ".join(f"{k}=..." for k in _SIM_KEYS)
+    today = now_local().date()
+    dates: List[date] = []
+    choices: Dict[str, List[Any]] = {}
+    try:
+        for arg in context.args or []:
+            if "=" in arg:
+                key, _, values = arg.partition("=")
+                name, parse = _SIM_KEYS[key.lower()]
+                choices[name] = [parse(v) for v in values.split(",") if v]
+            else:
+                dates.append(date.fromisoformat(arg))
+    except (KeyError, ValueError):
+        return await msg.reply_text(usage)
+    if len(dates) > 2:
+        return await msg.reply_text(usage)
+    start = dates[0] if dates else today.replace(day=1)
+    end = dates[1] if len(dates) > 1 else today
+    if end < start:
+        return await msg.reply_text("❗️ تاریخ پایان قبل از تاریخ شروع است.")
+
+    param_sets = [simulator.Params("قوانین فعلی")] + (simulator.grid(**choices) if choices else [])
+    if len(param_sets) > _SIM_MAX_SETS + 1:
+        return await msg.reply_text(f"❗️ حداکثر {_SIM_MAX_SETS} ترکیب در هر اجرا.")
+
+    db = await read_all()
+    # Archives are read, the matrices built and the sweep run on a worker thread, over copies of the logs.
+    loop = asyncio.get_running_loop()
+    history = await loop.run_in_executor(None, simulator.History, analytics.snapshot(db), start, end)
+    outcomes = await loop.run_in_executor(None, history.sweep, param_sets)
+
+    base = outcomes[0]
+    lines = [
+        f"🧪 شبیه‌سازی پاداش‌ها {start.isoformat()} تا {end.isoformat()} ({len(history.uids)} کاربر فعال)",
+        f"قوانین فعلی: {base.total} امتیاز = {base.payout:,} تومان",
+    ]
+    for o in outcomes[1:_SIM_SHOWN + 1]:
+        lines.append(
+            f"• {o.params.describe()}: {o.total} امتیاز = {o.payout:,} تومان "
+            f"({o.payout - base.payout:+,})"
+        )
+    if len(outcomes) > _SIM_SHOWN + 1:
+        lines.append(f"… و {len(outcomes) - _SIM_SHOWN - 1} ترکیب دیگر")
+    await msg.reply_text("\n".join(lines))
@@ -1,18 +1,26 @@
-from telegram import Update
+from typing import List
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import CallbackContext, ContextTypes
 
-from ..storage import read_all, write_all, get_user
+from ..models import describe_card, yellow_cards
+from ..utils.time import now_local
+from ..storage import read_all, transaction, ensure_config, get_user, CROSS_USER
 from ..services.attendance import (
     record_check_in,
     record_check_out,
     first_check_in_for_day,
 )
+from ..services import archive, ladder, outbox
+from ..services.leaderboard import invalidate as invalidate_leaderboard
+from ..services.broadcast import all_chat_ids
 from ..services.yellow_cards import maybe_add_yellow, YELLOW_CARD_PENALTY
 from ..services.rewards import (
     handle_early_bird_logic,
     handle_team_checkin_bonus,
-    build_early_birds_ladder,
+    team_bonus_candidates,
     accrue_overtime_points,
+    overtime_after_hours,
 )
 
 
@@ -27,13 +35,42 @@ async def handle_checkin(update: Update, context: CallbackContext) -> None:
     user_id = str(tg_user.id)
     username = tg_user.username or f"user_{user_id}"
 
-    db = await read_all()
-    user = await get_user(db, user_id, username=username)
-    if not user.get("active", False):
+    async with transaction(user_id) as db:
+        user = await get_user(db, user_id, username=username)
+        active = user.get("active", False)
+        ok, response, when = False, "", None
+        if active:
+            ok, response, when = await record_check_in(db, user, user_id=user_id)
+
+        if ok and when is not None:
+            got_yellow = await maybe_add_yellow(db, user, when)
+            points_after_penalty = None
+            if got_yellow:
+                try:
+                    points_after_penalty = int(user.get("points", 0) or 0)
+                except (TypeError, ValueError):
+                    points_after_penalty = user.get("points", 0)
+
+            balance_display = points_after_penalty if points_after_penalty is not None else user.get("points", 0)
+
+            just_awarded = await handle_early_bird_logic(db, user_id)
+
+    team_awarded_ids: List[str] = []
+    if ok and when is not None:
+        # The team bonus spans users, so it runs in its own transaction that
+        # only locks everyone once the last active member has arrived.
+        candidates = team_bonus_candidates(db)
+        if candidates:
+            tx = transaction(lock=(CROSS_USER, *candidates))
+            async with tx as db:
+                team_awarded_ids = await handle_team_checkin_bonus(db)
+                tx.touch(*team_awarded_ids)
+        ladder_text = ladder.ladder_text(db)
+
+    if not active:
         await message.reply_text("⛔️ حساب شما توسط مدیریت فعال نشده است.")
         return
 
-    ok, response, when = await record_check_in(db, user)
     if not ok:
         await message.reply_text(response)
         return
@@ -42,22 +79,6 @@ async def handle_checkin(update: Update, context: CallbackContext) -> None:
         await message.reply_text("❗️در ثبت زمان ورود خطایی رخ داد. لطفاً دوباره تلاش کنید.")
         return
 
-    got_yellow = await maybe_add_yellow(db, user, when)
-    points_after_penalty = None
-    if got_yellow:
-        try:
-            points_after_penalty = int(user.get("points", 0) or 0)
-        except (TypeError, ValueError):
-            points_after_penalty = user.get("points", 0)
-
-    balance_display = points_after_penalty if points_after_penalty is not None else user.get("points", 0)
-
-    just_awarded = await handle_early_bird_logic(db, user_id)
-    team_awarded_ids = await handle_team_checkin_bonus(db)
-    ladder_text = build_early_birds_ladder(db)
-
-    await write_all(db)
-
     time_str = when.strftime("%H:%M")
     display = user.get("display_name") or username
 
@@ -79,15 +100,21 @@ async def handle_checkin(update: Update, context: CallbackContext) -> None:
         team_msg = "🎉 همه اعضای تیم قبل از مهلت امروز ورود کردند؛ 1 امتیاز به همه اضافه شد!"
         if user_id in team_awarded_ids:
             await message.reply_text(team_msg)
-        for uid in team_awarded_ids:
-            if uid == user_id:
-                continue
-            try:
-                await context.bot.send_message(chat_id=int(uid), text=team_msg)
-            except Exception:
-                pass
+        outbox.enqueue([int(uid) for uid in team_awarded_ids if uid != user_id], team_msg)
 
-    await message.reply_text(ladder_text)
+    # One ladder message per chat per day; the others are edited in place.
+    # _config is only locked and rewritten when the ladder state changes.
+    db = await read_all()
+    needs_ladder = False
+    if ladder.needs_refresh(db.get("_config") or {}, when.date(), message.chat_id, ladder_text):
+        async with transaction("_config") as db:
+            cfg = await ensure_config(db)
+            needs_ladder = ladder.refresh(cfg, when.date(), message.chat_id, ladder_text)
+    if needs_ladder:
+        sent = await message.reply_text(ladder_text)
+        async with transaction("_config") as db:
+            cfg = await ensure_config(db)
+            ladder.remember(cfg, when.date(), message.chat_id, sent.message_id)
 
     if got_yellow:
         penalty_line = (
@@ -100,13 +127,7 @@ async def handle_checkin(update: Update, context: CallbackContext) -> None:
     else:
         text = f"📢 {display} در ساعت {time_str} وارد شد ✅"
 
-    for uid in db:
-        if uid == "_config":
-            continue
-        try:
-            await context.bot.send_message(chat_id=int(uid), text=text)
-        except Exception:
-            pass
+    outbox.announce(all_chat_ids(db), text, urgent=got_yellow)
 
 
 async def handle_checkout(update: Update, context: CallbackContext) -> None:
@@ -120,13 +141,35 @@ async def handle_checkout(update: Update, context: CallbackContext) -> None:
     user_id = str(tg_user.id)
     username = tg_user.username or f"user_{user_id}"
 
-    db = await read_all()
-    user = await get_user(db, user_id, username=username)
-    if not user.get("active", False):
+    async with transaction(user_id) as db:
+        user = await get_user(db, user_id, username=username)
+        active = user.get("active", False)
+        ok, response, when = False, "", None
+        if active:
+            ok, response, when = await record_check_out(db, user)
+
+        worked_str = ""
+        overtime_minutes = 0
+        overtime_points = 0
+        overtime_remainder = 0
+        if ok and when is not None:
+            first_in = first_check_in_for_day(user, when.date())
+            if first_in:
+                delta = when - first_in
+                hours, remainder = divmod(delta.seconds, 3600)
+                minutes, _ = divmod(remainder, 60)
+                worked_str = f" و امروز جمعاً {hours} ساعت و {minutes} دقیقه کار کرد"
+
+                overtime_minutes = overtime_after_hours(when)
+                if overtime_minutes > 0:
+                    overtime_points, overtime_remainder = accrue_overtime_points(user, overtime_minutes)
+                    if overtime_points:
+                        invalidate_leaderboard(db)
+
+    if not active:
         await message.reply_text("⛔️ حساب شما توسط مدیریت فعال نشده است.")
         return
 
-    ok, response, when = await record_check_out(db, user)
     if not ok:
         await message.reply_text(response)
         return
@@ -135,25 +178,6 @@ async def handle_checkout(update: Update, context: CallbackContext) -> None:
         await message.reply_text("❗️در ثبت زمان خروج خطایی رخ داد. لطفاً دوباره تلاش کنید.")
         return
 
-    first_in = first_check_in_for_day(user, when.date())
-
-    worked_str = ""
-    overtime_minutes = 0
-    overtime_points = 0
-    overtime_remainder = 0
-    if first_in:
-        delta = when - first_in
-        hours, remainder = divmod(delta.seconds, 3600)
-        minutes, _ = divmod(remainder, 60)
-        worked_str = f" و امروز جمعاً {hours} ساعت و {minutes} دقیقه کار کرد"
-
-        six_pm = when.replace(hour=18, minute=0, second=0, microsecond=0)
-        if when > six_pm:
-            overtime_delta = when - six_pm
-            overtime_minutes = overtime_delta.seconds // 60
-            if overtime_minutes > 0:
-                overtime_points, overtime_remainder = accrue_overtime_points(user, overtime_minutes)
-
     time_str = when.strftime("%H:%M")
     display = user.get("display_name") or username
 
@@ -170,15 +194,33 @@ async def handle_checkout(update: Update, context: CallbackContext) -> None:
 
     text = "\n".join(lines)
 
-    await write_all(db)
+    outbox.announce(all_chat_ids(db), text)
+
+
+_HISTORY_PAGE = 10
+
+_HISTORY_TITLES = {
+    "check_ins": "📋 ورودهای شما:",
+    "check_outs": "🏁 خروج‌های شما:",
+    "yellow_cards": "📒 کارت‌های زرد شما:",
+}
 
-    for uid in db:
-        if uid == "_config":
-            continue
-        try:
-            await context.bot.send_message(chat_id=int(uid), text=text)
-        except Exception:
-            pass
+
+def _history_text(field: str, rows: List[dict], title: str = "") -> str:
+    """A page of history rows (newest first) shown oldest first, as before."""
+    lines = [title or _HISTORY_TITLES[field]]
+    for rec in reversed(rows):
+        lines.append(f"- {describe_card(rec) if field == 'yellow_cards' else rec['datetime']}")
+    return "\n".join(lines)
+
+
+def _history_keyboard(field: str, offset: int, more: bool):
+    buttons = []
+    if more:
+        buttons.append(InlineKeyboardButton("◀️ قدیمی‌تر", callback_data=f"hist:{field}:{offset + _HISTORY_PAGE}"))
+    if offset > 0:
+        buttons.append(InlineKeyboardButton("جدیدتر ▶️", callback_data=f"hist:{field}:{max(0, offset - _HISTORY_PAGE)}"))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
 
 
 async def my_checkins(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -191,16 +233,13 @@ async def my_checkins(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     user_id = str(tg_user.id)
     db = await read_all()
-    user = db.get(user_id)
+    rows, more = await archive.page(user_id, db.get(user_id), "check_ins", 0, _HISTORY_PAGE)
 
-    if not user or not user.get("check_ins"):
+    if not rows:
         await message.reply_text("هیچ ورودی ثبت نشده است.")
         return
 
-    lines = ["📋 ورودهای شما:"]
-    for rec in user.get("check_ins", [])[-10:]:  # show last 10
-        lines.append(f"- {rec['datetime']}")
-    await message.reply_text("\n".join(lines))
+    await message.reply_text(_history_text("check_ins", rows), reply_markup=_history_keyboard("check_ins", 0, more))
 
 
 async def my_checkouts(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -213,16 +252,13 @@ async def my_checkouts(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     user_id = str(tg_user.id)
     db = await read_all()
-    user = db.get(user_id)
+    rows, more = await archive.page(user_id, db.get(user_id), "check_outs", 0, _HISTORY_PAGE)
 
-    if not user or not user.get("check_outs"):
+    if not rows:
         await message.reply_text("هیچ خروجی ثبت نشده است.")
         return
 
-    lines = ["🏁 خروج‌های شما:"]
-    for rec in user.get("check_outs", [])[-10:]:  # show last 10
-        lines.append(f"- {rec['datetime']}")
-    await message.reply_text("\n".join(lines))
+    await message.reply_text(_history_text("check_outs", rows), reply_markup=_history_keyboard("check_outs", 0, more))
 
 
 async def my_yellow_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -237,11 +273,38 @@ async def my_yellow_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
     db = await read_all()
     user = db.get(user_id)
 
-    if not user or not user.get("yellow_cards"):
+    rows, more = await archive.page(user_id, user, "yellow_cards", 0, _HISTORY_PAGE)
+    if not rows:
         await message.reply_text("🎉 شما هیچ کارت زردی ندارید.")
         return
 
-    lines = ["📒 کارت‌های زرد شما:"]
-    for rec in user.get("yellow_cards", [])[-10:]:  # show last 10
-        lines.append(f"- {rec}")
-    await message.reply_text("\n".join(lines))
+    today = now_local().date()
+    month = yellow_cards(user).count_in_month(today.year, today.month) if user else 0
+    title = f"📒 کارت‌های زرد شما (این ماه: {month}):"
+    await message.reply_text(
+        _history_text("yellow_cards", rows, title),
+        reply_markup=_history_keyboard("yellow_cards", 0, more),
+    )
+
+
+async def history_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Inline ◀️/▶️ buttons under a history list; older pages come from the archives."""
+    query = update.callback_query
+    if query is None:
+        return
+    await query.answer()
+
+    try:
+        _, field, offset_s = (query.data or "").split(":", 2)
+        offset = max(0, int(offset_s))
+    except ValueError:
+        return
+    if field not in _HISTORY_TITLES:
+        return
+
+    user_id = str(query.from_user.id)
+    db = await read_all()
+    rows, more = await archive.page(user_id, db.get(user_id), field, offset, _HISTORY_PAGE)
+    if not rows:
+        return
+    await query.edit_message_text(_history_text(field, rows), reply_markup=_history_keyboard(field, offset, more))
@@ -1,7 +1,8 @@
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup
 from telegram.ext import ContextTypes, CallbackQueryHandler
-from ..storage import read_all, write_all, get_user
+from ..storage import read_all, transaction, get_user
 from ..config import MAIN_MENU
+from ..services import delivery, directory
 
 
 
@@ -17,6 +18,36 @@ def start_callback_data(data: str | None) -> str | None:
         return None
     return parts[1]
 
+async def resolve_target(msg, arg: str) -> str | None:
+    """
+    The user id an admin meant by `arg`: an id, @username, a name or part of
+    one. Replies with the candidates and returns None when it is not clear.
+    """
+    if arg.isdigit():
+        return arg
+    db = await read_all()
+    uid = directory.resolve(db, arg)
+    if uid is not None:
+        return uid
+    matches = directory.search(db, arg)
+    if len(matches) == 1:
+        return matches[0]
+    if not matches:
+        await msg.reply_text("❗️ کاربر پیدا نشد.")
+        return None
+    lines = ["❓ چند کاربر پیدا شد؛ شناسه را وارد کنید:"]
+    for uid in matches:
+        user = db[uid]
+        lines.append(f"{uid} → @{user.get('username') or '—'} / {user.get('display_name') or '—'}")
+    await msg.reply_text("\n".join(lines))
+    return None
+
+async def mark_reachable(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Any update from a chat proves it can be messaged again."""
+    chat = update.effective_chat
+    if chat is not None:
+        delivery.revive(chat.id)
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = _msg(update)
     if message is None:
@@ -29,9 +60,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username = tg_user.username
     first_name = getattr(tg_user, "first_name", None)
 
-    db = await read_all()
-    user = await get_user(db, user_id, username=username, first_name=first_name)
-    await write_all(db)
+    async with transaction(user_id) as db:
+        user = await get_user(db, user_id, username=username, first_name=first_name)
 
     if not user.get("active", False):
         keyboard = InlineKeyboardMarkup([
@@ -1,11 +1,25 @@
-from typing import Any, MutableMapping, cast
+from typing import Any, Dict, Iterable, List, MutableMapping, Set, Tuple, cast
 
-from telegram import Update
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes
 
 from ..config import ADMIN_IDS
-from ..storage import read_all, write_all, get_user
-from ..services.credits import POINT_VALUE, get_balance, request_withdrawal, update_balance
+from ..storage import DEFAULT_USER, read_all, transaction, get_user
+from ..utils.time import now_local
+from ..services import outbox
+from .common import resolve_target
+from ..services.credits import (
+    POINT_VALUE,
+    Pending,
+    find_withdrawal,
+    payout_summary,
+    pending_withdrawals,
+    request_withdrawal,
+    settle_withdrawal,
+    track_withdrawal,
+    withdrawal_id,
+)
+from ..services.leaderboard import invalidate as invalidate_leaderboard
 
 
 def _msg(update: Update):
@@ -20,74 +34,57 @@ def _query(update: Update):
     return update.callback_query
 
 
+def _notify_settled(uid: str, w: Dict[str, Any], approved: bool, refunded: int) -> None:
+    if approved:
+        outbox.notify(uid, f"✅ برداشت {w['amount']:,} تومان برای شما تایید شد.")
+        return
+    refund_text = f"❌ برداشت {w['amount']:,} تومان رد شد"
+    if refunded:
+        refund_text += f" و {refunded} امتیاز به حساب شما بازگشت."
+    else:
+        refund_text += "."
+    outbox.notify(uid, refund_text)
+
+
 async def handle_withdraw_action(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle approve/reject button clicks for withdrawals (admin only)."""
+    """Handle approve/reject button clicks for one withdrawal (admin only)."""
     query = _query(update)
     if query is None:
         return
+    if query.from_user is None or query.from_user.id not in ADMIN_IDS:
+        await query.answer("⛔️ دسترسی ندارید.")
+        return
     await query.answer()
 
     parts = (query.data or "").split(":", 2)
-    if len(parts) != 3:
-        return
-    action, uid, index_str = parts
-    try:
-        index = int(index_str)
-    except (TypeError, ValueError):
+    if len(parts) != 3 or parts[1] not in ("approve", "reject"):
         return
+    _, action, wid = parts
+    approved = action == "approve"
 
     db = await read_all()
-    user = await get_user(db, uid)
-    wlist = user.get("withdrawals") or []
-
-    if index < 0 or index >= len(wlist):
+    found = find_withdrawal(db, wid)
+    if found is None:
         await query.edit_message_text("❗️ شماره درخواست نامعتبر است.")
         return
+    uid = found[0]
 
-    w = wlist[index]
+    async with transaction(uid) as db:
+        found = find_withdrawal(db, wid)
+        w = found[1] if found else None
+        valid = w is not None and w.get("status") == "pending"
+        if valid:
+            refunded = settle_withdrawal(db, uid, wid, w, approved)
 
-    if action == "approve":
-        w["status"] = "approved"
-        await write_all(db)
+    if not valid:
+        await query.edit_message_text("❗️ این درخواست قبلاً بررسی شده است.")
+        return
 
-        points_after = int(user.get("points", 0))
+    if approved:
         await query.edit_message_text(f"✅ برداشت {w['amount']:,} تومان تایید شد.")
-        try:
-            await context.bot.send_message(
-                chat_id=int(uid),
-                text=(
-                    f"✅ برداشت {w['amount']:,} تومان برای شما تایید شد.\n"
-                    f"امتیاز فعلی: {points_after} و موجودی: {points_after * POINT_VALUE:,} تومان"
-                ),
-            )
-        except Exception:
-            pass
-
-    elif action == "reject":
-        w["status"] = "rejected"
-        points_used = w.get("points")
-        if points_used is None:
-            points_used = (w.get("amount", 0) or 0) // POINT_VALUE
-        points_used = int(points_used or 0)
-        if points_used > 0:
-            user["points"] = int(user.get("points", 0)) + points_used
-        update_balance(user)
-        await write_all(db)
-
-        await query.edit_message_text(f"❌ برداشت {w['amount']:,} تومان رد شد.")
-        refund_text = f"❌ برداشت {w['amount']:,} تومان رد شد"
-        if points_used:
-            refund_text += f" و {points_used} امتیاز به حساب شما بازگشت."
-        else:
-            refund_text += "."
-        try:
-            await context.bot.send_message(chat_id=int(uid), text=refund_text)
-        except Exception:
-            pass
-
     else:
-        return
-
+        await query.edit_message_text(f"❌ برداشت {w['amount']:,} تومان رد شد.")
+    _notify_settled(uid, w, approved, refunded)
 
 
 async def my_balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -100,10 +97,10 @@ async def my_balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     user_id = str(tg_user.id)
     db = await read_all()
-    user = await get_user(db, user_id, username=tg_user.username, first_name=tg_user.first_name)
+    user = db.get(user_id) or DEFAULT_USER
 
-    balance = get_balance(user)
     points = user.get("points", 0)
+    balance = int(points) * POINT_VALUE
 
     text = (
         f"امتیاز فعلی: {points}\n"
@@ -121,8 +118,6 @@ async def withdraw(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     user_id = str(tg_user.id)
-    db = await read_all()
-    user = await get_user(db, user_id, username=tg_user.username, first_name=tg_user.first_name)
 
     args = context.args or []
     if not args:
@@ -135,13 +130,19 @@ async def withdraw(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await msg.reply_text("❗️ مبلغ باید عدد باشد.")
         return
 
-    try:
-        w = request_withdrawal(user, amount)
-    except ValueError as e:
-        await msg.reply_text(f"❌ {str(e)}")
-        return
+    async with transaction(user_id) as db:
+        user = await get_user(db, user_id, username=tg_user.username, first_name=tg_user.first_name)
+        try:
+            w = request_withdrawal(user, amount)
+        except ValueError as e:
+            w, error = None, str(e)
+        else:
+            invalidate_leaderboard(db)
+            track_withdrawal(db, user_id, w)
 
-    await write_all(db)
+    if w is None:
+        await msg.reply_text(f"❌ {error}")
+        return
 
     await msg.reply_text(
         f"درخواست برداشت {w['amount']:,} تومان ثبت شد (وضعیت: {w['status']})."
@@ -162,9 +163,11 @@ async def list_withdraws(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await msg.reply_text("❗️ استفاده: /list_withdraws <user_id>")
         return
 
-    target_id = args[0]
+    target_id = await resolve_target(msg, args[0])
+    if target_id is None:
+        return
     db = await read_all()
-    user = await get_user(db, target_id)
+    user = db.get(target_id) or DEFAULT_USER
 
     wlist = user.get("withdrawals") or []
     if not wlist:
@@ -174,9 +177,16 @@ async def list_withdraws(update: Update, context: ContextTypes.DEFAULT_TYPE):
     lines = [
         f"درخواست‌های {user.get('display_name') or target_id}:"
     ]
+    buttons = []
     for i, w in enumerate(wlist, start=1):
-        lines.append(f"{i}. {w['datetime']} → {w['amount']:,} تومان (وضعیت: {w['status']})")
-    await msg.reply_text("\n".join(lines))
+        wid = withdrawal_id(target_id, i - 1, w)
+        lines.append(f"{i}. [{wid}] {w['datetime']} → {w['amount']:,} تومان (وضعیت: {w['status']})")
+        if w.get("status") == "pending":
+            buttons.append([
+                InlineKeyboardButton(f"✅ {i}", callback_data=f"withdraw_action:approve:{wid}"),
+                InlineKeyboardButton(f"❌ {i}", callback_data=f"withdraw_action:reject:{wid}"),
+            ])
+    await msg.reply_text("\n".join(lines), reply_markup=InlineKeyboardMarkup(buttons) if buttons else None)
 
 
 async def approve_withdraw(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -193,32 +203,33 @@ async def approve_withdraw(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await msg.reply_text("❗️ استفاده: /approve_withdraw <user_id> <index>")
         return
 
-    target_id = args[0]
+    target_id = await resolve_target(msg, args[0])
+    if target_id is None:
+        return
     try:
         index = int(args[1]) - 1
     except ValueError:
         await msg.reply_text("❗️ شماره درخواست نامعتبر است.")
         return
 
-    db = await read_all()
-    user = await get_user(db, target_id)
-    wlist = user.get("withdrawals") or []
+    async with transaction(target_id) as db:
+        user = db.get(target_id)
+        wlist = (user or {}).get("withdrawals") or []
+        valid = 0 <= index < len(wlist) and wlist[index].get("status") == "pending"
+        if valid:
+            w = wlist[index]
+            settle_withdrawal(db, target_id, withdrawal_id(target_id, index, w), w, True)
 
-    if index < 0 or index >= len(wlist):
-        await msg.reply_text("❗️ شماره درخواست نامعتبر است.")
+    if not user:
+        await msg.reply_text("❗️ کاربر پیدا نشد.")
         return
 
-    wlist[index]["status"] = "approved"
-    await write_all(db)
+    if not valid:
+        await msg.reply_text("❗️ شماره درخواست نامعتبر است.")
+        return
 
     await msg.reply_text("✅ برداشت تایید شد.")
-    try:
-        await context.bot.send_message(
-            chat_id=int(target_id),
-            text=f"✅ برداشت {wlist[index]['amount']:,} تومان برای شما تایید شد."
-        )
-    except Exception:
-        pass
+    _notify_settled(target_id, w, True, 0)
 
 
 async def reject_withdraw(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -235,45 +246,49 @@ async def reject_withdraw(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await msg.reply_text("❗️ استفاده: /reject_withdraw <user_id> <index>")
         return
 
-    target_id = args[0]
+    target_id = await resolve_target(msg, args[0])
+    if target_id is None:
+        return
     try:
         index = int(args[1]) - 1
     except ValueError:
         await msg.reply_text("❗️ شماره درخواست نامعتبر است.")
         return
 
-    db = await read_all()
-    user = await get_user(db, target_id)
-    wlist = user.get("withdrawals") or []
+    async with transaction(target_id) as db:
+        user = db.get(target_id)
+        wlist = (user or {}).get("withdrawals") or []
+        valid = 0 <= index < len(wlist) and wlist[index].get("status") == "pending"
+        if valid:
+            w = wlist[index]
+            refunded = settle_withdrawal(db, target_id, withdrawal_id(target_id, index, w), w, False)
 
-    if index < 0 or index >= len(wlist):
+    if not user:
+        await msg.reply_text("❗️ کاربر پیدا نشد.")
+        return
+
+    if not valid:
         await msg.reply_text("❗️ شماره درخواست نامعتبر است.")
         return
 
-    withdrawal = wlist[index]
-    amount = withdrawal.get("amount", 0)
-    withdrawal["status"] = "rejected"
+    await msg.reply_text("❌ برداشت رد شد و مبلغ به اعتبار بازگشت.")
+    _notify_settled(target_id, w, False, refunded)
 
-    points_used = withdrawal.get("points")
-    if points_used is None:
-        points_used = (amount or 0) // POINT_VALUE
-    points_used = int(points_used or 0)
-    if points_used > 0:
-        user["points"] = int(user.get("points", 0)) + points_used
-    update_balance(user)
-    await write_all(db)
 
-    await msg.reply_text("❌ برداشت رد شد و مبلغ به اعتبار بازگشت.")
-    try:
-        refund_text = f"❌ برداشت {amount:,} تومان رد شد"
-        if points_used:
-            refund_text += f" و {points_used} امتیاز به حساب شما بازگشت."
-        else:
-            refund_text += "."
-        await context.bot.send_message(chat_id=int(target_id), text=refund_text)
-    except Exception:
-        pass
+_SELECTION = "withdraw_selection"
+_KEYBOARD_LIMIT = 30
+
 
+def _pending_keyboard(rows: List[Pending], selected: Set[str]) -> InlineKeyboardMarkup:
+    buttons = []
+    for wid, _, w in rows[:_KEYBOARD_LIMIT]:
+        mark = "☑️" if wid in selected else "⬜️"
+        buttons.append([InlineKeyboardButton(f"{mark} {wid} – {w['amount']:,}", callback_data=f"wsel:{wid}")])
+    buttons.append([
+        InlineKeyboardButton("✅ تایید انتخاب‌شده‌ها", callback_data="wbatch:approve"),
+        InlineKeyboardButton("❌ رد انتخاب‌شده‌ها", callback_data="wbatch:reject"),
+    ])
+    return InlineKeyboardMarkup(buttons)
 
 
 async def pending_withdraws(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -286,23 +301,120 @@ async def pending_withdraws(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     db = await read_all()
+    rows = pending_withdrawals(db)
+    if not rows:
+        await msg.reply_text("✅ هیچ درخواست برداشتی در انتظار تایید نیست.")
+        return
+
     lines = ["درخواست‌های برداشت در انتظار تایید:"]
+    for wid, uid, w in rows:
+        user = db[uid]
+        name = user.get("display_name") or user.get("username") or uid
+        lines.append(f"{name} ({uid}) → [{wid}] {w['amount']:,} تومان در {w['datetime']}")
+    lines.append("\nبرای تایید همه: /approve_all")
 
-    found = False
-    for uid, user in db.items():
-        if uid == "_config":
+    user_data = cast(MutableMapping[str, Any], context.user_data)
+    user_data[_SELECTION] = set()
+    await msg.reply_text("\n".join(lines), reply_markup=_pending_keyboard(rows, set()))
+
+
+def _settle_batch(db: Dict[str, Any], wids: Iterable[str], approve: bool) -> Tuple[List[Pending], Dict[str, int]]:
+    """Settle the given pending withdrawals inside the caller's transaction."""
+    settled: List[Pending] = []
+    refunds: Dict[str, int] = {}
+    for wid in wids:
+        found = find_withdrawal(db, wid)
+        if found is None or found[1].get("status") != "pending":
             continue
-        for i, w in enumerate(user.get("withdrawals", []), start=1):
-            if w["status"] == "pending":
-                found = True
-                name = user.get("display_name") or user.get("username") or uid
-                lines.append(f"{name} ({uid}) → {i}. {w['amount']:,} تومان در {w['datetime']}")
+        uid, w = found
+        refunds[wid] = settle_withdrawal(db, uid, wid, w, approve)
+        settled.append((wid, uid, w))
+    return settled, refunds
+
+
+async def _report_batch(
+    msg, db: Dict[str, Any], settled: List[Pending], refunds: Dict[str, int], approve: bool
+) -> None:
+    for wid, uid, w in settled:
+        _notify_settled(uid, w, approve, refunds.get(wid, 0))
+    total = sum(int(w.get("amount", 0) or 0) for _, _, w in settled)
+    verb = "تایید" if approve else "رد"
+    await msg.reply_text(f"{len(settled)} درخواست ({total:,} تومان) {verb} شد ✅")
+    if approve:
+        await msg.reply_document(
+            document=payout_summary(db, settled),
+            filename=f"payout-{now_local().strftime('%Y-%m-%d-%H%M')}.csv",
+            caption="🧾 خلاصه پرداخت",
+        )
 
-    if not found:
+
+async def approve_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin: approve every pending withdrawal in one transaction."""
+    msg = _msg(update)
+    if msg is None:
+        return
+    tg_user = _user(update)
+    if tg_user is None or tg_user.id not in ADMIN_IDS:
+        await msg.reply_text("⛔️ دسترسی ندارید.")
+        return
+
+    db = await read_all()
+    rows = pending_withdrawals(db)
+    if not rows:
         await msg.reply_text("✅ هیچ درخواست برداشتی در انتظار تایید نیست.")
         return
 
-    await msg.reply_text("\n".join(lines))
+    async with transaction(*{uid for _, uid, _ in rows}) as db:
+        settled, refunds = _settle_batch(db, [wid for wid, _, _ in rows], True)
+    await _report_batch(msg, db, settled, refunds, True)
+
+
+async def handle_withdraw_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Multi-select keyboard of /pending_withdraws: toggle items, then settle them together."""
+    query = _query(update)
+    if query is None:
+        return
+    if query.from_user is None or query.from_user.id not in ADMIN_IDS:
+        await query.answer("⛔️ دسترسی ندارید.")
+        return
+
+    user_data = cast(MutableMapping[str, Any], context.user_data)
+    selected: Set[str] = user_data.setdefault(_SELECTION, set())
+    kind, _, arg = (query.data or "").partition(":")
+    # A callback query is answered exactly once, with the warning if there is one.
+    if kind == "wbatch" and not selected:
+        await query.answer("هیچ درخواستی انتخاب نشده است.")
+        return
+    await query.answer()
+    db = await read_all()
+
+    if kind == "wsel":
+        if arg in selected:
+            selected.discard(arg)
+        else:
+            selected.add(arg)
+        rows = pending_withdrawals(db)
+        await query.edit_message_reply_markup(reply_markup=_pending_keyboard(rows, selected))
+        return
+
+    if kind != "wbatch" or arg not in ("approve", "reject"):
+        return
+    approve = arg == "approve"
+    found = [find_withdrawal(db, wid) for wid in selected]
+    uids = {f[0] for f in found if f is not None}
+    if not uids:
+        # Without keys the transaction would lock and rewrite the whole document.
+        selected.clear()
+        await query.edit_message_reply_markup(reply_markup=None)
+        if query.message is not None:
+            await query.message.reply_text("❗️ این درخواست‌ها قبلاً بررسی شده‌اند.")
+        return
+    async with transaction(*uids) as db:
+        settled, refunds = _settle_batch(db, list(selected), approve)
+    selected.clear()
+    await query.edit_message_reply_markup(reply_markup=None)
+    if query.message is not None:
+        await _report_batch(query.message, db, settled, refunds, approve)
 
 
 async def my_balance_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -337,8 +449,6 @@ async def handle_withdraw_amount(update: Update, context: ContextTypes.DEFAULT_T
         return
 
     user_id = str(tg_user.id)
-    db = await read_all()
-    user = await get_user(db, user_id, username=tg_user.username, first_name=tg_user.first_name)
 
     try:
         amount = int((msg.text or "").strip())
@@ -346,13 +456,20 @@ async def handle_withdraw_amount(update: Update, context: ContextTypes.DEFAULT_T
         await msg.reply_text("❗️ لطفاً یک عدد معتبر وارد کنید.")
         return
 
-    try:
-        w = request_withdrawal(user, amount)
-    except ValueError as e:
-        await msg.reply_text(f"❌ {str(e)}")
+    async with transaction(user_id) as db:
+        user = await get_user(db, user_id, username=tg_user.username, first_name=tg_user.first_name)
+        try:
+            w = request_withdrawal(user, amount)
+        except ValueError as e:
+            w, error = None, str(e)
+        else:
+            invalidate_leaderboard(db)
+            track_withdrawal(db, user_id, w)
+
+    if w is None:
+        await msg.reply_text(f"❌ {error}")
         return
 
-    await write_all(db)
     user_data["awaiting_withdraw"] = False
 
     await msg.reply_text(
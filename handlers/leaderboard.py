@@ -1,7 +1,10 @@
-from telegram import Update
+from typing import Any, Dict
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes
 
 from ..storage import read_all
+from ..services.leaderboard import Ranking, ranking
 
 
 def _msg(update: Update):
@@ -12,6 +15,8 @@ def _user(update: Update):
     return update.effective_user
 
 
+def _query(update: Update):
+    return update.callback_query
 
 
 def _format_price(points: int) -> str:
@@ -19,6 +24,33 @@ def _format_price(points: int) -> str:
     price_str = f"{value:.2f}".rstrip('0').rstrip('.')
     return price_str
 
+
+def _page_text(board: Ranking, page: int, db: Dict[str, Any], user_id: str) -> str:
+    """The caller's own score and rank, then one page of the ranking."""
+    user = db.get(user_id)
+    my_points = int(user.get("points", 0)) if user else 0
+    lines = [f"امتیاز شما {my_points} امتیاز است ({_format_price(my_points)} $)"]
+    my_rank = board.rank(user_id)
+    if my_rank is not None:
+        lines.append(f"رتبه شما: {my_rank} از {len(board.entries)}")
+    title = "لیگ امتیازات تیمی (بر اساس امتیاز)"
+    if board.pages() > 1:
+        title += f" — صفحه {page + 1}/{board.pages()}"
+    lines += ["", title]
+    for rank, pts, name, _ in board.page(page):
+        lines.append(f"{rank}. {name} – {pts} امتیاز ({_format_price(pts)} $)")
+    return "\n".join(lines)
+
+
+def _page_keyboard(board: Ranking, page: int):
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️ قبلی", callback_data=f"lb:{page - 1}"))
+    if page + 1 < board.pages():
+        buttons.append(InlineKeyboardButton("بعدی ▶️", callback_data=f"lb:{page + 1}"))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+
 async def my_scores(update: Update, context: ContextTypes.DEFAULT_TYPE):
     msg = _msg(update)
     if msg is None:
@@ -29,25 +61,25 @@ async def my_scores(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     user_id = str(tg_user.id)
     db = await read_all()
-    user = db.get(user_id)
+    board = ranking(db)
 
-    my_points = int(user.get("points", 0)) if user else 0
-    my_price = _format_price(my_points)
-    lines = [f"امتیاز شما {my_points} امتیاز است ({my_price} $)", ""]
+    await msg.reply_text(_page_text(board, 0, db, user_id), reply_markup=_page_keyboard(board, 0))
 
-    scores = []
-    for uid, u in db.items():
-        if uid == "_config":
-            continue
-        pts = int(u.get("points", 0))
-        name = u.get("display_name") or u.get("username") or uid
-        scores.append((pts, name))
 
-    scores.sort(key=lambda x: x[0], reverse=True)
+async def leaderboard_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Inline ◀️/▶️ buttons: show another page of the ranking."""
+    query = _query(update)
+    if query is None:
+        return
+    await query.answer()
 
-    lines.append("لیگ امتیازات تیمی (بر اساس امتیاز)")
-    for rank, (pts, name) in enumerate(scores, start=1):
-        price = _format_price(pts)
-        lines.append(f"{rank}. {name} – {pts} امتیاز ({price} $)")
+    try:
+        page = int((query.data or "").split(":", 1)[1])
+    except (IndexError, ValueError):
+        return
 
-    await msg.reply_text("\n".join(lines))
+    db = await read_all()
+    board = ranking(db)
+    page = min(max(page, 0), board.pages() - 1)
+    user_id = str(query.from_user.id) if query.from_user else ""
+    await query.edit_message_text(_page_text(board, page, db, user_id), reply_markup=_page_keyboard(board, page))
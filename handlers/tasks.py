@@ -1,7 +1,8 @@
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes, CallbackQueryHandler
 
-from ..storage import read_all, write_all, get_user
+from ..storage import DEFAULT_USER, read_all, transaction, get_user
+from ..utils.time import now_local
 
 
 def _msg(update: Update):
@@ -26,7 +27,7 @@ async def show_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     user_id = str(tg_user.id)
     db = await read_all()
-    user = await get_user(db, user_id, username=tg_user.username, first_name=tg_user.first_name)
+    user = db.get(user_id) or DEFAULT_USER
 
     tasks = user.get("tasks") or []
     if not tasks:
@@ -50,8 +51,6 @@ async def task_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     user_id = str(query.from_user.id)
-    db = await read_all()
-    user = await get_user(db, user_id)
 
     data = query.data or ""
     parts = data.split(":", 1)
@@ -59,14 +58,18 @@ async def task_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     task_id = parts[1]
 
-    tasks = user.get("tasks") or []
-    done_list = user.setdefault("tasks_done", [])
+    async with transaction(user_id) as db:
+        user = await get_user(db, user_id)
+        tasks = user.get("tasks") or []
+        done_list = user.setdefault("tasks_done", [])
+
+        task = next((t for t in tasks if t["id"] == task_id), None)
+        if task:
+            tasks.remove(task)
+            task["done_at"] = now_local().strftime("%Y-%m-%d %H:%M")
+            done_list.append(task)
 
-    task = next((t for t in tasks if t["id"] == task_id), None)
     if task:
-        tasks.remove(task)
-        done_list.append(task)
-        await write_all(db)
         await query.edit_message_text(f"✅ مأموریت انجام شد: {task['text']}")
     else:
         await query.edit_message_text("❗️ مأموریت یافت نشد یا قبلاً انجام شده است.")
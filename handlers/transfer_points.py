@@ -9,8 +9,12 @@ from telegram.ext import (
 )
 
 from ..config import BTN_TRANSFER
+from ..services import outbox
+from ..services import ledger
 from ..services.credits import update_balance
-from ..storage import read_all, write_all, get_user
+from ..services.directory import directory, search
+from ..services.leaderboard import invalidate as invalidate_leaderboard
+from ..storage import DEFAULT_USER, read_all, transaction, get_user, CROSS_USER
 
 SELECT_RECIPIENT, SELECT_AMOUNT, CONFIRM_TRANSFER = range(3)
 
@@ -51,22 +55,20 @@ async def input_recipient(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         username_input = username_input[1:]
 
     db = await read_all()
-    target_id = None
-    target_user_data = None
-    for uid, user_data in db.items():
-        if uid == "_config":
-            continue
-        current_username = (user_data.get("username") or "").lower()
-        if current_username and current_username == username_input.lower():
-            target_id = uid
-            target_user_data = user_data
-            break
+    matches = directory(db).lookup(username_input)
+    target_id = next(iter(matches)) if len(matches) == 1 else None
 
     if not target_id:
-        await message.reply_text(
-            "❌ کاربری با این نام پیدا نشد. نام دیگری وارد کنید یا /cancel را بفرستید."
-        )
+        suggestions = [
+            db[uid].get("username") or db[uid].get("display_name")
+            for uid in search(db, username_input)
+        ]
+        text = "❌ کاربری با این نام پیدا نشد. نام دیگری وارد کنید یا /cancel را بفرستید."
+        if suggestions:
+            text += "\nشاید منظورتان یکی از این‌ها باشد: " + "، ".join(s for s in suggestions if s)
+        await message.reply_text(text)
         return SELECT_RECIPIENT
+    target_user_data = db[target_id]
 
     tg_user = _user(update)
     if tg_user and str(tg_user.id) == str(target_id):
@@ -105,7 +107,7 @@ async def input_amount(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
 
     db = await read_all()
     source_id = str(tg_user.id)
-    source_user = await get_user(db, source_id, username=tg_user.username, first_name=tg_user.first_name)
+    source_user = db.get(source_id) or DEFAULT_USER
 
     source_points = int(source_user.get("points", 0))
     if amount > source_points:
@@ -144,31 +146,27 @@ async def confirm_transfer(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             await query.edit_message_text("❌ اطلاعات انتقال یافت نشد.")
             return ConversationHandler.END
 
-        db = await read_all()
-        source_user = await get_user(db, source_id)
-        target_user = await get_user(db, target_id)
+        async with transaction(source_id, target_id, lock=(CROSS_USER,)) as db:
+            source_user = await get_user(db, source_id)
+            target_user = await get_user(db, target_id)
 
-        if amount > int(source_user.get("points", 0)):
+            enough = amount <= int(source_user.get("points", 0))
+            if enough:
+                ledger.post(source_user, -amount, ledger.TRANSFER_OUT, ref=target_id)
+                ledger.post(target_user, amount, ledger.TRANSFER_IN, ref=source_id)
+                update_balance(source_user)
+                update_balance(target_user)
+                invalidate_leaderboard(db)
+
+        if not enough:
             await query.edit_message_text("❌ انتقال انجام نشد؛ امتیاز کافی ندارید.")
             return ConversationHandler.END
 
-        source_user["points"] = int(source_user.get("points", 0)) - amount
-        target_user["points"] = int(target_user.get("points", 0)) + amount
-        update_balance(source_user)
-        update_balance(target_user)
-        await write_all(db)
-
         target_username = context.user_data.get("transfer_target_username", target_id)
         await query.edit_message_text(f"✅ {amount} امتیاز به {target_username} انتقال داده شد.")
 
-        try:
-            sender_name = query.from_user.username or query.from_user.first_name or "یک کاربر"
-            await context.bot.send_message(
-                chat_id=int(target_id),
-                text=f"🎉 {amount} امتیاز از {sender_name} دریافت کردید."
-            )
-        except Exception:
-            pass
+        sender_name = query.from_user.username or query.from_user.first_name or "یک کاربر"
+        outbox.notify(target_id, f"🎉 {amount} امتیاز از {sender_name} دریافت کردید.")
     else:
         await query.edit_message_text("انتقال لغو شد.")
 
@@ -1,28 +1,31 @@
 import os
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler,
-    CallbackQueryHandler, ContextTypes, filters
+    CallbackQueryHandler, ContextTypes, TypeHandler, filters
 )
+from telegram import Update
 
 # Common
-from .handlers.common import start, check_status
+from .handlers.common import start, check_status, mark_reachable
 
 # Admin commands
 from .handlers.admin import (
     unlimit_today, notify_all, give_yellow,
     assign_task, list_users, remove_yellow, set_name,
-    activate_user, deactivate_user, list_inactive, remove_user
+    activate_user, deactivate_user, list_inactive, remove_user,
+    lock_stats, outbox_stats, undeliverable_chats, points_ledger,
+    archive_now, export_timesheet, attendance_stats, simulate_rewards,
 
 )
 
 # Attendance
 from .handlers.attendance import (
     handle_checkin, handle_checkout,
-    my_checkins, my_checkouts, my_yellow_cards
+    my_checkins, my_checkouts, my_yellow_cards, history_page,
 )
 
 # Leaderboard
-from .handlers.leaderboard import my_scores
+from .handlers.leaderboard import my_scores, leaderboard_page
 
 # Tasks
 from .handlers.tasks import show_tasks, task_done
@@ -32,17 +35,50 @@ from .handlers.credits import (
     my_balance, withdraw, my_balance_button,
     withdraw_button, handle_withdraw_amount,
     list_withdraws, reject_withdraw,
-    approve_withdraw, pending_withdraws,handle_withdraw_action
+    approve_withdraw, pending_withdraws,handle_withdraw_action,
+    approve_all, handle_withdraw_selection,
 )
 from .handlers.transfer_points import transfer_points_conv_handler
+from . import storage
+from .services import archive, outbox, yellow_cards
 from .config import (
     BTN_CHECKIN, BTN_CHECKOUT,
     BTN_MY_INS, BTN_MY_OUTS,
     BTN_YELLOWS, BTN_MY_TASKS,
     BTN_SCORES, BTN_BALANCE, BTN_WITHDRAW, BTN_TRANSFER,
 )
+async def _post_init(app) -> None:
+    # Load the resident DB once and fold whatever the journal accumulated
+    # since the last run into the snapshot.
+    db = await storage.read_all()
+    # Yellow cards still in the old text format were converted on load.
+    migrated = yellow_cards.migrated_users(db)
+    if migrated:
+        await storage.write_all(db, migrated)
+    await storage.compact()
+    # Deliver whatever was still queued when the last run stopped.
+    outbox.start(app.bot)
+    # Move closed months out of the hot store now and every few hours.
+    archive.start()
+
+
+async def _post_shutdown(app) -> None:
+    await archive.stop()
+    await outbox.stop()
+    await storage.flush()
+
+
 def build_app(token: str):
-    app = ApplicationBuilder().token(token).build()
+    app = (
+        ApplicationBuilder()
+        .token(token)
+        .post_init(_post_init)
+        .post_shutdown(_post_shutdown)
+        .build()
+    )
+
+    # Runs before every other handler: a chat that writes to us is reachable.
+    app.add_handler(TypeHandler(Update, mark_reachable), group=-1)
 
     # Commands
     app.add_handler(CommandHandler("start", start))
@@ -54,6 +90,7 @@ def build_app(token: str):
     app.add_handler(MessageHandler(filters.TEXT & filters.Regex(f"^{BTN_MY_INS}$"), my_checkins))
     app.add_handler(MessageHandler(filters.TEXT & filters.Regex(f"^{BTN_MY_OUTS}$"), my_checkouts))
     app.add_handler(MessageHandler(filters.TEXT & filters.Regex(f"^{BTN_YELLOWS}$"), my_yellow_cards))
+    app.add_handler(CallbackQueryHandler(history_page, pattern=r"^hist:"))
     app.add_handler(CommandHandler("notify", notify_all))
     app.add_handler(CommandHandler("yellow", give_yellow))
     app.add_handler(CommandHandler("task", assign_task))
@@ -61,6 +98,7 @@ def build_app(token: str):
     app.add_handler(CallbackQueryHandler(task_done, pattern=r"^done:"))
     app.add_handler(CommandHandler("list_users", list_users))
     app.add_handler(MessageHandler(filters.TEXT & filters.Regex(f"^{BTN_SCORES}$"), my_scores))
+    app.add_handler(CallbackQueryHandler(leaderboard_page, pattern=r"^lb:"))
     app.add_handler(CommandHandler("remove_yellow", remove_yellow))
     app.add_handler(CommandHandler("setname", set_name))
     app.add_handler(CommandHandler("remove_user", remove_user))
@@ -70,15 +108,25 @@ def build_app(token: str):
     app.add_handler(CommandHandler("reject_withdraw", reject_withdraw))
     app.add_handler(CommandHandler("approve_withdraw", approve_withdraw))
     app.add_handler(CommandHandler("pending_withdraws", pending_withdraws))
+    app.add_handler(CommandHandler("approve_all", approve_all))
     app.add_handler(MessageHandler(filters.TEXT & filters.Regex(f"^{BTN_BALANCE}$"), my_balance_button))
     app.add_handler(MessageHandler(filters.TEXT & filters.Regex(f"^{BTN_WITHDRAW}$"), withdraw_button))
 # catch numbers typed after withdraw button
     app.add_handler(transfer_points_conv_handler)
     app.add_handler(MessageHandler(filters.TEXT & filters.Regex(r"^\d+$"), handle_withdraw_amount))
     app.add_handler(CallbackQueryHandler(handle_withdraw_action, pattern=r"^withdraw_action:"))
+    app.add_handler(CallbackQueryHandler(handle_withdraw_selection, pattern=r"^(wsel|wbatch):"))
     app.add_handler(CommandHandler("activate", activate_user))
     app.add_handler(CommandHandler("deactivate", deactivate_user))
     app.add_handler(CommandHandler("list_inactive", list_inactive))
+    app.add_handler(CommandHandler("locks", lock_stats))
+    app.add_handler(CommandHandler("outbox", outbox_stats))
+    app.add_handler(CommandHandler("undeliverable", undeliverable_chats))
+    app.add_handler(CommandHandler("ledger", points_ledger))
+    app.add_handler(CommandHandler("archive", archive_now))
+    app.add_handler(CommandHandler("export", export_timesheet))
+    app.add_handler(CommandHandler("stats", attendance_stats))
+    app.add_handler(CommandHandler("simulate", simulate_rewards))
     app.add_handler(CallbackQueryHandler(check_status, pattern=r"^check_status:"))
 
     return app
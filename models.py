@@ -0,0 +1,358 @@
+"""
+In-memory record types. They are built from the JSON document when it is
+loaded and turned back into plain JSON only when it is written, so the hot
+paths never re-parse "YYYY-MM-DD HH:MM" strings.
+"""
+import re
+from array import array
+from bisect import bisect_left, insort
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from uuid import uuid4
+
+from .utils.time import db_dt_fields, localize
+
+ATTENDANCE_KEYS = ("check_ins", "check_outs")
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+MINUTES_PER_DAY = 24 * 60
+
+
+def day_number(day: date) -> int:
+    return day.toordinal() - _EPOCH_ORDINAL
+
+
+def day_start(day: date) -> int:
+    """Epoch-minute of local midnight starting `day`."""
+    return day_number(day) * MINUTES_PER_DAY
+
+
+def parse_minutes(s: str) -> int:
+    """'YYYY-MM-DD HH:MM' (local wall clock) → epoch-minutes."""
+    fields = db_dt_fields(s)
+    if fields is None:
+        return datetime_to_minutes(datetime.strptime(s, "%Y-%m-%d %H:%M"))
+    year, month, day, hour, minute = fields
+    if hour > 23 or minute > 59:
+        raise ValueError(f"bad timestamp: {s!r}")
+    return day_start(date(year, month, day)) + hour * 60 + minute
+
+
+def format_minutes(m: int) -> str:
+    day = date.fromordinal(_EPOCH_ORDINAL + m // MINUTES_PER_DAY)
+    hour, minute = divmod(m % MINUTES_PER_DAY, 60)
+    return f"{day.isoformat()} {hour:02d}:{minute:02d}"
+
+
+def minutes_to_datetime(m: int) -> datetime:
+    return localize(_EPOCH + timedelta(minutes=m))
+
+
+def datetime_to_minutes(dt: datetime) -> int:
+    return day_start(dt.date()) + dt.hour * 60 + dt.minute
+
+
+class AttendanceLog:
+    """
+    A user's check-ins (or check-outs) as sorted epoch-minutes in an
+    array('I'). Behaves like the JSON list of {"datetime": ...} records
+    for iteration, indexing, slicing and append, so display code is unchanged.
+    Records that do not parse are kept verbatim and written back as-is.
+    A day index (day number → first/last minute) answers the per-day
+    questions in O(1) whatever the length of the history.
+    """
+
+    __slots__ = ("_minutes", "_raw", "_days")
+
+    def __init__(self, minutes: Iterable[int] = ()):
+        self._minutes = array("I", sorted(minutes))
+        self._raw: List[Any] = []
+        self._days: Dict[int, Tuple[int, int]] = {}
+        self._reindex()
+
+    def _reindex(self) -> None:
+        days: Dict[int, Tuple[int, int]] = {}
+        for m in self._minutes:
+            d = m // MINUTES_PER_DAY
+            span = days.get(d)
+            days[d] = (m, m) if span is None else (span[0], m)
+        self._days = days
+
+    @classmethod
+    def from_json(cls, records: Iterable[Any]) -> "AttendanceLog":
+        log = cls()
+        minutes = []
+        for rec in records:
+            try:
+                minutes.append(parse_minutes(rec["datetime"]))
+            except (TypeError, KeyError, ValueError):
+                log._raw.append(rec)
+        minutes.sort()
+        log._minutes = array("I", minutes)
+        log._reindex()
+        return log
+
+    def to_json(self) -> List[Any]:
+        return [{"datetime": format_minutes(m)} for m in self._minutes] + list(self._raw)
+
+    def __len__(self) -> int:
+        return len(self._minutes)
+
+    def __bool__(self) -> bool:
+        return bool(self._minutes)
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        for m in self._minutes:
+            yield {"datetime": format_minutes(m)}
+
+    def __getitem__(self, idx: Union[int, slice]) -> Any:
+        if isinstance(idx, slice):
+            return [{"datetime": format_minutes(m)} for m in self._minutes[idx]]
+        return {"datetime": format_minutes(self._minutes[idx])}
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> "AttendanceLog":
+        log = AttendanceLog()
+        log._minutes = array("I", self._minutes)
+        log._raw = list(self._raw)
+        log._days = dict(self._days)
+        return log
+
+    def append(self, rec: Dict[str, Any]) -> None:
+        self.add_minutes(parse_minutes(rec["datetime"]))
+
+    def add(self, when: datetime) -> None:
+        self.add_minutes(datetime_to_minutes(when))
+
+    def add_minutes(self, m: int) -> None:
+        if not self._minutes or m >= self._minutes[-1]:
+            self._minutes.append(m)
+        else:
+            insort(self._minutes, m)
+        d = m // MINUTES_PER_DAY
+        span = self._days.get(d)
+        self._days[d] = (m, m) if span is None else (min(span[0], m), max(span[1], m))
+
+    def drop_before(self, cutoff: int) -> List[int]:
+        """Remove and return the minutes before `cutoff` (archival)."""
+        cut = bisect_left(self._minutes, cutoff)
+        dropped = self._minutes[:cut].tolist()
+        if cut:
+            del self._minutes[:cut]
+            self._reindex()
+        return dropped
+
+    def minutes(self) -> array:
+        return self._minutes
+
+    def minutes_on(self, day: date) -> array:
+        start = day_start(day)
+        lo = bisect_left(self._minutes, start)
+        hi = bisect_left(self._minutes, start + MINUTES_PER_DAY, lo)
+        return self._minutes[lo:hi]
+
+    def datetimes_on(self, day: date) -> Iterator[datetime]:
+        for m in self.minutes_on(day):
+            yield minutes_to_datetime(m)
+
+    def first_minute_on(self, day: date) -> Optional[int]:
+        span = self._days.get(day_number(day))
+        return span[0] if span else None
+
+    def has_day(self, day: date) -> bool:
+        return day_number(day) in self._days
+
+    def first_on(self, day: date) -> Optional[datetime]:
+        span = self._days.get(day_number(day))
+        return minutes_to_datetime(span[0]) if span else None
+
+    def last_on(self, day: date) -> Optional[datetime]:
+        span = self._days.get(day_number(day))
+        return minutes_to_datetime(span[1]) if span else None
+
+
+_LATE_CARD = re.compile(r"^تاخیر در ورود در (\d{4}-\d{2}-\d{2} \d{2}:\d{2})$")
+_ADMIN_CARD = re.compile(r"^کارت زرد \(اداری\) در (\d{4}-\d{2}-\d{2} \d{2}:\d{2}): ?(.*)$", re.S)
+_ANY_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def parse_legacy_card(text: str) -> Dict[str, Any]:
+    """
+    A card stored as the old Persian sentence → a structured record.
+    The penalty of old late cards was not recorded, so it stays None.
+    """
+    m = _LATE_CARD.match(text)
+    if m:
+        return {"datetime": m.group(1), "kind": "late", "reason": "", "penalty": None}
+    m = _ADMIN_CARD.match(text)
+    if m:
+        return {"datetime": m.group(1), "kind": "admin", "reason": m.group(2), "penalty": 0}
+    m = _ANY_DATE.search(text)
+    return {"datetime": f"{m.group(0)} 00:00" if m else "", "kind": "other", "reason": text, "penalty": None}
+
+
+class YellowCardLog:
+    """
+    A user's yellow cards as records {"id", "datetime", "kind", "reason",
+    "penalty"}, indexed by day and counted per month. Cards stored as the
+    old free-text sentences are converted on load (`migrated` is then set
+    so the caller can write them back).
+    """
+
+    __slots__ = ("_cards", "_by_id", "_days", "_months", "migrated")
+
+    def __init__(self) -> None:
+        self._cards: List[Dict[str, Any]] = []
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._days: Dict[str, int] = {}
+        self._months: Dict[str, int] = {}
+        self.migrated = False
+
+    @classmethod
+    def from_json(cls, records: Iterable[Any]) -> "YellowCardLog":
+        log = cls()
+        for rec in records:
+            if isinstance(rec, str):
+                rec = parse_legacy_card(rec)
+                log.migrated = True
+            elif not isinstance(rec, dict):
+                continue
+            if not rec.get("id"):
+                rec["id"] = uuid4().hex[:8]
+                log.migrated = True
+            log._index(rec)
+        return log
+
+    def to_json(self) -> List[Dict[str, Any]]:
+        return [dict(c) for c in self._cards]
+
+    def _index(self, card: Dict[str, Any]) -> None:
+        self._cards.append(card)
+        self._by_id[card["id"]] = card
+        day = card.get("datetime", "")[:10]
+        if day:
+            self._days[day] = self._days.get(day, 0) + 1
+            self._months[day[:7]] = self._months.get(day[:7], 0) + 1
+
+    def __len__(self) -> int:
+        return len(self._cards)
+
+    def __bool__(self) -> bool:
+        return bool(self._cards)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self._cards)
+
+    def __getitem__(self, idx: Union[int, slice]) -> Any:
+        return self._cards[idx]
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> "YellowCardLog":
+        return YellowCardLog.from_json(self.to_json())
+
+    def add(self, when: datetime, kind: str, reason: str = "", penalty: Optional[int] = 0) -> Dict[str, Any]:
+        card = {
+            "id": uuid4().hex[:8],
+            "datetime": when.strftime("%Y-%m-%d %H:%M"),
+            "kind": kind,
+            "reason": reason,
+            "penalty": penalty,
+        }
+        self._index(card)
+        return card
+
+    def get(self, card_id: str) -> Optional[Dict[str, Any]]:
+        return self._by_id.get(card_id)
+
+    def remove(self, card_id: str) -> Optional[Dict[str, Any]]:
+        card = self._by_id.pop(card_id, None)
+        if card is None:
+            return None
+        self._cards.remove(card)
+        day = card.get("datetime", "")[:10]
+        if day:
+            for index, key in ((self._days, day), (self._months, day[:7])):
+                index[key] -= 1
+                if not index[key]:
+                    del index[key]
+        return card
+
+    def drop_before(self, day: str) -> List[Dict[str, Any]]:
+        """Remove and return the cards dated before `day` ("YYYY-MM-DD")."""
+        old = [c for c in self._cards if "" < c.get("datetime", "")[:10] < day]
+        for card in old:
+            self.remove(card["id"])
+        return old
+
+    def has_day(self, day: date) -> bool:
+        return day.isoformat() in self._days
+
+    def count_in_month(self, year: int, month: int) -> int:
+        return self._months.get(f"{year:04d}-{month:02d}", 0)
+
+
+def describe_card(card: Dict[str, Any]) -> str:
+    """The card as the sentence users have always seen."""
+    kind = card.get("kind")
+    if kind == "late":
+        return f"تاخیر در ورود در {card.get('datetime', '')}"
+    if kind == "admin":
+        return f"کارت زرد (اداری) در {card.get('datetime', '')}: {card.get('reason', '')}"
+    return card.get("reason") or card.get("datetime", "")
+
+
+def yellow_cards(user: Dict[str, Any]) -> YellowCardLog:
+    """The user's card log, converting a plain JSON list in place if needed."""
+    log = user.get("yellow_cards")
+    if not isinstance(log, YellowCardLog):
+        log = YellowCardLog.from_json(log or [])
+        user["yellow_cards"] = log
+    return log
+
+
+def attendance_log(user: Dict[str, Any], key: str) -> AttendanceLog:
+    """The user's log for `key`, converting a plain JSON list in place if needed."""
+    log = user.get(key)
+    if not isinstance(log, AttendanceLog):
+        log = AttendanceLog.from_json(log or [])
+        user[key] = log
+    return log
+
+
+def hydrate_user(user: Dict[str, Any]) -> None:
+    for key in ATTENDANCE_KEYS:
+        attendance_log(user, key)
+    yellow_cards(user)
+
+
+class Document(dict):
+    """
+    The loaded DB. `derived` holds indexes built from it (arrival board,
+    caches); they live as long as the document and are never persisted.
+    """
+
+    __slots__ = ("derived",)
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.derived: Dict[str, Any] = {}
+
+
+def derived(db: Dict[str, Any]) -> Dict[str, Any]:
+    """Index cache of `db`; a plain dict gets a throwaway one (no caching)."""
+    cache = getattr(db, "derived", None)
+    return cache if cache is not None else {}
+
+
+def hydrate(db: Dict[str, Any]) -> Document:
+    """Convert a freshly loaded JSON document to the in-memory model."""
+    for uid, user in db.items():
+        if uid != "_config" and isinstance(user, dict):
+            hydrate_user(user)
+    return db if isinstance(db, Document) else Document(db)
+
+
+def to_json(obj: Any) -> Any:
+    """json.dumps(default=...) hook for the persistence boundary."""
+    if isinstance(obj, (AttendanceLog, YellowCardLog)):
+        return obj.to_json()
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
@@ -0,0 +1,229 @@
+"""
+Attendance analytics over NumPy columns. load() turns the check-in and
+check-out logs of a date range (hot store and archives) into one row per
+user per attended day: user index, day number, arrival and departure
+minute of the day (-1 when missing) and a late flag. Everything else is
+computed on those columns with vectorised grouping, never per record.
+"""
+import copy
+from bisect import bisect_left
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from ..models import MINUTES_PER_DAY, attendance_log, day_number, day_start, parse_minutes
+from . import archive
+from .attendance import policy
+from .rewards import OVERTIME_FROM
+
+# Day 0 (1970-01-01) was a Thursday.
+_EPOCH_WEEKDAY = 3
+_OVERTIME_FROM = OVERTIME_FROM.hour * 60 + OVERTIME_FROM.minute
+
+# Upper edges, in hours, of the worked-hours histogram buckets.
+WORKED_BUCKETS = (6, 7, 8, 9, 10)
+
+
+class Frame:
+    """One row per (user, attended day), sorted by user then day."""
+
+    __slots__ = ("uids", "user", "day", "arrive", "depart", "late")
+
+    def __init__(self, uids: List[str], user: np.ndarray, day: np.ndarray,
+                 arrive: np.ndarray, depart: np.ndarray, late: np.ndarray):
+        self.uids = uids
+        self.user = user
+        self.day = day
+        self.arrive = arrive
+        self.depart = depart
+        self.late = late
+
+    def __len__(self) -> int:
+        return len(self.day)
+
+
+def _minutes(user: Optional[Dict[str, Any]], archived: Iterable[Dict[str, Any]],
+             field: str, lo: int, hi: int) -> np.ndarray:
+    """Sorted unique epoch-minutes of `field` in [lo, hi): hot log slice plus archived records."""
+    parts = []
+    if user:
+        minutes = attendance_log(user, field).minutes()
+        parts.append(np.array(minutes[bisect_left(minutes, lo):bisect_left(minutes, hi)], dtype=np.int64))
+    for month in archived:
+        found = []
+        for rec in month.get(field, ()):
+            try:
+                found.append(parse_minutes(rec["datetime"]))
+            except (TypeError, KeyError, ValueError):
+                continue
+        parts.append(np.array(found, dtype=np.int64))
+    if not parts:
+        return np.empty(0, dtype=np.int64)
+    values = np.unique(np.concatenate(parts))
+    return values[(values >= lo) & (values < hi)]
+
+
+def _first_per_day(minutes: np.ndarray) -> np.ndarray:
+    days = minutes // MINUTES_PER_DAY
+    _, first = np.unique(days, return_index=True)
+    return minutes[first]
+
+
+def _last_per_day(minutes: np.ndarray) -> np.ndarray:
+    days = minutes // MINUTES_PER_DAY
+    _, first = np.unique(days, return_index=True)
+    return minutes[np.append(first[1:] - 1, len(minutes) - 1)] if len(minutes) else minutes
+
+
+def _late_flags(db: Dict[str, Any], day: np.ndarray, arrive: np.ndarray) -> np.ndarray:
+    """arrive > the policy's limit for that weekday, except on unlimited dates."""
+    rules = policy(db)
+    limits = np.array([t.hour * 60 + t.minute for t in rules.limits], dtype=np.int64)
+    limit = limits[(day + _EPOCH_WEEKDAY) % 7]
+    unlimited = np.array(
+        [day_number(date.fromisoformat(d)) for d in rules.unlimited_dates], dtype=np.int64
+    )
+    return (arrive >= 0) & (arrive > limit) & ~np.isin(day, unlimited)
+
+
+def load(db: Dict[str, Any], start: date, end: date, uids: Optional[Iterable[str]] = None) -> Frame:
+    """The Frame for `uids` (default: every user) between start and end inclusive."""
+    if uids is None:
+        uids = (uid for uid, u in db.items() if uid != "_config" and isinstance(u, dict))
+    uids = sorted(uids)
+    lo, hi = day_start(start), day_start(end) + MINUTES_PER_DAY
+    first, last = start.year * 12 + start.month - 1, end.year * 12 + end.month - 1
+    wanted = {f"{m // 12:04d}-{m % 12 + 1:02d}" for m in range(first, last + 1)}
+    months = [archive.load_month(m) for m in archive.months() if m in wanted]
+
+    keys_in, arrives, keys_out, departs = [], [], [], []
+    for i, uid in enumerate(uids):
+        user = db.get(uid)
+        past = [m.get(uid, {}) for m in months]
+        ins = _first_per_day(_minutes(user, past, "check_ins", lo, hi))
+        outs = _last_per_day(_minutes(user, past, "check_outs", lo, hi))
+        keys_in.append(i * 1_000_000 + ins // MINUTES_PER_DAY)
+        arrives.append(ins % MINUTES_PER_DAY)
+        keys_out.append(i * 1_000_000 + outs // MINUTES_PER_DAY)
+        departs.append(outs % MINUTES_PER_DAY)
+
+    empty = np.empty(0, dtype=np.int64)
+    k_in = np.concatenate(keys_in) if keys_in else empty
+    k_out = np.concatenate(keys_out) if keys_out else empty
+    keys = np.union1d(k_in, k_out)
+    arrive = np.full(len(keys), -1, dtype=np.int64)
+    depart = np.full(len(keys), -1, dtype=np.int64)
+    if len(k_in):
+        arrive[np.searchsorted(keys, k_in)] = np.concatenate(arrives)
+    if len(k_out):
+        depart[np.searchsorted(keys, k_out)] = np.concatenate(departs)
+    user, day = np.divmod(keys, 1_000_000)
+    return Frame(uids, user, day, arrive, depart, _late_flags(db, day, arrive))
+
+
+def _streaks(frame: Frame, n: int):
+    """(longest, current) runs of on-time arrivals, per user; days not attended do not break a run."""
+    best = np.zeros(n, dtype=np.int64)
+    current = np.zeros(n, dtype=np.int64)
+    if not len(frame):
+        return best, current
+    new_user = np.r_[True, frame.user[1:] != frame.user[:-1]]
+    segment = np.cumsum(frame.late | new_user) - 1
+    on_time = (frame.arrive >= 0) & ~frame.late
+    lengths = np.bincount(segment[on_time], minlength=segment[-1] + 1)
+    owner = np.zeros(len(lengths), dtype=np.int64)
+    owner[segment] = frame.user
+    np.maximum.at(best, owner, lengths)
+    last_row = np.r_[np.flatnonzero(new_user)[1:] - 1, len(frame) - 1]
+    current[frame.user[last_row]] = lengths[segment[last_row]]
+    return best, current
+
+
+class Report:
+    """
+    Per-user columns (indexed like Frame.uids) and team totals for one
+    range. Times are minutes; averages are NaN where there is no data.
+    """
+
+    __slots__ = (
+        "start", "end", "uids", "days", "late_days", "late_rate", "avg_arrival",
+        "avg_worked", "overtime", "best_streak", "current_streak", "team", "worked_histogram",
+    )
+
+    def __init__(self, frame: Frame, start: date, end: date):
+        n = len(frame.uids)
+        user = frame.user
+        arrived = frame.arrive >= 0
+        worked = np.where(arrived & (frame.depart > frame.arrive), frame.depart - frame.arrive, -1)
+        has_worked = worked >= 0
+        overtime = np.where(frame.depart >= 0, np.maximum(frame.depart - _OVERTIME_FROM, 0), 0)
+
+        self.start, self.end, self.uids = start, end, frame.uids
+        self.days = np.bincount(user, minlength=n)
+        arrivals = np.bincount(user, weights=arrived, minlength=n)
+        self.late_days = np.bincount(user, weights=frame.late, minlength=n).astype(np.int64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.late_rate = self.late_days / arrivals
+            self.avg_arrival = np.bincount(user, weights=np.where(arrived, frame.arrive, 0), minlength=n) / arrivals
+            self.avg_worked = (
+                np.bincount(user, weights=np.where(has_worked, worked, 0), minlength=n)
+                / np.bincount(user, weights=has_worked, minlength=n)
+            )
+        self.overtime = np.bincount(user, weights=overtime, minlength=n).astype(np.int64)
+        self.best_streak, self.current_streak = _streaks(frame, n)
+
+        edges = np.array((0,) + WORKED_BUCKETS + (24,), dtype=np.int64) * 60
+        self.worked_histogram = np.histogram(worked[has_worked], bins=edges)[0]
+        self.team = {
+            "users": int(np.count_nonzero(self.days)),
+            "days": int(len(frame)),
+            "late_rate": float(frame.late.sum() / arrived.sum()) if arrived.any() else float("nan"),
+            "avg_arrival": float(frame.arrive[arrived].mean()) if arrived.any() else float("nan"),
+            "avg_worked": float(worked[has_worked].mean()) if has_worked.any() else float("nan"),
+            "median_worked": float(np.median(worked[has_worked])) if has_worked.any() else float("nan"),
+            "overtime": int(overtime.sum()),
+            "best_streak": int(self.best_streak.max()) if n else 0,
+        }
+
+    def user(self, uid: str) -> Optional[Dict[str, Any]]:
+        """One user's figures as plain Python values, or None if not in the report."""
+        i = bisect_left(self.uids, uid)
+        if i == len(self.uids) or self.uids[i] != uid:
+            return None
+        return {
+            "days": int(self.days[i]),
+            "late_days": int(self.late_days[i]),
+            "late_rate": float(self.late_rate[i]),
+            "avg_arrival": float(self.avg_arrival[i]),
+            "avg_worked": float(self.avg_worked[i]),
+            "overtime": int(self.overtime[i]),
+            "best_streak": int(self.best_streak[i]),
+            "current_streak": int(self.current_streak[i]),
+        }
+
+    def ranked(self, column: str, limit: int = 5, reverse: bool = True) -> List[str]:
+        """uids of attending users ordered by a per-user column."""
+        values = np.asarray(getattr(self, column), dtype=float)
+        present = np.flatnonzero((self.days > 0) & ~np.isnan(values))
+        order = present[np.argsort(values[present], kind="stable")]
+        if reverse:
+            order = order[::-1]
+        return [self.uids[i] for i in order[:limit]]
+
+
+def snapshot(db: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copies of what load() reads (config, attendance logs and the active
+    flag), safe to report or simulate on off the event loop.
+    """
+    view: Dict[str, Any] = {"_config": copy.deepcopy(db.get("_config") or {})}
+    for uid, user in db.items():
+        if uid != "_config" and isinstance(user, dict):
+            view[uid] = {field: copy.deepcopy(attendance_log(user, field)) for field in ("check_ins", "check_outs")}
+            view[uid]["active"] = bool(user.get("active", False))
+    return view
+
+
+def report(db: Dict[str, Any], start: date, end: date, uids: Optional[Iterable[str]] = None) -> Report:
+    return Report(load(db, start, end, uids), start, end)
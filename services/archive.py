@@ -0,0 +1,244 @@
+"""
+Cold storage for old history. Closed months of the growing per-user lists
+(attendance, cards, completed tasks, award dates and the points ledger)
+move out of the hot document into one lzma-compressed file per month,
+ARCHIVE_DIR/YYYY-MM.json.xz, shaped {user id: {field: [records]}}. The
+hot document keeps the current month plus ARCHIVE_KEEP_MONTHS closed ones,
+so its size stays flat. History views read archives lazily, newest first,
+only when a user pages past what is still hot.
+
+Archives are written before the records leave the hot document and merged
+without duplicating a batch, so a run interrupted in between is simply
+repeated. Archived ledger entries leave one carried-forward entry behind.
+"""
+import asyncio
+import json
+import logging
+import lzma
+import os
+import re
+from bisect import bisect_left
+from collections import Counter
+from datetime import date
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from .. import storage
+from ..config import ARCHIVE_DIR, ARCHIVE_EVERY_SEC, ARCHIVE_KEEP_MONTHS
+from ..models import attendance_log, day_start, format_minutes, yellow_cards
+from ..utils.time import now_local
+from . import ledger
+
+ATTENDANCE_FIELDS = ("check_ins", "check_outs")
+LIST_FIELDS = ("tasks_done", "top_awarded_dates", "team_awarded_dates", "ledger")
+FIELDS = ATTENDANCE_FIELDS + ("yellow_cards",) + LIST_FIELDS
+
+# Where a dict record keeps its timestamp.
+_STAMP = {"tasks_done": "done_at", "ledger": "ts"}
+
+_FILE = re.compile(r"^(\d{4}-\d{2})\.json\.xz$")
+_MONTH = re.compile(r"^\d{4}-\d{2}$")
+
+Archive = Dict[str, Dict[str, List[Any]]]
+
+log = logging.getLogger(__name__)
+
+_job: Optional["asyncio.Task[None]"] = None
+
+
+def _path(month: str) -> str:
+    return os.path.join(ARCHIVE_DIR, f"{month}.json.xz")
+
+
+def cutoff(today: date, keep: int = ARCHIVE_KEEP_MONTHS) -> date:
+    """First day of the oldest month that stays hot."""
+    months = today.year * 12 + today.month - 1 - keep
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def months() -> List[str]:
+    """Archived months, newest first."""
+    try:
+        names = os.listdir(ARCHIVE_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted((m.group(1) for m in map(_FILE.match, names) if m), reverse=True)
+
+
+def load_month(month: str) -> Archive:
+    """One month's archive, read from disk (bulk readers that visit each month once)."""
+    try:
+        with lzma.open(_path(month), "rt", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+@lru_cache(maxsize=12)
+def read_month(month: str) -> Archive:
+    """load_month() cached for paging views (shared: do not mutate)."""
+    return load_month(month)
+
+
+def _month_of(field: str, rec: Any) -> str:
+    if isinstance(rec, dict):
+        rec = rec.get(_STAMP.get(field, "datetime"))
+    month = rec[:7] if isinstance(rec, str) else ""
+    return month if _MONTH.match(month) else ""
+
+
+def _closed(user: Dict[str, Any], field: str, first_hot: date) -> List[Any]:
+    """Records of `field` from before `first_hot`, in stored order."""
+    if field in ATTENDANCE_FIELDS:
+        minutes = attendance_log(user, field).minutes()
+        return [{"datetime": format_minutes(m)} for m in minutes[:bisect_left(minutes, day_start(first_hot))]]
+    limit = first_hot.isoformat()[:7]
+    records = yellow_cards(user) if field == "yellow_cards" else user.get(field) or []
+    # Copies: the archive writer reads them off the event loop.
+    return [dict(rec) if isinstance(rec, dict) else rec for rec in records if "" < _month_of(field, rec) < limit]
+
+
+def _drop(user: Dict[str, Any], field: str, first_hot: date) -> None:
+    if field in ATTENDANCE_FIELDS:
+        attendance_log(user, field).drop_before(day_start(first_hot))
+    elif field == "yellow_cards":
+        yellow_cards(user).drop_before(first_hot.isoformat())
+    elif field == "ledger":
+        # The archived entries become one carried-forward entry, so the
+        # hot ledger still adds up to the cached balance.
+        limit = first_hot.isoformat()[:7]
+        entries = user.get("ledger") or []
+        old = [e for e in entries if "" < _month_of(field, e) < limit]
+        if old:
+            kept = [e for e in entries if not "" < _month_of(field, e) < limit]
+            carried = sum(int(e.get("amount") or 0) for e in old)
+            if carried:
+                kept.insert(0, {
+                    "ts": f"{first_hot.isoformat()} 00:00", "amount": carried,
+                    "reason": ledger.CARRIED_FORWARD, "ref": None,
+                })
+            user["ledger"] = kept
+    else:
+        limit = first_hot.isoformat()[:7]
+        user[field] = [rec for rec in user.get(field) or [] if not "" < _month_of(field, rec) < limit]
+
+
+def _merge(month: str, add: Archive) -> bytes:
+    """The month's archive file with `add` merged in; runs on the storage I/O thread."""
+    data = load_month(month)
+    for uid, fields in add.items():
+        mine = data.setdefault(uid, {})
+        for field, records in fields.items():
+            kept = mine.setdefault(field, [])
+            # Count copies rather than drop them: two identical ledger
+            # entries in one minute are both real, but a repeated run
+            # must not add its batch twice.
+            have = Counter(json.dumps(r, sort_keys=True) for r in kept)
+            for r in records:
+                key = json.dumps(r, sort_keys=True)
+                if have[key]:
+                    have[key] -= 1
+                else:
+                    kept.append(r)
+    return lzma.compress(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+
+def _count(user: Dict[str, Any], first_hot: date) -> Dict[str, int]:
+    found = {}
+    for field in FIELDS:
+        if field in ATTENDANCE_FIELDS:
+            n = bisect_left(attendance_log(user, field).minutes(), day_start(first_hot))
+        else:
+            n = len(_closed(user, field, first_hot))
+        if n:
+            found[field] = n
+    return found
+
+
+async def archive_closed_months(today: Optional[date] = None) -> Dict[str, int]:
+    """Move everything older than cutoff() to the archives; records moved per field."""
+    first_hot = cutoff(today or now_local().date())
+    # Each user is scanned in one synchronous step, so without any lock;
+    # the loop gets a turn between users.
+    batches: Dict[str, Archive] = {}
+    counts: Dict[str, Dict[str, int]] = {}
+    db = await storage.read_all()
+    for uid in [k for k, v in db.items() if k != "_config" and isinstance(v, dict)]:
+        user = db.get(uid)
+        if not isinstance(user, dict):
+            continue
+        for field in FIELDS:
+            closed = _closed(user, field, first_hot)
+            if closed:
+                counts.setdefault(uid, {})[field] = len(closed)
+            for rec in closed:
+                batches.setdefault(_month_of(field, rec), {}).setdefault(uid, {}).setdefault(field, []).append(rec)
+        await asyncio.sleep(0)
+    if not batches:
+        return {}
+    # Merging, compressing and writing happen on the I/O thread; handlers keep running.
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    for month, add in sorted(batches.items()):
+        await storage.save_bytes(_path(month), await storage.run_io(_merge, month, add))
+    read_month.cache_clear()
+    # Only the users being pruned are locked, and only for the in-memory drop.
+    # A user whose closed records changed meanwhile keeps them until the next
+    # run (the archive merge skips what it already has).
+    moved: Dict[str, int] = {}
+    async with storage.transaction(*sorted(counts)) as db:
+        for uid, expected in counts.items():
+            user = db.get(uid)
+            if not isinstance(user, dict) or _count(user, first_hot) != expected:
+                continue
+            for field, n in expected.items():
+                _drop(user, field, first_hot)
+                moved[field] = moved.get(field, 0) + n
+    return moved
+
+
+async def page(uid: str, user: Optional[Dict[str, Any]], field: str, offset: int, size: int) -> Tuple[List[Any], bool]:
+    """
+    Records offset..offset+size of `field`, newest first (the hot ones, then
+    each archive as it is reached), and whether older ones exist. Archives
+    are read on the storage I/O thread.
+    """
+    want = offset + size + 1
+    rows: List[Any] = []
+    if user:
+        records = user.get(field) or []
+        rows = [records[i] for i in range(len(records) - 1, max(len(records) - want, 0) - 1, -1)]
+    for month in months():
+        if len(rows) >= want:
+            break
+        archived = (await storage.run_io(read_month, month)).get(uid, {}).get(field, [])
+        rows.extend(reversed(archived[-(want - len(rows)):]))
+    rows = rows[offset:]
+    return rows[:size], len(rows) > size
+
+
+async def _run() -> None:
+    while True:
+        try:
+            await archive_closed_months()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("archiving closed months failed; retrying in %ss", ARCHIVE_EVERY_SEC)
+        await asyncio.sleep(ARCHIVE_EVERY_SEC)
+
+
+def start() -> None:
+    global _job
+    if _job is None or _job.done():
+        _job = asyncio.get_running_loop().create_task(_run())
+
+
+async def stop() -> None:
+    global _job
+    if _job is not None:
+        _job.cancel()
+        try:
+            await _job
+        except asyncio.CancelledError:
+            pass
+        _job = None
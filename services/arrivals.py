@@ -0,0 +1,92 @@
+from bisect import bisect_right, insort
+from datetime import date, datetime, time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from ..models import attendance_log, datetime_to_minutes, day_start, derived, minutes_to_datetime
+from ..utils.time import now_local
+
+_KEY = "arrivals"
+
+
+class ArrivalBoard:
+    """
+    Today's first check-in of every active user, kept sorted by arrival.
+    Built once per day from the attendance day index, then updated by
+    append_check, so the ladder and the team bonus never rescan histories.
+    `version` changes whenever the order does.
+    """
+
+    __slots__ = ("day", "active", "first", "order", "version")
+
+    def __init__(self, day: date, active: Set[str]):
+        self.day = day
+        self.active = active
+        self.first: Dict[str, int] = {}
+        self.order: List[Tuple[int, str]] = []
+        self.version = 0
+
+    def add(self, uid: str, minute: int) -> bool:
+        if uid not in self.active:
+            return False
+        current = self.first.get(uid)
+        if current is not None:
+            if minute >= current:
+                return False
+            self.order.remove((current, uid))
+        self.first[uid] = minute
+        insort(self.order, (minute, uid))
+        self.version += 1
+        return True
+
+    def top(self, n: int) -> List[Tuple[str, datetime]]:
+        return [(uid, minutes_to_datetime(m)) for m, uid in self.order[:n]]
+
+    def top_ids(self, n: int) -> List[str]:
+        return [uid for _, uid in self.order[:n]]
+
+    def everyone_arrived(self) -> bool:
+        return bool(self.active) and len(self.first) == len(self.active)
+
+    def arrived_by(self, limit: time) -> int:
+        """How many arrived at or before `limit` (the is_late boundary)."""
+        cutoff = day_start(self.day) + limit.hour * 60 + limit.minute
+        return bisect_right(self.order, cutoff, key=lambda e: e[0])
+
+
+def _build(db: Dict[str, Any], day: date) -> ArrivalBoard:
+    active = {
+        uid for uid, u in db.items()
+        if uid != "_config" and isinstance(u, dict) and u.get("active", False)
+    }
+    board = ArrivalBoard(day, active)
+    for uid in active:
+        minute = attendance_log(db[uid], "check_ins").first_minute_on(day)
+        if minute is not None:
+            board.add(uid, minute)
+    return board
+
+
+def today_board(db: Dict[str, Any]) -> ArrivalBoard:
+    today = now_local().date()
+    cache = derived(db)
+    board: Optional[ArrivalBoard] = cache.get(_KEY)
+    if board is None or board.day != today:
+        board = cache[_KEY] = _build(db, today)
+    return board
+
+
+def record_arrival(db: Dict[str, Any], user_id: Optional[str], when: datetime) -> None:
+    """Keep a built board in step with a new check-in (rebuild if we can't)."""
+    cache = derived(db)
+    board: Optional[ArrivalBoard] = cache.get(_KEY)
+    if board is None or board.day != when.date():
+        return
+    if user_id is None:
+        cache.pop(_KEY, None)
+        return
+    board.add(user_id, datetime_to_minutes(when))
+
+
+def invalidate(db: Dict[str, Any]) -> None:
+    """Call when the set of active users changes."""
+    derived(db).pop(_KEY, None)
@@ -1,97 +1,130 @@
-from datetime import datetime, date
-from typing import Dict, Any, Optional, Tuple, Iterator
+from datetime import datetime, date, time, timedelta
+from typing import Dict, Any, Optional, Tuple
 
-from ..utils.time import now_local, parse_hhmm, parse_db_dt
-from ..storage import ensure_config
-from ..config import DEFAULT_CHECKIN_LIMIT
+from ..utils.time import now_local, parse_hhmm
+from ..models import attendance_log, derived
+from .arrivals import record_arrival
+from ..config import DEFAULT_CHECKIN_LIMIT, WEEKDAY_CHECKIN_LIMITS, CHECKIN_GRACE_MIN
 
 
 RecordResult = Tuple[bool, str, Optional[datetime]]
 
 
-async def effective_limit_str(db: Dict[str, Any]) -> str:
-    cfg = await ensure_config(db)
-    return cfg.get("checkin_limit") or DEFAULT_CHECKIN_LIMIT
+class AttendancePolicy:
+    """
+    Check-in rules compiled once from `_config`: a limit per weekday,
+    the set of unlimited dates and the grace window. Lookups are pure and
+    synchronous, so bulk callers (team bonus, yellow cards) pay nothing per call.
+    """
 
+    __slots__ = ("limits", "unlimited_dates")
 
-async def is_unlimited_today(db: Dict[str, Any]) -> bool:
-    cfg = await ensure_config(db)
-    today = now_local().date().isoformat()
-    return today in cfg.get("unlimited_dates", [])
+    def __init__(self, cfg: Dict[str, Any]):
+        grace = timedelta(minutes=int(cfg.get("grace_minutes", CHECKIN_GRACE_MIN) or 0))
+        default = cfg.get("checkin_limit") or DEFAULT_CHECKIN_LIMIT
+        overrides = {int(k): v for k, v in (cfg.get("weekday_limits") or {}).items()}
+        limits = []
+        for weekday in range(7):
+            hhmm = overrides.get(weekday) or WEEKDAY_CHECKIN_LIMITS.get(weekday) or default
+            limit = datetime.combine(date.min, parse_hhmm(hhmm)) + grace
+            limits.append(limit.time())
+        self.limits: Tuple[time, ...] = tuple(limits)
+        self.unlimited_dates = frozenset(cfg.get("unlimited_dates", []))
 
+    def limit_for(self, day: date) -> Optional[time]:
+        """Latest on-time check-in for `day`, or None when the day is unlimited."""
+        if day.isoformat() in self.unlimited_dates:
+            return None
+        return self.limits[day.weekday()]
 
-async def is_late(db, when: datetime) -> bool:
-    if await is_unlimited_today(db):
-        return False
-    weekday = when.weekday()
-    if weekday == 3:
-        limit_time = parse_hhmm("09:31")
-    else:
-        limit_time = parse_hhmm(await effective_limit_str(db))
-    return when.time() > limit_time
+    def is_late(self, when: datetime) -> bool:
+        limit_time = self.limit_for(when.date())
+        return limit_time is not None and when.time() > limit_time
+
+
+def policy(db: Dict[str, Any]) -> AttendancePolicy:
+    cache = derived(db)
+    compiled = cache.get("policy")
+    if compiled is None:
+        compiled = cache["policy"] = AttendancePolicy(db.get("_config") or {})
+    return compiled
+
+
+def invalidate_policy(db: Dict[str, Any]) -> None:
+    """Call after changing `_config`."""
+    derived(db).pop("policy", None)
+
+
+def limit_for(db: Dict[str, Any], day: date) -> Optional[time]:
+    return policy(db).limit_for(day)
+
+
+def is_unlimited_today(db: Dict[str, Any]) -> bool:
+    return policy(db).limit_for(now_local().date()) is None
+
+
+def is_late(db: Dict[str, Any], when: datetime) -> bool:
+    return policy(db).is_late(when)
 
 
 def _today_local_date() -> date:
     return now_local().date()
 
 
-def _iter_checks_for_day(user: Dict[str, Any], key: str, day: date) -> Iterator[datetime]:
-    for rec in user.get(key, []):
-        dt_str = rec.get("datetime")
-        if not dt_str:
-            continue
-        try:
-            dt = parse_db_dt(dt_str)
-        except (ValueError, TypeError, KeyError):
-            continue
-        if dt.date() == day:
-            yield dt
+def checked_in_on(user: Dict[str, Any], day: date) -> bool:
+    return attendance_log(user, "check_ins").has_day(day)
+
+
+def checked_out_on(user: Dict[str, Any], day: date) -> bool:
+    return attendance_log(user, "check_outs").has_day(day)
 
 
 def has_checked_in_today(user: Dict[str, Any]) -> bool:
-    today = _today_local_date()
-    return any(_iter_checks_for_day(user, "check_ins", today))
+    return checked_in_on(user, _today_local_date())
 
 
 def has_checked_out_today(user: Dict[str, Any]) -> bool:
-    today = _today_local_date()
-    return any(_iter_checks_for_day(user, "check_outs", today))
+    return checked_out_on(user, _today_local_date())
 
 
 def first_check_in_for_day(user: Dict[str, Any], day: date) -> Optional[datetime]:
-    first: Optional[datetime] = None
-    for dt in _iter_checks_for_day(user, "check_ins", day):
-        if first is None or dt < first:
-            first = dt
-    return first
+    return attendance_log(user, "check_ins").first_on(day)
+
 
+def last_check_out_for_day(user: Dict[str, Any], day: date) -> Optional[datetime]:
+    return attendance_log(user, "check_outs").last_on(day)
 
-async def record_check_in(db: Dict[str, Any], user: Dict[str, Any]) -> RecordResult:
+
+async def record_check_in(
+    db: Dict[str, Any], user: Dict[str, Any], *, user_id: Optional[str] = None
+) -> RecordResult:
     if has_checked_in_today(user):
         return False, "⚠️ شما امروز یکبار ورود ثبت کرده‌اید و نمی‌توانید دوباره ورود بزنید.", None
 
-    when = await append_check(db, user, kind="in")
+    when = await append_check(db, user, kind="in", user_id=user_id)
     return True, "ورود ثبت شد.", when
 
 
 async def record_check_out(db: Dict[str, Any], user: Dict[str, Any]) -> RecordResult:
-    if has_checked_out_today(user):
+    today = _today_local_date()
+    if checked_out_on(user, today):
         return False, "⚠️ شما امروز یکبار خروج ثبت کرده‌اید و نمی‌توانید دوباره خروج بزنید.", None
-    if not has_checked_in_today(user):
+    if not checked_in_on(user, today):
         return False, "ابتدا ورود بزنید، سپس خروج.", None
 
     when = await append_check(db, user, kind="out")
     return True, "خروج ثبت شد.", when
 
 
-async def append_check(db: Dict[str, Any], user: Dict[str, Any], *, kind: str) -> datetime:
+async def append_check(
+    db: Dict[str, Any], user: Dict[str, Any], *, kind: str, user_id: Optional[str] = None
+) -> datetime:
     now = now_local()
-    ts = now.strftime("%Y-%m-%d %H:%M")
-    rec = {"datetime": ts}
     if kind == "in":
-        user.setdefault("check_ins", []).append(rec)
+        attendance_log(user, "check_ins").add(now)
+        record_arrival(db, user_id, now)
     elif kind == "out":
-        user.setdefault("check_outs", []).append(rec)
+        attendance_log(user, "check_outs").add(now)
     else:
         raise ValueError("kind must be 'in' or 'out'")
     return now
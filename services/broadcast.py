@@ -0,0 +1,181 @@
+import asyncio
+import functools
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Tuple
+
+from telegram import Bot
+from telegram.error import BadRequest, RetryAfter
+
+from ..config import (
+    BROADCAST_CONCURRENCY,
+    BROADCAST_GLOBAL_PER_SEC,
+    BROADCAST_PER_CHAT_PER_SEC,
+    BROADCAST_MAX_RETRIES,
+)
+from . import delivery
+
+DELIVERED = "delivered"
+FAILED = "failed"
+BLOCKED = "blocked"
+
+
+class TokenBucket:
+    """Classic token bucket; take() waits until a token is available."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "paused_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = 0.0
+        self.paused_until = 0.0
+
+    def pause(self, seconds: float) -> None:
+        loop = asyncio.get_running_loop()
+        self.paused_until = max(self.paused_until, loop.time() + seconds)
+        self.tokens = 0.0
+
+    async def take(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            if self.updated:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class BroadcastResult:
+    __slots__ = ("delivered", "failed", "blocked", "skipped")
+
+    def __init__(self) -> None:
+        self.delivered = 0
+        self.failed = 0
+        self.blocked = 0
+        self.skipped = 0
+
+    def add(self, outcome: str) -> None:
+        setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def summary(self) -> str:
+        text = f"✅ {self.delivered} ارسال شد | ⛔️ {self.blocked} مسدود | ❌ {self.failed} ناموفق"
+        if self.skipped:
+            text += f" | ⏭ {self.skipped} رد شد"
+        return text
+
+
+_TRANSIENT_RETRY = 0.5  # seconds before the first retry of a network error
+
+# Telegram allows ~30 messages/s per bot and ~1 message/s per chat.
+_global = TokenBucket(BROADCAST_GLOBAL_PER_SEC, BROADCAST_GLOBAL_PER_SEC)
+_per_chat: Dict[int, TokenBucket] = {}
+
+
+def _chat_bucket(chat_id: int) -> TokenBucket:
+    bucket = _per_chat.get(chat_id)
+    if bucket is None:
+        bucket = _per_chat[chat_id] = TokenBucket(BROADCAST_PER_CHAT_PER_SEC, 1)
+    return bucket
+
+
+def _retry_seconds(exc: RetryAfter) -> float:
+    value = exc.retry_after
+    return value.total_seconds() if isinstance(value, timedelta) else float(value)
+
+
+async def _deliver(chat_id: int, call: Callable[[], Awaitable[Any]]) -> str:
+    for attempt in range(BROADCAST_MAX_RETRIES + 1):
+        await _chat_bucket(chat_id).take()
+        await _global.take()
+        try:
+            await call()
+            delivery.record_success(chat_id)
+            return DELIVERED
+        except RetryAfter as e:
+            # Flood control is per bot: hold every sender, then retry this one.
+            _global.pause(_retry_seconds(e))
+            continue
+        except BadRequest as e:
+            # Editing to identical text is a no-op, not a failure.
+            if "not modified" in str(e).lower():
+                return DELIVERED
+            reason = delivery.classify(e)
+        except Exception as e:
+            reason = delivery.classify(e)
+        if reason == delivery.TRANSIENT and attempt < BROADCAST_MAX_RETRIES:
+            await asyncio.sleep(_TRANSIENT_RETRY * 2 ** attempt)
+            continue
+        if reason is not None:
+            delivery.record_failure(chat_id, reason)
+        return BLOCKED if reason in (delivery.BLOCKED, delivery.NOT_FOUND) else FAILED
+    return FAILED
+
+
+async def send(bot: Bot, chat_id: int, text: str, **kwargs: Any) -> str:
+    """Send one message within the rate limits; returns delivered/blocked/failed."""
+    return await _deliver(chat_id, lambda: bot.send_message(chat_id=chat_id, text=text, **kwargs))
+
+
+async def edit(bot: Bot, chat_id: int, message_id: int, text: str, **kwargs: Any) -> str:
+    """Edit one earlier message within the same limits as send()."""
+    return await _deliver(
+        chat_id,
+        lambda: bot.edit_message_text(text=text, chat_id=chat_id, message_id=message_id, **kwargs),
+    )
+
+
+async def _fan_out(calls: Iterable[Callable[[], Awaitable[str]]], skipped: int = 0) -> BroadcastResult:
+    result = BroadcastResult()
+    result.skipped = skipped
+    sem = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+
+    async def one(call: Callable[[], Awaitable[str]]) -> None:
+        async with sem:
+            result.add(await call())
+
+    await asyncio.gather(*(one(c) for c in calls))
+    return result
+
+
+async def broadcast(bot: Bot, chat_ids: Iterable[int], text: str, **kwargs: Any) -> BroadcastResult:
+    """Send `text` to every chat worth trying, with bounded concurrency."""
+    ids, skipped = delivery.split(chat_ids)
+    return await _fan_out(
+        (functools.partial(send, bot, chat_id, text, **kwargs) for chat_id in ids),
+        skipped,
+    )
+
+
+async def edit_all(bot: Bot, targets: Iterable[Tuple[int, int]], text: str, **kwargs: Any) -> BroadcastResult:
+    """Edit every (chat_id, message_id) to `text` with bounded concurrency."""
+    targets = list(targets)
+    ids, skipped = delivery.split(chat_id for chat_id, _ in targets)
+    live = set(ids)
+    return await _fan_out(
+        (
+            functools.partial(edit, bot, chat_id, message_id, text, **kwargs)
+            for chat_id, message_id in targets
+            if chat_id in live
+        ),
+        skipped,
+    )
+
+
+def all_chat_ids(db: Dict[str, Any]) -> List[int]:
+    """Every registered user's chat id (private chats share the user id)."""
+    ids: List[int] = []
+    for uid in db:
+        if uid == "_config":
+            continue
+        try:
+            ids.append(int(uid))
+        except ValueError:
+            continue
+    return ids
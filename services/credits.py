@@ -1,6 +1,12 @@
-from typing import Dict, Any
+import csv
+import io
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from uuid import uuid4
 
+from ..models import derived
 from ..utils.time import now_local
+from . import ledger
+from .leaderboard import invalidate as invalidate_leaderboard
 
 POINT_VALUE = 50_000  # each point = 50,000 Toman
 
@@ -33,10 +39,12 @@ def request_withdrawal(user: Dict[str, Any], amount: int) -> Dict[str, Any]:
     if points_needed > current_points:
         raise ValueError("امتیاز کافی نیست")
 
-    user["points"] = current_points - points_needed
+    wid = uuid4().hex[:8]
+    ledger.post(user, -points_needed, ledger.WITHDRAWAL, ref=wid)
     update_balance(user)
 
     withdrawal = {
+        "id": wid,
         "datetime": now_local().strftime("%Y-%m-%d %H:%M"),
         "amount": amount,
         "points": points_needed,
@@ -46,3 +54,110 @@ def request_withdrawal(user: Dict[str, Any], amount: int) -> Dict[str, Any]:
 
     user["balance"] = balance - amount
     return withdrawal
+
+
+# ---------- pending withdrawals ----------
+
+_PENDING_KEY = "pending_withdrawals"
+
+Pending = Tuple[str, str, Dict[str, Any]]  # (withdrawal id, user id, withdrawal)
+
+
+def withdrawal_id(uid: str, position: int, w: Dict[str, Any]) -> str:
+    """
+    Stable id of a withdrawal. Older records have none; they are named
+    "<uid>.<n>" after their 1-based place in the (append-only) list.
+    """
+    return w.get("id") or f"{uid}.{position + 1}"
+
+
+def _pending_index(db: Dict[str, Any]) -> Dict[str, str]:
+    """withdrawal id → user id for every pending withdrawal, built once per document."""
+    cache = derived(db)
+    index: Optional[Dict[str, str]] = cache.get(_PENDING_KEY)
+    if index is None:
+        index = cache[_PENDING_KEY] = {}
+        for uid, user in db.items():
+            if uid == "_config" or not isinstance(user, dict):
+                continue
+            for i, w in enumerate(user.get("withdrawals") or []):
+                if w.get("status") == "pending":
+                    index[withdrawal_id(uid, i, w)] = uid
+    return index
+
+
+def track_withdrawal(db: Dict[str, Any], uid: str, w: Dict[str, Any]) -> None:
+    """Register a withdrawal just created by request_withdrawal()."""
+    index: Optional[Dict[str, str]] = derived(db).get(_PENDING_KEY)
+    if index is not None:
+        index[w["id"]] = uid
+
+
+def find_withdrawal(db: Dict[str, Any], wid: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    uid = _pending_index(db).get(wid)
+    if uid is None and "." in wid:
+        uid = wid.rsplit(".", 1)[0]
+    user = db.get(uid) if uid is not None else None
+    if not isinstance(user, dict):
+        return None
+    for i, w in enumerate(user.get("withdrawals") or []):
+        if withdrawal_id(uid, i, w) == wid:
+            return uid, w
+    return None
+
+
+def pending_withdrawals(db: Dict[str, Any]) -> List[Pending]:
+    """Every pending withdrawal, oldest first."""
+    rows: List[Pending] = []
+    for wid in list(_pending_index(db)):
+        found = find_withdrawal(db, wid)
+        if found is None or found[1].get("status") != "pending":
+            _pending_index(db).pop(wid, None)
+            continue
+        rows.append((wid, found[0], found[1]))
+    rows.sort(key=lambda r: r[2].get("datetime", ""))
+    return rows
+
+
+def settle_withdrawal(db: Dict[str, Any], uid: str, wid: str, w: Dict[str, Any], approve: bool) -> int:
+    """
+    Approve or reject a withdrawal. A rejection refunds the points it
+    reserved; returns how many were refunded.
+    """
+    w["status"] = "approved" if approve else "rejected"
+    w["settled"] = now_local().strftime("%Y-%m-%d %H:%M")
+    _pending_index(db).pop(wid, None)
+    if approve:
+        return 0
+
+    points_used = w.get("points")
+    if points_used is None:
+        points_used = (w.get("amount", 0) or 0) // POINT_VALUE
+    points_used = int(points_used or 0)
+    user = db[uid]
+    if points_used > 0:
+        ledger.post(user, points_used, ledger.WITHDRAWAL_REFUND, ref=wid)
+    update_balance(user)
+    invalidate_leaderboard(db)
+    return points_used
+
+
+def payout_summary(db: Dict[str, Any], rows: Iterable[Pending]) -> bytes:
+    """CSV of settled withdrawals (one row each, then the total) for bookkeeping."""
+    buf = io.StringIO()
+    out = csv.writer(buf)
+    out.writerow(["withdrawal_id", "user_id", "name", "amount", "points", "requested", "settled", "status"])
+    total = 0
+    for wid, uid, w in rows:
+        user = db.get(uid) or {}
+        name = user.get("display_name") or user.get("username") or uid
+        amount = int(w.get("amount", 0) or 0)
+        if w.get("status") == "approved":
+            total += amount
+        out.writerow([
+            wid, uid, name, amount, w.get("points", ""),
+            w.get("datetime", ""), w.get("settled", ""), w.get("status", ""),
+        ])
+    out.writerow(["", "", "total approved", total, "", "", "", ""])
+    # BOM so spreadsheet apps open the Persian names correctly.
+    return buf.getvalue().encode("utf-8-sig")
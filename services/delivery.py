@@ -0,0 +1,101 @@
+"""
+Delivery health per chat. Chats that blocked the bot or no longer exist
+are skipped by every fan-out until the user talks to the bot again;
+chats failing with network errors are backed off exponentially.
+Saved with the outbox.
+"""
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from telegram.error import BadRequest, Forbidden, NetworkError
+
+from ..config import DELIVERY_BACKOFF_BASE, DELIVERY_BACKOFF_MAX
+
+DEAD = "dead"
+BACKOFF = "backoff"
+
+BLOCKED = "blocked"
+NOT_FOUND = "chat_not_found"
+TRANSIENT = "network"
+
+_chats: Dict[str, Dict[str, Any]] = {}
+
+
+def classify(exc: BaseException) -> Optional[str]:
+    """Why a send failed, as far as the chat's health is concerned."""
+    if isinstance(exc, Forbidden):
+        return BLOCKED
+    if isinstance(exc, BadRequest):
+        return NOT_FOUND if "chat not found" in str(exc).lower() else None
+    if isinstance(exc, NetworkError):
+        return TRANSIENT
+    return None
+
+
+def deliverable(chat_id: int, now: Optional[float] = None) -> bool:
+    entry = _chats.get(str(chat_id))
+    if entry is None:
+        return True
+    if entry["status"] == DEAD:
+        return False
+    return (now or time.time()) >= entry["retry_at"]
+
+
+def split(chat_ids: Iterable[int]) -> Tuple[List[int], int]:
+    """(chats worth trying now, how many were skipped)."""
+    if not _chats:
+        ids = list(chat_ids)
+        return ids, 0
+    now = time.time()
+    ids, skipped = [], 0
+    for chat_id in chat_ids:
+        if deliverable(chat_id, now):
+            ids.append(chat_id)
+        else:
+            skipped += 1
+    return ids, skipped
+
+
+def record_failure(chat_id: int, reason: str) -> None:
+    key = str(chat_id)
+    now = time.time()
+    if reason == TRANSIENT:
+        entry = _chats.get(key)
+        if entry is not None and entry["status"] == DEAD:
+            return
+        fails = (entry or {}).get("fails", 0) + 1
+        delay = min(DELIVERY_BACKOFF_MAX, DELIVERY_BACKOFF_BASE * 2 ** (fails - 1))
+        _chats[key] = {
+            "status": BACKOFF,
+            "reason": reason,
+            "since": (entry or {}).get("since", now),
+            "fails": fails,
+            "retry_at": now + delay,
+        }
+    else:
+        _chats[key] = {"status": DEAD, "reason": reason, "since": now, "fails": 1, "retry_at": None}
+
+
+def record_success(chat_id: int) -> None:
+    if _chats:
+        _chats.pop(str(chat_id), None)
+
+
+def revive(chat_id: int) -> bool:
+    """The user reached us, so their chat works again."""
+    return _chats.pop(str(chat_id), None) is not None
+
+
+def entries() -> List[Tuple[str, Dict[str, Any]]]:
+    """Dead chats first, then backed-off ones, oldest first."""
+    return sorted(_chats.items(), key=lambda kv: (kv[1]["status"] != DEAD, kv[1]["since"]))
+
+
+def to_json() -> Dict[str, Any]:
+    return {k: dict(v) for k, v in _chats.items()}
+
+
+def load(state: Any) -> None:
+    _chats.clear()
+    if isinstance(state, dict):
+        _chats.update({k: v for k, v in state.items() if isinstance(v, dict) and "status" in v})
@@ -0,0 +1,133 @@
+"""
+Who is who: usernames and display names → user ids. Exact lookups are
+dict hits; partial names go through a trigram index. Built lazily on the
+loaded document and kept current by get_user, /setname and /remove_user.
+"""
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from ..models import derived
+
+_KEY = "directory"
+_MIN_SIMILARITY = 0.3
+
+# Arabic code points that Persian keyboards sometimes produce instead.
+_FOLD = str.maketrans({"ي": "ی", "ى": "ی", "ك": "ک", "ة": "ه", "\u200c": " "})
+
+
+def normalize(name: str) -> str:
+    return " ".join(name.translate(_FOLD).casefold().lstrip("@").split())
+
+
+def _trigrams(name: str) -> Set[str]:
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Directory:
+    __slots__ = ("usernames", "display_names", "grams", "names")
+
+    def __init__(self) -> None:
+        # Usernames are unique handles, display names are not: kept apart so
+        # an exact username never becomes ambiguous because of someone's name.
+        self.usernames: Dict[str, Set[str]] = {}
+        self.display_names: Dict[str, Set[str]] = {}
+        self.grams: Dict[str, Set[str]] = {}
+        self.names: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+
+    def add(self, uid: str, user: Dict[str, Any]) -> None:
+        self.remove(uid)
+        username, display = (
+            normalize(n) if isinstance(n, str) and n.strip() else None
+            for n in (user.get("username"), user.get("display_name"))
+        )
+        self.names[uid] = (username, display)
+        for index, name in ((self.usernames, username), (self.display_names, display)):
+            if name:
+                index.setdefault(name, set()).add(uid)
+        for name in {username, display} - {None}:
+            for gram in _trigrams(name):
+                self.grams.setdefault(gram, set()).add(uid)
+
+    def remove(self, uid: str) -> None:
+        username, display = self.names.pop(uid, (None, None))
+        for index, name in ((self.usernames, username), (self.display_names, display)):
+            if name:
+                _discard(index, name, uid)
+        for name in {username, display} - {None}:
+            for gram in _trigrams(name):
+                _discard(self.grams, gram, uid)
+
+    def lookup(self, text: str) -> Set[str]:
+        """Exact username matches, or failing those exact display-name matches."""
+        key = normalize(text)
+        return self.usernames.get(key) or self.display_names.get(key, set())
+
+    def search(self, text: str, limit: int) -> List[str]:
+        """Best partial matches: prefixes first, then by trigram similarity."""
+        query = normalize(text)
+        if not query:
+            return []
+        wanted = _trigrams(query)
+        candidates: Set[str] = set()
+        for gram in wanted:
+            candidates.update(self.grams.get(gram, ()))
+        scored = []
+        for uid in candidates:
+            best = 0.0
+            for name in self.names[uid]:
+                if not name:
+                    continue
+                if name.startswith(query):
+                    best = max(best, 1.0 + len(query) / len(name))
+                else:
+                    grams = _trigrams(name)
+                    best = max(best, len(wanted & grams) / len(wanted | grams))
+            if best >= _MIN_SIMILARITY:
+                scored.append((-best, uid))
+        scored.sort()
+        return [uid for _, uid in scored[:limit]]
+
+
+def _discard(index: Dict[str, Set[str]], key: str, uid: str) -> None:
+    uids = index.get(key)
+    if uids is not None:
+        uids.discard(uid)
+        if not uids:
+            del index[key]
+
+
+def directory(db: Dict[str, Any]) -> Directory:
+    cache = derived(db)
+    found: Optional[Directory] = cache.get(_KEY)
+    if found is None:
+        found = cache[_KEY] = Directory()
+        for uid, user in db.items():
+            if uid != "_config" and isinstance(user, dict):
+                found.add(uid, user)
+    return found
+
+
+def record(db: Dict[str, Any], uid: str) -> None:
+    """Re-index `uid` after its names changed (no-op until the index is built)."""
+    found: Optional[Directory] = derived(db).get(_KEY)
+    if found is not None:
+        found.add(uid, db[uid])
+
+
+def forget(db: Dict[str, Any], uid: str) -> None:
+    found: Optional[Directory] = derived(db).get(_KEY)
+    if found is not None:
+        found.remove(uid)
+
+
+def resolve(db: Dict[str, Any], text: str) -> Optional[str]:
+    """A user id for an id, @username or else exact display name; None if unknown or ambiguous."""
+    text = text.strip()
+    if text in db and text != "_config":
+        return text
+    uids = directory(db).lookup(text)
+    return next(iter(uids)) if len(uids) == 1 else None
+
+
+def search(db: Dict[str, Any], text: str, limit: int = 5) -> List[str]:
+    return directory(db).search(text, limit)
@@ -0,0 +1,71 @@
+"""
+One early-birds ladder message per chat per day. The first check-in of a
+chat gets the ladder as a reply; after that the existing messages are
+edited, and only when the rendered ladder actually changed.
+"""
+import hashlib
+from datetime import date
+from typing import Any, Dict, Tuple
+
+from ..models import derived
+from . import outbox
+from .arrivals import today_board
+from .rewards import build_early_birds_ladder
+
+_TEXT_KEY = "ladder_text"
+_STATE_KEY = "ladder_messages"
+
+
+def ladder_text(db: Dict[str, Any]) -> str:
+    """The ladder, rendered once per board version (and top-4 points)."""
+    board = today_board(db)
+    top = board.top_ids(4)
+    key = (board.day, board.version, tuple(db.get(uid, {}).get("points", 0) for uid in top))
+    cache = derived(db)
+    cached: Tuple[Any, str] = cache.get(_TEXT_KEY, (None, ""))
+    if cached[0] != key:
+        cached = cache[_TEXT_KEY] = (key, build_early_birds_ladder(db))
+    return cached[1]
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _state(cfg: Dict[str, Any], day: date) -> Dict[str, Any]:
+    """Today's ladder messages, kept under _config (chat_id → message_id)."""
+    state = cfg.get(_STATE_KEY)
+    if not isinstance(state, dict) or state.get("day") != day.isoformat():
+        state = cfg[_STATE_KEY] = {"day": day.isoformat(), "hash": None, "chats": {}}
+    return state
+
+
+def needs_refresh(cfg: Dict[str, Any], day: date, chat_id: int, text: str) -> bool:
+    """
+    Whether refresh() would change anything: a new day, a changed ladder
+    or no message in `chat_id` yet. Read-only, so callers can skip the
+    _config transaction on the common check-in that changes nothing.
+    """
+    state = cfg.get(_STATE_KEY)
+    if not isinstance(state, dict) or state.get("day") != day.isoformat():
+        return True
+    return state.get("hash") != content_hash(text) or str(chat_id) not in state.get("chats", {})
+
+
+def refresh(cfg: Dict[str, Any], day: date, chat_id: int, text: str) -> bool:
+    """
+    Bring the other chats' ladders up to date with `text` (queued edits,
+    skipped when nothing changed). Returns whether `chat_id` still needs
+    a ladder message of its own.
+    """
+    state = _state(cfg, day)
+    digest = content_hash(text)
+    if state["hash"] != digest:
+        state["hash"] = digest
+        others = {int(c): m for c, m in state["chats"].items() if c != str(chat_id)}
+        outbox.enqueue_edit(f"ladder:{day.isoformat()}", others, text)
+    return str(chat_id) not in state["chats"]
+
+
+def remember(cfg: Dict[str, Any], day: date, chat_id: int, message_id: int) -> None:
+    _state(cfg, day)["chats"][str(chat_id)] = message_id
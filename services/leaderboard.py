@@ -0,0 +1,70 @@
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..models import derived
+
+PAGE_SIZE = 20
+
+_KEY = "leaderboard"
+
+
+def _points(user: Dict[str, Any]) -> int:
+    try:
+        return int(user.get("points", 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+class Ranking:
+    """
+    Every user ordered by points (ties by name). Tied users share a rank
+    ("1, 2, 2, 4"); a user's rank is one plus the number of users with
+    strictly more points, found by bisection.
+    """
+
+    __slots__ = ("entries", "_neg_points", "_index", "size")
+
+    def __init__(self, db: Dict[str, Any]):
+        entries: List[Tuple[int, str, str]] = []
+        for uid, u in db.items():
+            if uid == "_config" or not isinstance(u, dict):
+                continue
+            name = u.get("display_name") or u.get("username") or uid
+            entries.append((_points(u), name, uid))
+        entries.sort(key=lambda e: (-e[0], e[1]))
+        self.entries = entries
+        self._neg_points = [-p for p, _, _ in entries]
+        self._index = {uid: i for i, (_, _, uid) in enumerate(entries)}
+        self.size = len(db)
+
+    def rank_of_points(self, points: int) -> int:
+        return bisect_left(self._neg_points, -points) + 1
+
+    def rank(self, uid: str) -> Optional[int]:
+        i = self._index.get(uid)
+        return None if i is None else self.rank_of_points(self.entries[i][0])
+
+    def pages(self) -> int:
+        return max(1, -(-len(self.entries) // PAGE_SIZE))
+
+    def page(self, n: int) -> List[Tuple[int, int, str, str]]:
+        """(rank, points, name, uid) for page `n` (0-based)."""
+        start = n * PAGE_SIZE
+        return [
+            (self.rank_of_points(p), p, name, uid)
+            for p, name, uid in self.entries[start:start + PAGE_SIZE]
+        ]
+
+
+def ranking(db: Dict[str, Any]) -> Ranking:
+    cache = derived(db)
+    board: Optional[Ranking] = cache.get(_KEY)
+    # A user created since the last build changes the size of the document.
+    if board is None or board.size != len(db):
+        board = cache[_KEY] = Ranking(db)
+    return board
+
+
+def invalidate(db: Dict[str, Any]) -> None:
+    """Call whenever points or display names change."""
+    derived(db).pop(_KEY, None)
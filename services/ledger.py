@@ -0,0 +1,100 @@
+"""
+Points ledger. Every change to a user's points is an entry in their
+append-only `ledger` list; `points` is the cached running total, so
+reading a balance stays O(1) and recompute() can always check it.
+Balances from before the ledger existed become an "opening" entry.
+"""
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..utils.time import now_local
+
+# Entry reasons.
+OPENING = "opening"
+EARLY_BIRD = "early_bird"
+TEAM_BONUS = "team_bonus"
+OVERTIME = "overtime"
+LATE_PENALTY = "late_penalty"
+PENALTY_REFUND = "penalty_refund"
+WITHDRAWAL = "withdrawal"
+WITHDRAWAL_REFUND = "withdrawal_refund"
+TRANSFER_OUT = "transfer_out"
+TRANSFER_IN = "transfer_in"
+CARRIED_FORWARD = "carried_forward"  # sum of the entries moved to the archive
+
+_TS_FORMAT = "%Y-%m-%d %H:%M"
+
+
+def _safe_int(value: Any, default: int = 0) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def entries(user: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """The user's ledger, opened from the current balance the first time."""
+    ledger = user.get("ledger")
+    if not ledger:
+        points = _safe_int(user.get("points", 0))
+        ledger = user["ledger"] = []
+        if points:
+            ledger.append({"ts": now_local().strftime(_TS_FORMAT), "amount": points, "reason": OPENING, "ref": None})
+    return ledger
+
+
+def post(
+    user: Dict[str, Any],
+    amount: int,
+    reason: str,
+    *,
+    ref: Optional[str] = None,
+    when: Optional[datetime] = None,
+) -> int:
+    """Record a change of `amount` points and return the new balance."""
+    ledger = entries(user)
+    balance = _safe_int(user.get("points", 0)) + amount
+    ledger.append({
+        "ts": (when or now_local()).strftime(_TS_FORMAT),
+        "amount": amount,
+        "reason": reason,
+        "ref": ref,
+    })
+    user["points"] = balance
+    return balance
+
+
+def recompute(user: Dict[str, Any]) -> int:
+    """The balance the ledger adds up to."""
+    ledger = user.get("ledger")
+    if not ledger:
+        return _safe_int(user.get("points", 0))
+    return sum(_safe_int(e.get("amount")) for e in ledger)
+
+
+def verify(db: Dict[str, Any]) -> List[Tuple[str, int, int]]:
+    """(user id, cached points, ledger total) for every user where they disagree."""
+    mismatched = []
+    for uid, user in db.items():
+        if uid == "_config" or not isinstance(user, dict):
+            continue
+        cached, total = _safe_int(user.get("points", 0)), recompute(user)
+        if cached != total:
+            mismatched.append((uid, cached, total))
+    return mismatched
+
+
+def history(
+    user: Dict[str, Any],
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Entries with since <= ts <= until ("YYYY-MM-DD" or "YYYY-MM-DD HH:MM").
+    The ledger is in time order, so this is two bisections.
+    """
+    ledger = user.get("ledger") or []
+    lo = bisect_left(ledger, since, key=lambda e: e["ts"]) if since else 0
+    hi = bisect_right(ledger, until + "\uffff", key=lambda e: e["ts"]) if until else len(ledger)
+    return ledger[lo:hi]
@@ -0,0 +1,330 @@
+"""
+Outgoing notifications. Handlers enqueue messages instead of sending them
+inline; one worker drains the queue through the broadcast engine, highest
+lane first. The queue is written next to the DB so pending notifications
+survive a restart (delivery is at-least-once: a batch in flight when the
+process dies is sent again).
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from uuid import uuid4
+
+from telegram import Bot
+
+from .. import storage
+from . import delivery
+from ..config import (
+    DIGEST_ENABLED,
+    DIGEST_URGENT_IMMEDIATE,
+    DIGEST_WINDOW_SEC,
+    OUTBOX_BATCH,
+    OUTBOX_FILE,
+)
+from .broadcast import BroadcastResult, broadcast, edit_all
+
+# Lanes, most urgent first.
+DIRECT = 0      # a notice to one particular user
+ADMIN = 1       # admin announcements and reports
+BROADCAST = 2   # automatic team-wide announcements
+
+LANE_NAMES = {DIRECT: "direct", ADMIN: "admin", BROADCAST: "broadcast"}
+
+_SAVE_DELAY = 0.5
+_DIGEST_HEADER = "📰 خلاصه ورود و خروج:"
+_DIGEST_MAX_CHARS = 3500  # stay well under Telegram's 4096
+
+_heap: List[Tuple[int, int, Dict[str, Any]]] = []
+_seq = itertools.count()
+_wakeup: Optional[asyncio.Event] = None
+_worker: Optional["asyncio.Task[None]"] = None
+_save_task: Optional["asyncio.Task[None]"] = None
+_unsaved = False
+
+# Announcements waiting for the digest window to close.
+_digest: Dict[str, Any] = {"since": None, "lines": [], "chat_ids": []}
+_digest_timer: Optional[asyncio.TimerHandle] = None
+
+
+def _event() -> asyncio.Event:
+    global _wakeup
+    if _wakeup is None:
+        _wakeup = asyncio.Event()
+    return _wakeup
+
+
+def _push(item: Dict[str, Any]) -> None:
+    heapq.heappush(_heap, (item["priority"], item["seq"], item))
+
+
+def enqueue(
+    chat_ids: Iterable[int],
+    text: str,
+    *,
+    priority: int = BROADCAST,
+    report_to: Optional[int] = None,
+) -> int:
+    """Queue `text` for every chat; `report_to` gets a summary when it is done."""
+    ids = [int(c) for c in chat_ids]
+    if not ids:
+        return 0
+    _push({
+        "id": uuid4().hex[:12],
+        "priority": priority,
+        "seq": next(_seq),
+        "created": time.time(),
+        "chat_ids": ids,
+        "text": text,
+        "report_to": report_to,
+        "result": {"delivered": 0, "failed": 0, "blocked": 0},
+    })
+    _event().set()
+    _save_soon()
+    return len(ids)
+
+
+def enqueue_edit(key: str, targets: Dict[int, int], text: str, *, priority: int = BROADCAST) -> None:
+    """
+    Queue an edit of earlier messages (chat_id → message_id) to `text`.
+    A pending edit with the same `key` is folded into this one, so only
+    the latest text is ever sent to a chat.
+    """
+    ids = {str(c): int(m) for c, m in targets.items()}
+    for _, _, item in _heap:
+        if item.get("op") == "edit" and item.get("key") == key:
+            item["text"] = text
+            # Chats an earlier batch already edited left chat_ids but not
+            # message_ids; they need the newer text too.
+            pending = set(item["chat_ids"])
+            for chat, message_id in ids.items():
+                if int(chat) not in pending:
+                    item["chat_ids"].append(int(chat))
+                item["message_ids"][chat] = message_id
+            _save_soon()
+            return
+    if not ids:
+        return
+    _push({
+        "id": uuid4().hex[:12],
+        "op": "edit",
+        "key": key,
+        "priority": priority,
+        "seq": next(_seq),
+        "created": time.time(),
+        "chat_ids": [int(c) for c in ids],
+        "message_ids": ids,
+        "text": text,
+        "report_to": None,
+        "result": {"delivered": 0, "failed": 0, "blocked": 0},
+    })
+    _event().set()
+    _save_soon()
+
+
+def notify(chat_id: Any, text: str) -> None:
+    """Direct-lane notice to one user (ignored if the id is not a chat id)."""
+    try:
+        enqueue([int(chat_id)], text, priority=DIRECT)
+    except (TypeError, ValueError):
+        pass
+
+
+def announce(chat_ids: Iterable[int], text: str, *, urgent: bool = False) -> None:
+    """
+    Team-wide announcement. With DIGEST_ENABLED, non-urgent ones are
+    collected for DIGEST_WINDOW_SEC and every recipient gets one combined
+    message instead of one per event.
+    """
+    if not DIGEST_ENABLED or (urgent and DIGEST_URGENT_IMMEDIATE):
+        enqueue(chat_ids, text)
+        return
+    if _digest["lines"] and len(_digest_text()) + len(text) > _DIGEST_MAX_CHARS:
+        flush_digest()
+    if _digest["since"] is None:
+        _digest["since"] = time.time()
+        _arm_digest(DIGEST_WINDOW_SEC)
+    _digest["lines"].append(text)
+    known = set(_digest["chat_ids"])
+    _digest["chat_ids"].extend(int(c) for c in chat_ids if int(c) not in known)
+    _save_soon()
+
+
+def _digest_text() -> str:
+    return "\n\n".join([_DIGEST_HEADER, *_digest["lines"]])
+
+
+def _arm_digest(delay: float) -> None:
+    global _digest_timer
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    if _digest_timer is not None:
+        _digest_timer.cancel()
+    _digest_timer = loop.call_later(max(delay, 0), flush_digest)
+
+
+def flush_digest() -> None:
+    """Queue the collected announcements now."""
+    global _digest_timer
+    if _digest_timer is not None:
+        _digest_timer.cancel()
+        _digest_timer = None
+    if _digest["lines"]:
+        enqueue(_digest["chat_ids"], _digest_text())
+    _digest.update(since=None, lines=[], chat_ids=[])
+    _save_soon()
+
+
+def metrics() -> List[Tuple[str, int, int, float]]:
+    """Per lane: (name, queued items, queued messages, age of the oldest in seconds)."""
+    now = time.time()
+    lanes: Dict[int, List[Any]] = {p: [0, 0, 0.0] for p in LANE_NAMES}
+    for priority, _, item in _heap:
+        lane = lanes.setdefault(priority, [0, 0, 0.0])
+        lane[0] += 1
+        lane[1] += len(item["chat_ids"])
+        lane[2] = max(lane[2], now - item["created"])
+    return [(LANE_NAMES.get(p, str(p)), *lanes[p]) for p in sorted(lanes)]
+
+
+# ---------- persistence ----------
+
+def _snapshot() -> List[Dict[str, Any]]:
+    return [dict(item, chat_ids=list(item["chat_ids"])) for _, _, item in sorted(_heap)]
+
+
+async def save() -> None:
+    await storage.save_json(
+        OUTBOX_FILE,
+        {"queue": _snapshot(), "digest": _digest, "delivery": delivery.to_json()},
+    )
+
+
+def _save_soon() -> None:
+    global _save_task, _unsaved
+    _unsaved = True
+    if _save_task is not None and not _save_task.done():
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+
+    async def later() -> None:
+        global _unsaved
+        while _unsaved:
+            await asyncio.sleep(_SAVE_DELAY)
+            _unsaved = False
+            await save()
+
+    _save_task = loop.create_task(later())
+
+
+def load() -> None:
+    """Requeue the saved items ahead of anything queued since start-up."""
+    saved = storage.load_json(OUTBOX_FILE, {})
+    if isinstance(saved, list):  # files written before digests existed
+        saved = {"queue": saved}
+    if isinstance(saved, dict):
+        delivery.load(saved.get("delivery"))
+    digest = saved.get("digest") if isinstance(saved, dict) else None
+    if isinstance(digest, dict) and digest.get("lines"):
+        _digest["lines"][:0] = digest["lines"]
+        _digest["chat_ids"] = sorted(set(_digest["chat_ids"]) | set(digest.get("chat_ids") or []))
+        _digest["since"] = min(t for t in (_digest["since"], digest.get("since"), time.time()) if t)
+    items = saved.get("queue") if isinstance(saved, dict) else None
+    if not isinstance(items, list):
+        return
+    items = [i for i in items if isinstance(i, dict) and i.get("chat_ids")]
+    items.sort(key=lambda i: i.get("seq", 0))
+    for n, item in enumerate(items, start=-len(items)):
+        item.setdefault("priority", BROADCAST)
+        item.setdefault("created", time.time())
+        item.setdefault("result", {"delivered": 0, "failed": 0, "blocked": 0})
+        item["seq"] = n
+        _push(item)
+
+
+# ---------- worker ----------
+
+def _summary(item: Dict[str, Any]) -> str:
+    result = BroadcastResult()
+    for outcome, count in item["result"].items():
+        setattr(result, outcome, count)
+    return f"پیام برای {result.delivered} نفر ارسال شد ✅\n{result.summary()}"
+
+
+async def _step(bot: Bot) -> None:
+    # Big fan-outs go out in batches so a direct notice never waits
+    # behind a whole team broadcast.
+    _, _, item = heapq.heappop(_heap)
+    batch = item["chat_ids"][:OUTBOX_BATCH]
+    try:
+        if item.get("op") == "edit":
+            targets = [(c, item["message_ids"][str(c)]) for c in batch]
+            result = await edit_all(bot, targets, item["text"])
+        else:
+            result = await broadcast(bot, batch, item["text"])
+    except BaseException:
+        # Cancelled at shutdown or failed: keep the batch for the next run.
+        _push(item)
+        raise
+    for outcome in ("delivered", "failed", "blocked", "skipped"):
+        item["result"][outcome] = item["result"].get(outcome, 0) + getattr(result, outcome)
+    item["chat_ids"] = item["chat_ids"][len(batch):]
+    if item["chat_ids"]:
+        _push(item)
+    elif item.get("report_to"):
+        enqueue([item["report_to"]], _summary(item), priority=ADMIN)
+    _save_soon()
+
+
+async def _run(bot: Bot) -> None:
+    wakeup = _event()
+    while True:
+        if not _heap:
+            wakeup.clear()
+            await wakeup.wait()
+            continue
+        try:
+            await _step(bot)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            await asyncio.sleep(1)
+
+
+def start(bot: Bot) -> None:
+    """Load what the last run left behind and start draining it."""
+    global _worker
+    load()
+    if _digest["since"] is not None:
+        _arm_digest(_digest["since"] + DIGEST_WINDOW_SEC - time.time())
+    if _worker is None or _worker.done():
+        _worker = asyncio.get_running_loop().create_task(_run(bot))
+    if _heap:
+        _event().set()
+
+
+async def stop() -> None:
+    """Stop the worker and save the queue; an open digest is saved, not sent."""
+    global _worker, _digest_timer
+    if _digest_timer is not None:
+        _digest_timer.cancel()
+        _digest_timer = None
+    if _worker is not None:
+        _worker.cancel()
+        try:
+            await _worker
+        except asyncio.CancelledError:
+            pass
+        _worker = None
+    if _save_task is not None and not _save_task.done():
+        _save_task.cancel()
+    await save()
+    # The file is now the only copy; start() picks it up again.
+    _heap.clear()
+    _digest.update(since=None, lines=[], chat_ids=[])
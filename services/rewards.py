@@ -1,10 +1,14 @@
 from typing import Dict, Any, List, Tuple
-from datetime import datetime
+from datetime import datetime, time
 
-from ..utils.time import now_local, parse_db_dt
-from .attendance import is_late, is_unlimited_today
+from ..utils.time import now_local
+from . import ledger
+from .arrivals import today_board
+from .attendance import limit_for
+from .leaderboard import invalidate as invalidate_leaderboard
 
 OVERTIME_BANK_KEY = "overtime_minutes_bank"
+OVERTIME_FROM = time(18, 0)  # work after this counts as overtime
 
 
 def _safe_int(value: Any, default: int = 0) -> int:
@@ -25,37 +29,15 @@ def _today_earliest_per_user(db: Dict[str, Any]) -> List[Tuple[str, datetime]]:
     Return a list of (user_id, earliest_dt_today) sorted by time.
     Skips users with no check-in today or inactive users.
     """
-    today = now_local().date()
-    rows: List[Tuple[str, datetime]] = []
-
-    for uid, u in db.items():
-        if uid == "_config" or not isinstance(u, dict):
-            continue
-        if not u.get("active", False):   # 🔹 skip inactive users
-            continue
-
-        earliest: datetime | None = None
-        for rec in u.get("check_ins", []):
-            s = rec.get("datetime")
-            if not s:
-                continue
-            dt = parse_db_dt(s)
-            if dt.date() != today:
-                continue
-            if earliest is None or dt < earliest:
-                earliest = dt
-        if earliest is not None:
-            rows.append((uid, earliest))
-
-    rows.sort(key=lambda t: t[1])
-    return rows
+    board = today_board(db)
+    return board.top(len(board.order))
 
 def build_early_birds_ladder(db: Dict[str, Any]) -> str:
     """
     Build the text ladder for today's top-4 earliest check-ins.
     Only counts active users.
     """
-    order = _today_earliest_per_user(db)[:4]
+    order = today_board(db).top(4)
     if not order:
         return "🐦 Early-birds Ladder (امروز)\n— هنوز کسی وارد نشده —"
 
@@ -79,8 +61,7 @@ async def handle_early_bird_logic(db: Dict[str, Any], user_id: str) -> bool:
         return False
 
     today = _today_iso()
-    order = _today_earliest_per_user(db)[:4]
-    top_ids = [uid for uid, _ in order]
+    top_ids = today_board(db).top_ids(4)
 
     if user_id not in top_ids:
         return False
@@ -89,51 +70,63 @@ async def handle_early_bird_logic(db: Dict[str, Any], user_id: str) -> bool:
     if today in awarded:
         return False
 
-    u["points"] = _safe_int(u.get("points", 0)) + 1
+    ledger.post(u, 1, ledger.EARLY_BIRD, ref=today)
     awarded.append(today)
+    invalidate_leaderboard(db)
     return True
 
 
+def team_bonus_candidates(db: Dict[str, Any]) -> List[str]:
+    """
+    Active user IDs the team bonus would touch, or [] when it cannot apply yet
+    (someone active has not checked in today). Lets callers lock only when needed.
+    """
+    board = today_board(db)
+    if not board.everyone_arrived():
+        return []
+    return list(board.active)
+
+
 async def handle_team_checkin_bonus(db: Dict[str, Any]) -> List[str]:
     """
     If every active user checked in today before the limit, grant +1 point once per user.
     Returns the user IDs that received the bonus during this call.
     """
     today = _today_iso()
+    board = today_board(db)
 
-    # Skip when there is no active user or the day has no limit.
-    active_ids: List[str] = []
-    for uid, u in db.items():
-        if uid == "_config" or not isinstance(u, dict):
-            continue
-        if u.get("active", False):
-            active_ids.append(uid)
-
-    if not active_ids or await is_unlimited_today(db):
+    # Skip when someone active is missing or the day has no limit.
+    if not board.everyone_arrived():
         return []
-
-    earliest_today = _today_earliest_per_user(db)
-    if len(earliest_today) < len(active_ids):
+    limit_time = limit_for(db, board.day)
+    if limit_time is None:
         return []
 
     # Abort if any earliest check-in is marked late.
-    for _, dt in earliest_today:
-        if await is_late(db, dt):
-            return []
+    if board.arrived_by(limit_time) < len(board.active):
+        return []
 
     awarded_ids: List[str] = []
-    for uid in active_ids:
+    for uid in board.active:
         user = db.get(uid, {})
         awarded_dates = user.setdefault("team_awarded_dates", [])
         if today in awarded_dates:
             continue
-        user["points"] = _safe_int(user.get("points", 0)) + 1
+        ledger.post(user, 1, ledger.TEAM_BONUS, ref=today)
         awarded_dates.append(today)
         awarded_ids.append(uid)
 
+    if awarded_ids:
+        invalidate_leaderboard(db)
     return awarded_ids
 
 
+def overtime_after_hours(when: datetime) -> int:
+    """Whole minutes between OVERTIME_FROM and a check-out at `when` (0 if earlier)."""
+    start = when.replace(hour=OVERTIME_FROM.hour, minute=OVERTIME_FROM.minute, second=0, microsecond=0)
+    return (when - start).seconds // 60 if when > start else 0
+
+
 def accrue_overtime_points(user: Dict[str, Any], minutes: int) -> Tuple[int, int]:
     """
     Add overtime minutes to the user's bank and convert full hours to points.
@@ -147,6 +140,6 @@ def accrue_overtime_points(user: Dict[str, Any], minutes: int) -> Tuple[int, int
     user[OVERTIME_BANK_KEY] = remainder
 
     if points_added:
-        user["points"] = _safe_int(user.get("points", 0)) + points_added
+        ledger.post(user, points_added, ledger.OVERTIME)
 
     return points_added, remainder
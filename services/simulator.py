@@ -0,0 +1,176 @@
+"""
+What-if replay of the reward rules over stored attendance. History is
+loaded once (analytics.load) into dense user × day matrices of first
+arrival and last departure; each parameter set is then a handful of
+array operations, so sweeping hundreds of sets takes a moment. Works on
+copies only: nothing here writes to the document or the ledger.
+
+The replay follows rewards.py and yellow_cards.py: the top-N earliest
+active arrivals of a day get the early-bird point, everyone gets the
+team bonus on days every active user arrived on time, a late first
+check-in costs the yellow-card penalty, and overtime minutes after the
+threshold turn into a point per full hour.
+"""
+from datetime import date, datetime
+from itertools import product
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from ..models import day_number
+from . import analytics
+from .attendance import AttendancePolicy
+from .credits import POINT_VALUE
+from .rewards import OVERTIME_FROM
+from .yellow_cards import YELLOW_CARD_PENALTY
+
+_NEVER = np.iinfo(np.int64).max // 2  # "no limit" / "did not arrive" in comparisons
+
+
+def _minute_of(value: Any) -> int:
+    if isinstance(value, str):
+        value = datetime.strptime(value, "%H:%M").time()
+    return value.hour * 60 + value.minute
+
+
+class Params:
+    """
+    One rule set. checkin_limit replaces the default limit (weekday
+    overrides still apply); early_bird_window, when set, limits the
+    ladder to arrivals at most that many minutes before the day's limit.
+    """
+
+    __slots__ = (
+        "label", "checkin_limit", "early_bird_top", "early_bird_points", "early_bird_window",
+        "team_bonus", "yellow_penalty", "overtime_from",
+    )
+
+    def __init__(
+        self,
+        label: str = "",
+        *,
+        checkin_limit: Optional[str] = None,
+        early_bird_top: int = 4,
+        early_bird_points: int = 1,
+        early_bird_window: Optional[int] = None,
+        team_bonus: int = 1,
+        yellow_penalty: int = YELLOW_CARD_PENALTY,
+        overtime_from: Any = OVERTIME_FROM,
+    ):
+        self.label = label
+        self.checkin_limit = checkin_limit
+        self.early_bird_top = early_bird_top
+        self.early_bird_points = early_bird_points
+        self.early_bird_window = early_bird_window
+        self.team_bonus = team_bonus
+        self.yellow_penalty = yellow_penalty
+        self.overtime_from = _minute_of(overtime_from)
+
+    def describe(self) -> str:
+        if self.label:
+            return self.label
+        hh, mm = divmod(self.overtime_from, 60)
+        parts = [
+            f"limit={self.checkin_limit or 'current'}", f"top={self.early_bird_top}",
+            f"penalty={self.yellow_penalty}", f"overtime={hh:02d}:{mm:02d}",
+        ]
+        if self.early_bird_window is not None:
+            parts.append(f"window={self.early_bird_window}")
+        return " ".join(parts)
+
+
+class Outcome:
+    """Per-user points (indexed like History.uids) under one Params."""
+
+    __slots__ = ("params", "early_bird", "team", "overtime", "penalty", "points", "total", "payout")
+
+    def __init__(self, params: Params, early_bird: np.ndarray, team: np.ndarray,
+                 overtime: np.ndarray, penalty: np.ndarray):
+        self.params = params
+        self.early_bird = early_bird
+        self.team = team
+        self.overtime = overtime
+        self.penalty = penalty
+        self.points = early_bird + team + overtime - penalty
+        self.total = int(self.points.sum())
+        self.payout = self.total * POINT_VALUE
+
+
+class History:
+    """
+    First arrival and last departure (minute of day, -1 if none) for the
+    currently active users, one column per day of the range.
+    """
+
+    __slots__ = ("uids", "start", "arrive", "depart", "weekday", "cfg", "unlimited")
+
+    def __init__(self, db: Dict[str, Any], start: date, end: date):
+        uids = sorted(
+            uid for uid, u in db.items()
+            if uid != "_config" and isinstance(u, dict) and u.get("active", False)
+        )
+        frame = analytics.load(db, start, end, uids)
+        first_day, days = day_number(start), (end - start).days + 1
+        self.uids, self.start = frame.uids, start
+        self.arrive = np.full((len(uids), days), -1, dtype=np.int64)
+        self.depart = np.full((len(uids), days), -1, dtype=np.int64)
+        self.arrive[frame.user, frame.day - first_day] = frame.arrive
+        self.depart[frame.user, frame.day - first_day] = frame.depart
+        self.weekday = (np.arange(first_day, first_day + days) + 3) % 7  # day 0 was a Thursday
+        self.cfg = dict(db.get("_config") or {})
+        unlimited = [day_number(date.fromisoformat(d)) - first_day for d in self.cfg.get("unlimited_dates", [])]
+        self.unlimited = np.zeros(days, dtype=bool)
+        self.unlimited[[d for d in unlimited if 0 <= d < days]] = True
+
+    def limits(self, params: Params) -> np.ndarray:
+        """Latest on-time arrival per day (_NEVER on unlimited dates)."""
+        cfg = dict(self.cfg)
+        if params.checkin_limit:
+            cfg["checkin_limit"] = params.checkin_limit
+        rules = AttendancePolicy(cfg)
+        per_weekday = np.array([_minute_of(t) for t in rules.limits], dtype=np.int64)
+        return np.where(self.unlimited, _NEVER, per_weekday[self.weekday])
+
+    def run(self, params: Params) -> Outcome:
+        arrive, depart = self.arrive, self.depart
+        n, days = arrive.shape
+        arrived = arrive >= 0
+        limit = self.limits(params)
+        late = arrived & (arrive > limit)
+
+        # Early birds: the top-N arrivals of each day, ties in user-id order as on the live board.
+        eligible = arrived
+        if params.early_bird_window is not None:
+            eligible = eligible & ((limit == _NEVER) | (arrive >= limit - params.early_bird_window))
+        keyed = np.where(eligible, arrive, _NEVER)
+        early = np.zeros((n, days), dtype=bool)
+        top = min(params.early_bird_top, n)
+        if top > 0:
+            order = np.argsort(keyed, axis=0, kind="stable")[:top]
+            cols = np.broadcast_to(np.arange(days), order.shape)
+            early[order, cols] = np.take_along_axis(keyed, order, axis=0) < _NEVER
+        early_bird = early.sum(axis=1) * params.early_bird_points
+
+        # Team bonus: every active user arrived and nobody was late, on days with a limit.
+        team_days = arrived.all(axis=0) & ~late.any(axis=0) & (limit != _NEVER) if n else np.zeros(days, bool)
+        team = np.full(n, int(team_days.sum()) * params.team_bonus, dtype=np.int64)
+
+        # Overtime accrues across days into a bank that pays a point per full hour.
+        extra = np.where(arrived & (depart > params.overtime_from), depart - params.overtime_from, 0)
+        overtime = extra.sum(axis=1) // 60
+
+        penalty = late.sum(axis=1) * params.yellow_penalty
+        return Outcome(params, early_bird.astype(np.int64), team, overtime.astype(np.int64), penalty.astype(np.int64))
+
+    def sweep(self, param_sets: Iterable[Params]) -> List[Outcome]:
+        return [self.run(p) for p in param_sets]
+
+
+def grid(**choices: Iterable[Any]) -> List[Params]:
+    """Every combination of the given Params keyword values, e.g. grid(yellow_penalty=[1, 2, 3])."""
+    keys = list(choices)
+    return [Params(**dict(zip(keys, values))) for values in product(*(list(choices[k]) for k in keys))]
+
+
+def simulate(db: Dict[str, Any], start: date, end: date, param_sets: Iterable[Params]) -> List[Outcome]:
+    return History(db, start, end).sweep(param_sets)
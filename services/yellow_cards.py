@@ -1,37 +1,59 @@
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
+from ..models import yellow_cards
 from ..utils.time import now_local
+from . import ledger
 from .attendance import is_late
+from .leaderboard import invalidate as invalidate_leaderboard
 
 YELLOW_CARD_PENALTY = 2
 
 
-def _safe_int(value: Any, default: int = 0) -> int:
-    try:
-        return int(value)
-    except (TypeError, ValueError):
-        return default
-
 async def maybe_add_yellow(db: Dict[str, Any], user: Dict[str, Any], when: datetime) -> bool:
     """
     If the user is late, give them a yellow card and apply the point penalty.
     Only one yellow card per day is allowed.
     Returns True if a new card was given.
     """
-    if not await is_late(db, when):
+    if not is_late(db, when):
         return False
 
-    today = now_local().date().isoformat()
-    cards = user.setdefault("yellow_cards", [])
+    cards = yellow_cards(user)
+    if cards.has_day(now_local().date()):
+        return False
 
-    # check if user already has a card for today
-    for rec in cards:
-        if today in rec:   # rec is "تاخیر در ورود در YYYY-MM-DD HH:MM"
-            return False
+    card = cards.add(when, "late", penalty=YELLOW_CARD_PENALTY)
+    ledger.post(user, -YELLOW_CARD_PENALTY, ledger.LATE_PENALTY, ref=card["id"], when=when)
+    invalidate_leaderboard(db)
+    return True
 
-    msg = f"تاخیر در ورود در {when.strftime('%Y-%m-%d %H:%M')}"
-    cards.append(msg)
 
-    current_points = _safe_int(user.get("points", 0))
-    user["points"] = current_points - YELLOW_CARD_PENALTY
-    return True
+def give_admin_card(user: Dict[str, Any], reason: str) -> Dict[str, Any]:
+    """A yellow card issued by an admin (no point penalty)."""
+    return yellow_cards(user).add(now_local(), "admin", reason=reason, penalty=0)
+
+
+def remove_card(
+    db: Dict[str, Any], user: Dict[str, Any], card_id: str, *, refund: bool = False
+) -> Tuple[Optional[Dict[str, Any]], int]:
+    """
+    Remove a card by id. With `refund`, the penalty it cost is given back
+    (cards converted from the old text format have no recorded penalty).
+    Returns (card or None, points refunded).
+    """
+    card = yellow_cards(user).remove(card_id)
+    if card is None or not refund:
+        return card, 0
+    penalty = int(card.get("penalty") or 0)
+    if penalty > 0:
+        ledger.post(user, penalty, ledger.PENALTY_REFUND, ref=card_id)
+        invalidate_leaderboard(db)
+    return card, penalty
+
+
+def migrated_users(db: Dict[str, Any]) -> List[str]:
+    """Users whose cards were converted from the old text format on load."""
+    return [
+        uid for uid, user in db.items()
+        if uid != "_config" and isinstance(user, dict) and yellow_cards(user).migrated
+    ]
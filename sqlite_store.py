@@ -0,0 +1,357 @@
+"""
+SQLite persistence for the same document shape storage.py serves.
+
+Nested per-user lists live in their own tables, one row per record in list
+order (seq). A save rewrites only the rows past the first record that
+changed since the last save, so appending a record is one INSERT.
+"""
+import json
+import logging
+import re
+import sqlite3
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .config import SQLITE_FILE
+from .models import AttendanceLog
+
+log = logging.getLogger(__name__)
+
+_conn: Optional[sqlite3.Connection] = None
+
+_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id      TEXT PRIMARY KEY,
+    username     TEXT NOT NULL DEFAULT '',
+    display_name TEXT NOT NULL DEFAULT '',
+    points       INTEGER NOT NULL DEFAULT 0,
+    active       INTEGER NOT NULL DEFAULT 0,
+    extra        TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS check_ins (
+    user_id TEXT NOT NULL,
+    seq     INTEGER NOT NULL,
+    date    TEXT NOT NULL,
+    time    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS check_ins_user_seq ON check_ins(user_id, seq);
+CREATE TABLE IF NOT EXISTS check_outs (
+    user_id TEXT NOT NULL,
+    seq     INTEGER NOT NULL,
+    date    TEXT NOT NULL,
+    time    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS check_outs_user_seq ON check_outs(user_id, seq);
+CREATE TABLE IF NOT EXISTS yellow_cards (
+    user_id TEXT NOT NULL,
+    seq     INTEGER NOT NULL,
+    date    TEXT,
+    data    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS yellow_cards_user_seq ON yellow_cards(user_id, seq);
+CREATE TABLE IF NOT EXISTS tasks (
+    user_id TEXT NOT NULL,
+    seq     INTEGER NOT NULL,
+    task_id TEXT,
+    done    INTEGER NOT NULL DEFAULT 0,
+    data    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_user_seq ON tasks(user_id, done, seq);
+CREATE TABLE IF NOT EXISTS withdrawals (
+    user_id TEXT NOT NULL,
+    seq     INTEGER NOT NULL,
+    date    TEXT,
+    status  TEXT NOT NULL,
+    amount  INTEGER NOT NULL DEFAULT 0,
+    data    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS withdrawals_user_seq ON withdrawals(user_id, seq);
+CREATE TABLE IF NOT EXISTS ledger (
+    user_id TEXT NOT NULL,
+    seq     INTEGER NOT NULL,
+    ts      TEXT NOT NULL,
+    amount  INTEGER NOT NULL,
+    reason  TEXT NOT NULL,
+    ref     TEXT
+);
+CREATE INDEX IF NOT EXISTS ledger_user_seq ON ledger(user_id, seq);
+CREATE TABLE IF NOT EXISTS config (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+-- Reads are served from the loaded document and its in-memory indexes;
+-- the tables are only ever read back whole, so only (user_id, seq) is indexed.
+DROP INDEX IF EXISTS check_ins_user_date;
+DROP INDEX IF EXISTS check_ins_date_time;
+DROP INDEX IF EXISTS check_outs_user_date;
+DROP INDEX IF EXISTS yellow_cards_user_date;
+DROP INDEX IF EXISTS tasks_user;
+DROP INDEX IF EXISTS withdrawals_user_date;
+DROP INDEX IF EXISTS withdrawals_status;
+DROP INDEX IF EXISTS ledger_user_ts;
+"""
+
+# User fields that have their own column or table; everything else goes to `extra`.
+_COLUMNS = ("username", "display_name", "points", "active")
+_LISTS = ("check_ins", "check_outs", "yellow_cards", "tasks", "tasks_done", "withdrawals", "ledger")
+_USER_TABLES = ("users", "check_ins", "check_outs", "yellow_cards", "tasks", "withdrawals", "ledger")
+
+
+def connect() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        conn = sqlite3.connect(SQLITE_FILE, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _conn = conn
+    return _conn
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _safe_int(value: Any) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _date_of(value: Any) -> Optional[str]:
+    """Best-effort YYYY-MM-DD for a record (dict with datetime/date, or free text)."""
+    if isinstance(value, dict):
+        value = value.get("date") or value.get("datetime")
+    if not isinstance(value, str):
+        return None
+    m = _DATE_RE.search(value)
+    return m.group(0) if m else None
+
+
+def _split_dt(rec: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    dt = rec.get("datetime") if isinstance(rec, dict) else None
+    if not isinstance(dt, str) or " " not in dt:
+        return None
+    day, hhmm = dt.split(" ", 1)
+    return day, hhmm
+
+
+# Per user table: the rows of one list field, the INSERT for them and the
+# WHERE clause that selects that list's rows. Tasks share a table.
+_TABLES: Dict[str, Tuple[str, str, str]] = {
+    "check_ins": ("check_ins", "(user_id, seq, date, time) VALUES (?, ?, ?, ?)", "1"),
+    "check_outs": ("check_outs", "(user_id, seq, date, time) VALUES (?, ?, ?, ?)", "1"),
+    "yellow_cards": ("yellow_cards", "(user_id, seq, date, data) VALUES (?, ?, ?, ?)", "1"),
+    "tasks": ("tasks", "(user_id, seq, task_id, done, data) VALUES (?, ?, ?, 0, ?)", "done = 0"),
+    "tasks_done": ("tasks", "(user_id, seq, task_id, done, data) VALUES (?, ?, ?, 1, ?)", "done = 1"),
+    "withdrawals": ("withdrawals", "(user_id, seq, date, status, amount, data) VALUES (?, ?, ?, ?, ?, ?)", "1"),
+    "ledger": ("ledger", "(user_id, seq, ts, amount, reason, ref) VALUES (?, ?, ?, ?, ?, ?)", "1"),
+}
+
+# What is stored, per (user id, list field) and per user row: set by the
+# last save or load_all. A list missing here is rewritten in full once.
+_written: Dict[Tuple[str, str], List[Optional[tuple]]] = {}
+_written_users: Dict[str, tuple] = {}
+
+
+def _rows(field: str, records: List[Any]) -> List[Optional[tuple]]:
+    """Row values (without user_id and seq) per record; None for one that has no row."""
+    if field in ("check_ins", "check_outs"):
+        return [_split_dt(rec) for rec in records]
+    if field == "yellow_cards":
+        return [(_date_of(c), _dumps(c)) for c in records]
+    if field in ("tasks", "tasks_done"):
+        return [(t.get("id") if isinstance(t, dict) else None, _dumps(t)) for t in records]
+    if field == "withdrawals":
+        return [(_date_of(w), w.get("status") or "", _safe_int(w.get("amount", 0)), _dumps(w)) for w in records]
+    return [(e.get("ts") or "", _safe_int(e.get("amount")), e.get("reason") or "", e.get("ref")) for e in records]
+
+
+def _write_list(
+    conn: sqlite3.Connection, uid: str, field: str, rows: List[Optional[tuple]], old: Optional[List[Optional[tuple]]]
+) -> None:
+    """Bring one list's rows from `old` to `rows`: keep the common prefix, rewrite the rest."""
+    table, insert, where = _TABLES[field]
+    keep = 0
+    if old is not None:
+        limit = min(len(old), len(rows))
+        if old[:limit] == rows[:limit]:
+            keep = limit  # the usual case: records were only appended
+        else:
+            while old[keep] == rows[keep]:
+                keep += 1
+        if keep < len(old):
+            conn.execute(f"DELETE FROM {table} WHERE user_id = ? AND {where} AND seq >= ?", (uid, keep))
+    else:
+        conn.execute(f"DELETE FROM {table} WHERE user_id = ? AND {where}", (uid,))
+    new = []
+    for seq in range(keep, len(rows)):
+        if rows[seq] is None:
+            log.warning("user %s: %s record %d has no valid datetime; not stored", uid, field, seq)
+        else:
+            new.append((uid, seq) + rows[seq])
+    conn.executemany(f"INSERT INTO {table} {insert}", new)
+
+
+def _user_row(uid: str, user: Dict[str, Any]) -> tuple:
+    extra = {k: v for k, v in user.items() if k not in _COLUMNS and k not in _LISTS}
+    return (
+        uid,
+        user.get("username") or "",
+        user.get("display_name") or "",
+        _safe_int(user.get("points", 0)),
+        1 if user.get("active", False) else 0,
+        _dumps(extra),
+    )
+
+
+def _delete_user(conn: sqlite3.Connection, uid: str) -> None:
+    for table in _USER_TABLES:
+        conn.execute(f"DELETE FROM {table} WHERE user_id = ?", (uid,))
+
+
+def _save_config(conn: sqlite3.Connection, cfg: Optional[Dict[str, Any]]) -> None:
+    conn.execute("DELETE FROM config")
+    if cfg:
+        conn.executemany(
+            "INSERT INTO config (key, value) VALUES (?, ?)",
+            [(k, _dumps(v)) for k, v in cfg.items()],
+        )
+
+
+def save(db: Dict[str, Any], changed: Optional[Iterable[str]] = None) -> None:
+    """
+    Write the given top-level keys (all of them when `changed` is None) in one
+    SQLite transaction. Keys missing from `db` are deleted. Only rows that
+    differ from what was last written are touched, so appending a record
+    costs one INSERT however long the history.
+    """
+    conn = connect()
+    written: Dict[Tuple[str, str], List[Optional[tuple]]] = {}
+    users: Dict[str, Optional[tuple]] = {}
+    with conn:
+        if changed is None:
+            keys: List[str] = list(db)
+            stale = {row[0] for row in conn.execute("SELECT user_id FROM users")} - set(keys)
+            keys.extend(stale)
+        else:
+            keys = list(dict.fromkeys(changed))
+        for key in keys:
+            if key == "_config":
+                _save_config(conn, db.get("_config"))
+                continue
+            user = db.get(key)
+            if not isinstance(user, dict):
+                _delete_user(conn, key)
+                users[key] = None
+                continue
+            row = _user_row(key, user)
+            if _written_users.get(key) != row:
+                conn.execute(
+                    "INSERT OR REPLACE INTO users (user_id, username, display_name, points, active, extra) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    row,
+                )
+            users[key] = row
+            for field in _TABLES:
+                records = user.get(field) or []
+                if isinstance(records, AttendanceLog):
+                    records = records.to_json()  # iteration skips unparsable records
+                rows = _rows(field, records)
+                _write_list(conn, key, field, rows, _written.get((key, field)))
+                written[(key, field)] = rows
+    # Only what was committed counts as written.
+    for key, row in users.items():
+        if row is None:
+            _written_users.pop(key, None)
+            for field in _TABLES:
+                _written.pop((key, field), None)
+        else:
+            _written_users[key] = row
+    _written.update(written)
+
+
+def load_all() -> Dict[str, Any]:
+    """Rebuild the JSON-shaped document from the tables."""
+    conn = connect()
+    db: Dict[str, Any] = {}
+    cfg = {k: json.loads(v) for k, v in conn.execute("SELECT key, value FROM config")}
+    if cfg:
+        db["_config"] = cfg
+
+    for uid, username, display_name, points, active, extra in conn.execute(
+        "SELECT user_id, username, display_name, points, active, extra FROM users"
+    ):
+        user = json.loads(extra)
+        user.update(
+            username=username,
+            display_name=display_name,
+            points=points,
+            active=bool(active),
+        )
+        for key in _LISTS:
+            user[key] = []
+        db[uid] = user
+
+    for table in ("check_ins", "check_outs"):
+        for uid, day, hhmm in conn.execute(f"SELECT user_id, date, time FROM {table} ORDER BY user_id, seq"):
+            if uid in db:
+                db[uid][table].append({"datetime": f"{day} {hhmm}"})
+    for uid, data in conn.execute("SELECT user_id, data FROM yellow_cards ORDER BY user_id, seq"):
+        if uid in db:
+            db[uid]["yellow_cards"].append(json.loads(data))
+    for uid, done, data in conn.execute("SELECT user_id, done, data FROM tasks ORDER BY user_id, done, seq"):
+        if uid in db:
+            db[uid]["tasks_done" if done else "tasks"].append(json.loads(data))
+    for uid, data in conn.execute("SELECT user_id, data FROM withdrawals ORDER BY user_id, seq"):
+        if uid in db:
+            db[uid]["withdrawals"].append(json.loads(data))
+    for uid, ts, amount, reason, ref in conn.execute(
+        "SELECT user_id, ts, amount, reason, ref FROM ledger ORDER BY user_id, seq"
+    ):
+        if uid in db:
+            db[uid]["ledger"].append({"ts": ts, "amount": amount, "reason": reason, "ref": ref})
+
+    # What was just read is what is stored, so the next save diffs against
+    # it. A list whose seq numbers have gaps is rewritten in full once.
+    gapped = set()
+    for field, (table, _, where) in _TABLES.items():
+        for uid, count, last in conn.execute(
+            f"SELECT user_id, COUNT(*), MAX(seq) FROM {table} WHERE {where} GROUP BY user_id"
+        ):
+            if count != last + 1:
+                gapped.add((uid, field))
+    _written.clear()
+    _written_users.clear()
+    for uid, user in db.items():
+        if uid == "_config":
+            continue
+        _written_users[uid] = _user_row(uid, user)
+        for field in _TABLES:
+            if (uid, field) not in gapped:
+                _written[(uid, field)] = _rows(field, user[field])
+    return db
+
+
+def checkpoint() -> None:
+    """Fold the WAL back into the main database file."""
+    connect().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def migrate_from_json() -> int:
+    """
+    One-shot import of DATA_FILE (plus any journal tail) into SQLITE_FILE.
+    Returns the number of users written.
+    """
+    from .storage import _load_snapshot, _replay_journal
+
+    db = _load_snapshot()
+    _replay_journal(db)
+    save(db)
+    return sum(1 for k in db if k != "_config")
+
+
+if __name__ == "__main__":
+    print(f"migrated {migrate_from_json()} users into {SQLITE_FILE}")
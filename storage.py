@@ -1,9 +1,39 @@
+import copy
 import json
+import os
 import asyncio
-from typing import Any, Dict, Optional
-from .config import DATA_FILE
+from concurrent.futures import ThreadPoolExecutor
+from types import TracebackType
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Type, Union
+from . import sqlite_store
+from .models import hydrate, hydrate_user, to_json
+from .services import directory
+from .utils.locks import LockManager
+from .config import (
+    STORAGE_BACKEND, DATA_FILE, JOURNAL_FILE, JOURNAL_ENABLED, JOURNAL_COMPACT_EVERY,
+    STORAGE_RESIDENT, WRITE_BEHIND_DELAY, WRITE_BEHIND_MAX_DELAY,
+)
 
-_lock = asyncio.Lock()
+_lock = asyncio.Lock()        # guards the file / database handle
+# One worker thread keeps disk writes off the event loop and in submission order.
+_io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage-io")
+_version = 0                  # bumped on every committed transaction
+
+# Transactions lock only the records they touch. Lock-only keys serialize
+# operations that span users (team bonus, transfers) without being written.
+locks = LockManager()
+CROSS_USER = "_cross_user"
+_journal_entries = 0          # records appended since the last snapshot
+_compaction: Optional["asyncio.Task[None]"] = None
+
+# Resident mode: the parsed DB lives here and dirty keys are flushed write-behind.
+_resident: Optional[Dict[str, Any]] = None
+_dirty: Set[str] = set()
+_dirty_all = False
+_first_dirty_at = 0.0
+_last_dirty_at = 0.0
+_flush_task: Optional["asyncio.Task[None]"] = None
+_records: Dict[str, str] = {}   # compact JSON of each resident record as last persisted
 
 DEFAULT_USER = {
     "username": "",
@@ -21,18 +51,364 @@ DEFAULT_USER = {
     "active": False,   # 🔹 NEW: user is inactive by default
 }
 
+
+def _load_snapshot() -> Dict[str, Any]:
+    try:
+        with open(DATA_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _replay_journal(db: Dict[str, Any]) -> int:
+    """
+    Apply journal records on top of the snapshot, in order.
+    Each line is {"key": ..., "value": ...}; a null value deletes the key.
+    A torn last line (crash mid-append) is ignored.
+    """
+    count = 0
+    try:
+        with open(JOURNAL_FILE, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                key = rec.get("key")
+                if key is None:
+                    continue
+                if rec.get("value") is None:
+                    db.pop(key, None)
+                else:
+                    db[key] = rec["value"]
+                count += 1
+    except FileNotFoundError:
+        pass
+    return count
+
+
+def _load() -> Dict[str, Any]:
+    global _journal_entries
+    if STORAGE_BACKEND == "sqlite":
+        return hydrate(sqlite_store.load_all())
+    db = _load_snapshot()
+    _journal_entries = _replay_journal(db)
+    return hydrate(db)
+
+
+def _load_resident() -> Dict[str, Any]:
+    """Load and pre-encode every record while the document is still private."""
+    global _records
+    db = _load()
+    if STORAGE_BACKEND != "sqlite":
+        _records = {k: _encode(v) for k, v in db.items()}
+    return db
+
+
+def _encode(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=to_json)
+
+
+def _fsync_dir(path: str) -> None:
+    if os.name != "posix":
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_atomic(path: str, text: Union[str, bytes]) -> None:
+    """Temp file + fsync + os.replace: a crash leaves the old file or the new one, never half."""
+    tmp = path + ".tmp"
+    with (open(tmp, "wb") if isinstance(text, bytes) else open(tmp, "w", encoding="utf-8")) as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(path)
+
+
+def _write_snapshot(text: str) -> None:
+    global _journal_entries
+    _write_atomic(DATA_FILE, text)
+    # Records are full values, so replaying a stale journal over the new
+    # snapshot is harmless if we crash before the journal is removed.
+    try:
+        os.remove(JOURNAL_FILE)
+    except FileNotFoundError:
+        pass
+    _journal_entries = 0
+
+
+def _write_snapshot_records(records: Dict[str, str]) -> None:
+    body = ",\n".join(f"{_encode(k)}:{v}" for k, v in records.items())
+    _write_snapshot("{\n" + body + "\n}\n")
+
+
+def _dump_snapshot(db: Dict[str, Any]) -> None:
+    _write_snapshot(json.dumps(db, ensure_ascii=False, indent=2, default=to_json))
+
+
+def _append_journal(lines: List[str]) -> None:
+    global _journal_entries
+    if not lines:
+        return
+    with open(JOURNAL_FILE, "a", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    _journal_entries += len(lines)
+
+
+def _journal_line(key: str, encoded: str) -> str:
+    return f'{{"key":{_encode(key)},"value":{encoded}}}'
+
+
+def _journal_records(db: Dict[str, Any], keys: List[str]) -> None:
+    _append_journal([_journal_line(k, _encode(db.get(k))) for k in keys])
+
+
+def _compact_from_disk() -> None:
+    _dump_snapshot(_load())
+
+
+async def _in_io(fn: Callable[..., Any], *args: Any) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(_io, fn, *args)
+
+
+def _encode_records(db: Dict[str, Any], keys: Optional[List[str]]) -> None:
+    """Refresh the resident record cache on the loop, where `db` is consistent."""
+    global _records
+    if keys is None:
+        _records = {k: _encode(v) for k, v in db.items()}
+        return
+    for key in keys:
+        if key in db:
+            _records[key] = _encode(db[key])
+        else:
+            _records.pop(key, None)
+
+
+async def _persist(db: Dict[str, Any], changed: Optional[Iterable[str]]) -> None:
+    """
+    Write through the I/O thread. Resident records are encoded (or, for
+    SQLite, deep-copied) on the loop before handing off, since handlers
+    keep mutating the shared document meanwhile. That is O(size of the
+    changed records), not of the document; the SQLite thread then writes
+    only the rows that differ.
+    """
+    keys = None if changed is None else list(dict.fromkeys(changed))
+    if STORAGE_BACKEND == "sqlite":
+        if STORAGE_RESIDENT:
+            db = copy.deepcopy(db if keys is None else {k: db[k] for k in keys if k in db})
+        await _in_io(sqlite_store.save, db, keys)
+        return
+    if not STORAGE_RESIDENT:
+        # The document is private to this transaction; encode it off the loop too.
+        if keys is None or not JOURNAL_ENABLED:
+            await _in_io(_dump_snapshot, db)
+        else:
+            await _in_io(_journal_records, db, keys)
+        return
+    if keys is None or not JOURNAL_ENABLED:
+        _encode_records(db, None)
+        await _in_io(_write_snapshot_records, dict(_records))
+    else:
+        _encode_records(db, keys)
+        await _in_io(_append_journal, [_journal_line(k, _records.get(k, "null")) for k in keys])
+
+
 async def read_all() -> Dict[str, Any]:
+    """
+    Return the database. In resident mode this is the shared in-memory
+    document, parsed from disk only on first use.
+    """
+    global _resident
+    if STORAGE_RESIDENT:
+        if _resident is None:
+            async with _lock:
+                if _resident is None:
+                    _resident = await _in_io(_load_resident)
+        return _resident
     async with _lock:
-        try:
-            with open(DATA_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
+        return await _in_io(_load)
 
-async def write_all(db: Dict[str, Any]) -> None:
+
+async def write_all(db: Dict[str, Any], changed: Optional[Iterable[str]] = None) -> None:
+    """
+    Persist the database.
+    With `changed` (top-level keys such as user ids or "_config") only those
+    records are appended to the journal; keys missing from `db` are journaled
+    as deletions. Without it the whole document is rewritten.
+    In resident mode the keys are only marked dirty and flushed write-behind.
+    """
+    if STORAGE_RESIDENT:
+        _mark_dirty(db, changed)
+        return
+    async with _lock:
+        await _persist(db, changed)
+    if _journal_entries >= JOURNAL_COMPACT_EVERY:
+        _schedule_compaction()
+
+
+def _mark_dirty(db: Dict[str, Any], changed: Optional[Iterable[str]]) -> None:
+    global _resident, _dirty_all, _first_dirty_at, _last_dirty_at, _flush_task
+    if db is not _resident:
+        # A caller built its own document; it becomes the resident one.
+        _resident = db
+        changed = None
+    now = asyncio.get_running_loop().time()
+    if not _dirty and not _dirty_all:
+        _first_dirty_at = now
+    _last_dirty_at = now
+    if changed is None:
+        _dirty_all = True
+    else:
+        _dirty.update(changed)
+    if _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.get_running_loop().create_task(_flush_later())
+
+
+def _take_dirty() -> Optional[List[str]]:
+    global _dirty_all
+    changed = None if _dirty_all else list(_dirty)
+    _dirty.clear()
+    _dirty_all = False
+    return changed
+
+
+async def _flush_later() -> None:
+    """Debounce: wait for a quiet period, but never past the max delay."""
+    loop = asyncio.get_running_loop()
+    while True:
+        due = min(_last_dirty_at + WRITE_BEHIND_DELAY, _first_dirty_at + WRITE_BEHIND_MAX_DELAY)
+        wait = due - loop.time()
+        if wait <= 0:
+            break
+        await asyncio.sleep(wait)
+    await flush()
+
+
+async def flush() -> None:
+    """Write dirty resident state to disk now (also called on shutdown)."""
+    if _resident is None or (not _dirty and not _dirty_all):
+        return
     async with _lock:
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(db, f, ensure_ascii=False, indent=2)
+        await _persist(_resident, _take_dirty())
+    if _journal_entries >= JOURNAL_COMPACT_EVERY:
+        _schedule_compaction()
+
+
+async def compact() -> None:
+    """Fold the journal into a fresh snapshot."""
+    async with _lock:
+        if STORAGE_BACKEND == "sqlite":
+            await _in_io(sqlite_store.checkpoint)
+        elif _resident is not None:
+            # Pending changes go straight into the snapshot instead of the journal.
+            if _dirty or _dirty_all:
+                _encode_records(_resident, _take_dirty())
+            await _in_io(_write_snapshot_records, dict(_records))
+        else:
+            await _in_io(_compact_from_disk)
+
+
+def _schedule_compaction() -> None:
+    global _compaction
+    if _compaction is not None and not _compaction.done():
+        return
+    _compaction = asyncio.get_running_loop().create_task(compact())
+
+
+async def save_json(path: str, value: Any) -> None:
+    """Atomically write a side file (outbox, ...) on the storage I/O thread."""
+    await _in_io(_write_atomic, path, _encode(value))
+
+
+async def run_io(fn: Callable[..., Any], *args: Any) -> Any:
+    """Run blocking side-file work (archive merging, ...) on the storage I/O thread."""
+    return await _in_io(fn, *args)
+
+
+async def save_bytes(path: str, data: bytes) -> None:
+    """Atomically write a binary side file (archives) on the storage I/O thread."""
+    await _in_io(_write_atomic, path, data)
+
+
+def load_json(path: str, default: Any) -> Any:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+
+def version() -> int:
+    """Commit counter; a reader that sees it unchanged saw no writes in between."""
+    return _version
+
+
+class Transaction:
+    """
+    Unit of work holding the records it changes from read to write:
+
+        async with storage.transaction(user_id) as db:
+            ...mutate db[user_id]...
+
+    `keys` are the top-level records the body changes; they are locked in
+    sorted order and written on exit. touch() adds keys to write that the
+    body discovers (they must be covered by `keys` or `lock`). `lock` names
+    extra lock-only keys such as CROSS_USER. With neither, the transaction
+    holds the whole DB exclusively and writes the whole document.
+    Read-only paths keep using read_all() without locking and may compare
+    version() to detect commits. Bodies must not talk to Telegram: keep the
+    lock span to the mutation.
+    """
+
+    def __init__(self, keys: Iterable[str], lock: Iterable[str] = ()):
+        self._keys = list(keys)
+        self._lock_keys = self._keys + list(lock)
+        self._whole = not self._lock_keys
+        self._held: List[str] = []
+        self._db: Optional[Dict[str, Any]] = None
+
+    def touch(self, *keys: str) -> None:
+        self._keys.extend(keys)
+
+    async def __aenter__(self) -> Dict[str, Any]:
+        # Per-record locking is only safe when writes are per record too.
+        keyed = STORAGE_RESIDENT or JOURNAL_ENABLED or STORAGE_BACKEND == "sqlite"
+        self._held = await locks.acquire(self._lock_keys if keyed else ())
+        try:
+            self._db = await read_all()
+        except BaseException:
+            await locks.release(self._held)
+            raise
+        return self._db
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        global _version
+        try:
+            # A failed body is discarded, except in resident mode where the
+            # shared document already holds its changes and must stay in sync.
+            if (exc_type is None or STORAGE_RESIDENT) and (self._whole or self._keys):
+                _version += 1
+                await write_all(self._db, None if self._whole else self._keys)
+        finally:
+            self._db = None
+            await locks.release(self._held)
+
+
+def transaction(*keys: str, lock: Iterable[str] = ()) -> Transaction:
+    return Transaction(keys, lock)
+
 
 async def ensure_config(db: Dict[str, Any]) -> Dict[str, Any]:
     cfg = db.setdefault("_config", {})
@@ -47,9 +423,16 @@ async def get_user(
     username: Optional[str] = None,
     first_name: Optional[str] = None,
 ) -> Dict[str, Any]:
-    user = db.setdefault(uid, DEFAULT_USER.copy())
-    if username is not None and user.get("username") != username:
+    created = uid not in db
+    if created:
+        db[uid] = copy.deepcopy(DEFAULT_USER)
+        hydrate_user(db[uid])
+    user = db[uid]
+    renamed = username is not None and user.get("username") != username
+    if renamed:
         user["username"] = username
     if first_name is not None:
         user["first_name"] = first_name
+    if created or renamed:
+        directory.record(db, uid)
     return user
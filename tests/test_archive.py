@@ -0,0 +1,56 @@
+import asyncio
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from datetime import date, datetime
+from pathlib import Path
+
+# The repository root is the package itself.
+_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_ROOT.parent))
+pkg = _ROOT.name
+storage = importlib.import_module(f"{pkg}.storage")
+archive = importlib.import_module(f"{pkg}.services.archive")
+ledger = importlib.import_module(f"{pkg}.services.ledger")
+
+
+class ArchiveLedgerTest(unittest.TestCase):
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+    def test_closed_ledger_months_are_archived_and_carried_forward(self):
+        async def run():
+            db = await storage.read_all()
+            user = await storage.get_user(db, "1", username="a")
+            ledger.post(user, 3, ledger.EARLY_BIRD, when=datetime(2026, 7, 3, 8, 0))
+            ledger.post(user, -2, ledger.LATE_PENALTY, when=datetime(2026, 8, 4, 9, 0))
+            ledger.post(user, 1, ledger.TEAM_BONUS, when=datetime(2026, 10, 6, 8, 30))
+            await storage.write_all(db, ["1"])
+
+            moved = await archive.archive_closed_months(date(2026, 10, 17))
+            self.assertEqual(moved.get("ledger"), 2)
+            self.assertEqual([e["reason"] for e in user["ledger"]], [ledger.CARRIED_FORWARD, ledger.TEAM_BONUS])
+            self.assertEqual(user["ledger"][0]["amount"], 1)
+            self.assertEqual(ledger.recompute(user), user["points"])
+            self.assertEqual(ledger.verify(db), [])
+            self.assertEqual([e["amount"] for e in archive.load_month("2026-07")["1"]["ledger"]], [3])
+            self.assertEqual([e["amount"] for e in archive.load_month("2026-08")["1"]["ledger"]], [-2])
+
+            # Nothing left to move; a second run changes nothing.
+            self.assertEqual(await archive.archive_closed_months(date(2026, 10, 17)), {})
+            self.assertEqual(len(archive.load_month("2026-07")["1"]["ledger"]), 1)
+            await storage.flush()
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
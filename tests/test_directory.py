@@ -0,0 +1,33 @@
+import importlib
+import sys
+import unittest
+from pathlib import Path
+
+# The repository root is the package itself.
+_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_ROOT.parent))
+directory = importlib.import_module(f"{_ROOT.name}.services.directory")
+
+
+class DirectoryLookupTest(unittest.TestCase):
+    def setUp(self):
+        self.db = {
+            "1": {"username": "ali", "display_name": "Reza"},
+            "2": {"username": "bob", "display_name": "Ali"},
+            "3": {"username": "sara", "display_name": "Ali"},
+        }
+
+    def test_exact_username_wins_over_display_names(self):
+        self.assertEqual(directory.resolve(self.db, "ali"), "1")
+        self.assertEqual(directory.resolve(self.db, "@ALI"), "1")
+
+    def test_display_name_is_the_fallback(self):
+        self.assertEqual(directory.resolve(self.db, "reza"), "1")
+        del self.db["1"]
+        directory.forget(self.db, "1")
+        self.assertEqual(directory.directory(self.db).lookup("ali"), {"2", "3"})
+        self.assertIsNone(directory.resolve(self.db, "ali"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import asyncio
+import importlib
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# The repository root is the package itself.
+_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_ROOT.parent))
+storage = importlib.import_module(f"{_ROOT.name}.storage")
+
+
+def _journal():
+    with open(storage.JOURNAL_FILE, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def _snapshot():
+    with open(storage.DATA_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _points(db):
+    """uid → points; records also carry the empty logs added when they are hydrated."""
+    return {k: v["points"] for k, v in db.items() if k != "_config"}
+
+
+class JournalTest(unittest.TestCase):
+    """Journaled writes without the resident document: every read replays from disk."""
+
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+        importlib.reload(storage)  # a fresh process: no resident document, no open locks
+        storage.STORAGE_RESIDENT = False
+        storage.JOURNAL_ENABLED = True
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+        importlib.reload(storage)
+
+    def test_changed_records_are_appended_and_replayed(self):
+        async def run():
+            async with storage.transaction() as db:
+                db["1"] = {"username": "a", "points": 1}
+                db["2"] = {"username": "b", "points": 2}
+            async with storage.transaction("1") as db:
+                db["1"]["points"] = 5
+            async with storage.transaction("2") as db:
+                del db["2"]
+            return await storage.read_all()
+
+        db = asyncio.run(run())
+        self.assertEqual(db["1"]["points"], 5)
+        self.assertNotIn("2", db)
+        # The snapshot still holds the first full write; the rest is journal.
+        self.assertEqual(_snapshot()["1"]["points"], 1)
+        journal = _journal()
+        self.assertEqual([(r["key"], r["value"] and r["value"]["points"]) for r in journal], [("1", 5), ("2", None)])
+
+    def test_torn_last_line_is_ignored(self):
+        async def run():
+            async with storage.transaction("1") as db:
+                db["1"] = {"points": 1}
+            with open(storage.JOURNAL_FILE, "a", encoding="utf-8") as f:
+                f.write('{"key":"1","value":{"poi')
+            return await storage.read_all()
+
+        self.assertEqual(_points(asyncio.run(run())), {"1": 1})
+
+    def test_compaction_folds_the_journal_into_the_snapshot(self):
+        async def run():
+            async with storage.transaction("1", "2") as db:
+                db["1"] = {"points": 1}
+                db["2"] = {"points": 2}
+            async with storage.transaction("2") as db:
+                db.pop("2")
+            before = await storage.read_all()
+            await storage.compact()
+            return before, await storage.read_all()
+
+        before, after = asyncio.run(run())
+        self.assertFalse(os.path.exists(storage.JOURNAL_FILE))
+        self.assertEqual(_points(_snapshot()), {"1": 1})
+        self.assertEqual(_points(after), _points(before))
+
+    def test_compaction_runs_after_enough_records(self):
+        storage.JOURNAL_COMPACT_EVERY = 3
+
+        async def run():
+            for i in range(3):
+                async with storage.transaction(str(i)) as db:
+                    db[str(i)] = {"points": i}
+            await asyncio.sleep(0.05)  # the scheduled compaction task
+
+        asyncio.run(run())
+        self.assertFalse(os.path.exists(storage.JOURNAL_FILE))
+        self.assertEqual(_points(_snapshot()), {"0": 0, "1": 1, "2": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
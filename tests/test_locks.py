@@ -0,0 +1,84 @@
+import asyncio
+import importlib
+import sys
+import unittest
+from pathlib import Path
+
+# The repository root is the package itself.
+_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_ROOT.parent))
+locks = importlib.import_module(f"{_ROOT.name}.utils.locks")
+
+
+async def _hold(manager, keys, log, name, pause=0.02):
+    held = await manager.acquire(keys)
+    log.append(f"+{name}")
+    await asyncio.sleep(pause)
+    log.append(f"-{name}")
+    await manager.release(held)
+
+
+def _overlapped(log, a, b):
+    """Whether a and b were held at the same time."""
+    return log.index(f"+{b}") < log.index(f"-{a}") and log.index(f"+{a}") < log.index(f"-{b}")
+
+
+class LockManagerTest(unittest.TestCase):
+    def run_all(self, *jobs):
+        async def run():
+            manager, log = locks.LockManager(), []
+            tasks = []
+            for name, keys in jobs:
+                tasks.append(asyncio.create_task(_hold(manager, keys, log, name)))
+                await asyncio.sleep(0.001)  # start them in this order
+            await asyncio.gather(*tasks)
+            return manager, log
+
+        return asyncio.run(run())
+
+    def test_different_keys_run_in_parallel(self):
+        _, log = self.run_all(("a", ["1"]), ("b", ["2"]))
+        self.assertTrue(_overlapped(log, "a", "b"))
+
+    def test_shared_key_is_exclusive(self):
+        manager, log = self.run_all(("a", ["1", "2"]), ("b", ["2", "3"]))
+        self.assertFalse(_overlapped(log, "a", "b"))
+        self.assertEqual(dict(manager.stats())["2"].contended, 1)
+
+    def test_whole_db_excludes_keyed_holders(self):
+        _, log = self.run_all(("a", ["1"]), ("all", []), ("b", ["2"]))
+        self.assertFalse(_overlapped(log, "a", "all"))
+        self.assertFalse(_overlapped(log, "all", "b"))
+
+    def test_whole_db_holders_exclude_each_other(self):
+        _, log = self.run_all(("x", []), ("y", []))
+        self.assertEqual(log, ["+x", "-x", "+y", "-y"])
+
+    def test_opposite_key_order_does_not_deadlock(self):
+        async def run():
+            manager, log = locks.LockManager(), []
+            await asyncio.wait_for(asyncio.gather(
+                _hold(manager, ["1", "2"], log, "a"),
+                _hold(manager, ["2", "1"], log, "b"),
+            ), timeout=1)
+            return log
+
+        self.assertFalse(_overlapped(asyncio.run(run()), "a", "b"))
+
+    def test_cancelled_waiter_releases_what_it_took(self):
+        async def run():
+            manager = locks.LockManager()
+            held = await manager.acquire(["2"])
+            waiter = asyncio.create_task(manager.acquire(["1", "2"]))  # takes "1", waits on "2"
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+            await manager.release(held)
+            return await asyncio.wait_for(manager.acquire([]), timeout=1)
+
+        self.assertEqual(asyncio.run(run()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+import importlib
+import sys
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+# The repository root is the package itself.
+_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_ROOT.parent))
+models = importlib.import_module(f"{_ROOT.name}.models")
+time = importlib.import_module(f"{_ROOT.name}.utils.time")
+
+
+class TimestampParsingTest(unittest.TestCase):
+    def test_fast_path_agrees_with_strptime(self):
+        for s in ("2026-10-17 08:05", "2026-1-7 8:05", "2026-10-17 8:5"):
+            expected = datetime.strptime(s, "%Y-%m-%d %H:%M")
+            self.assertEqual(time.parse_db_dt(s).replace(tzinfo=None), expected)
+            self.assertEqual(models.parse_minutes(s), models.datetime_to_minutes(expected))
+
+    def test_malformed_fields_are_rejected(self):
+        for s in ("+026-10-17 08:05", " 026-10-17 08:05", "2026-10-17 0_:05", "2026-10-17 24:00", "2026-10-17 08:05 "):
+            with self.assertRaises(ValueError):
+                time.parse_db_dt(s)
+            with self.assertRaises(ValueError):
+                models.parse_minutes(s)
+
+
+if __name__ == "__main__":
+    unittest.main()
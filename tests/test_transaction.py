@@ -0,0 +1,89 @@
+import asyncio
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# The repository root is the package itself.
+_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_ROOT.parent))
+storage = importlib.import_module(f"{_ROOT.name}.storage")
+
+
+def _on_disk():
+    """uid → points as a fresh process would load them."""
+    importlib.reload(storage)
+    db = asyncio.run(storage.read_all())
+    return {k: v["points"] for k, v in db.items() if k != "_config"}
+
+
+async def _add(uid: str, amount: int, pause: float = 0.01) -> None:
+    async with storage.transaction(uid) as db:
+        user = await storage.get_user(db, uid)
+        points = user["points"]
+        await asyncio.sleep(pause)  # let the other transactions interleave
+        user["points"] = points + amount
+
+
+class TransactionTest(unittest.TestCase):
+    resident = True
+
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+        importlib.reload(storage)  # a fresh process: no resident document, no open locks
+        storage.STORAGE_RESIDENT = self.resident
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+        importlib.reload(storage)
+
+    def test_different_keys_both_persist(self):
+        async def run():
+            await asyncio.gather(_add("1", 3), _add("2", 4))
+            await storage.flush()
+
+        asyncio.run(run())
+        self.assertEqual(_on_disk(), {"1": 3, "2": 4})
+
+    def test_same_key_updates_are_serialized(self):
+        async def run():
+            await asyncio.gather(*(_add("1", 1, pause=0.001) for _ in range(10)))
+            await storage.flush()
+
+        asyncio.run(run())
+        self.assertEqual(_on_disk(), {"1": 10})
+
+    def test_version_moves_on_commit(self):
+        async def run():
+            before = storage.version()
+            await _add("1", 1, pause=0)
+            return before, storage.version()
+
+        before, after = asyncio.run(run())
+        self.assertGreater(after, before)
+
+
+class FileTransactionTest(TransactionTest):
+    """Every transaction loads its own copy from disk and journals only its keys."""
+
+    resident = False
+
+    def test_failed_body_is_discarded(self):
+        async def run():
+            await _add("1", 1, pause=0)
+            with self.assertRaises(RuntimeError):
+                async with storage.transaction("1") as db:
+                    db["1"]["points"] = 99
+                    raise RuntimeError
+
+        asyncio.run(run())
+        self.assertEqual(_on_disk(), {"1": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import asyncio
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# The repository root is the package itself.
+_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_ROOT.parent))
+storage = importlib.import_module(f"{_ROOT.name}.storage")
+main = importlib.import_module(f"{_ROOT.name}.main")
+
+
+def _on_disk():
+    """uid → points as a fresh process would load them."""
+    importlib.reload(storage)
+    db = asyncio.run(storage.read_all())
+    return {k: v["points"] for k, v in db.items() if k != "_config"}
+
+
+class WriteBehindTest(unittest.TestCase):
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+        importlib.reload(storage)  # a fresh process: no resident document, no open locks
+        self.assertTrue(storage.STORAGE_RESIDENT)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+        importlib.reload(storage)
+
+    def test_reads_share_the_resident_document(self):
+        async def run():
+            async with storage.transaction("1") as db:
+                db["1"] = {"points": 1}
+            return db, await storage.read_all()
+
+        written, read = asyncio.run(run())
+        self.assertIs(written, read)
+
+    def test_changes_are_flushed_after_a_quiet_period(self):
+        storage.WRITE_BEHIND_DELAY = 0.05
+
+        async def run():
+            async with storage.transaction("1") as db:
+                db["1"] = {"points": 1}
+            await asyncio.sleep(0)
+            pending = os.path.exists(storage.JOURNAL_FILE)
+            await asyncio.sleep(0.2)
+            return pending
+
+        self.assertFalse(asyncio.run(run()))
+        self.assertEqual(_on_disk(), {"1": 1})
+
+    def test_steady_changes_are_flushed_by_the_max_delay(self):
+        storage.WRITE_BEHIND_DELAY = 0.05
+        storage.WRITE_BEHIND_MAX_DELAY = 0.15
+
+        async def run():
+            flushed_at = None
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            for i in range(20):  # never quiet for WRITE_BEHIND_DELAY
+                async with storage.transaction("1") as db:
+                    db["1"] = {"points": i}
+                if flushed_at is None and os.path.exists(storage.JOURNAL_FILE):
+                    flushed_at = loop.time() - start
+                await asyncio.sleep(0.02)
+            await storage.flush()
+            return flushed_at
+
+        flushed_at = asyncio.run(run())
+        self.assertIsNotNone(flushed_at)
+        self.assertLess(flushed_at, 0.3)
+        self.assertEqual(_on_disk(), {"1": 19})
+
+    def test_post_shutdown_flushes_pending_changes(self):
+        storage.WRITE_BEHIND_DELAY = 60
+
+        async def run():
+            async with storage.transaction("1", "2") as db:
+                db["1"] = {"points": 1}
+                db["2"] = {"points": 2}
+            await main._post_shutdown(None)
+
+        asyncio.run(run())
+        self.assertEqual(_on_disk(), {"1": 1, "2": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import asyncio
+import time
+from typing import Dict, Iterable, List, Tuple
+
+
+class LockStats:
+    __slots__ = ("acquired", "contended", "wait_total", "wait_max")
+
+    def __init__(self) -> None:
+        self.acquired = 0
+        self.contended = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, waited: float, contended: bool) -> None:
+        self.acquired += 1
+        if contended:
+            self.contended += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+
+class _SharedExclusive:
+    """Many shared holders or one exclusive holder (for whole-DB transactions)."""
+
+    def __init__(self) -> None:
+        self._cond = asyncio.Condition()
+        self._shared = 0
+        self._exclusive = False
+
+    def busy(self, exclusive: bool) -> bool:
+        return self._exclusive or (exclusive and self._shared > 0)
+
+    async def acquire(self, exclusive: bool) -> None:
+        async with self._cond:
+            if exclusive:
+                await self._cond.wait_for(lambda: not self._exclusive and self._shared == 0)
+                self._exclusive = True
+            else:
+                await self._cond.wait_for(lambda: not self._exclusive)
+                self._shared += 1
+
+    async def release(self, exclusive: bool) -> None:
+        async with self._cond:
+            if exclusive:
+                self._exclusive = False
+            else:
+                self._shared -= 1
+            self._cond.notify_all()
+
+
+class LockManager:
+    """
+    Per-key asyncio locks (user ids, "_config", cross-user keys).
+    Keys are always taken in sorted order so two transactions can never
+    wait on each other. A whole-DB holder excludes every keyed holder.
+    """
+
+    GLOBAL = "*"
+
+    def __init__(self) -> None:
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._global = _SharedExclusive()
+        self._stats: Dict[str, LockStats] = {}
+
+    def _stat(self, key: str) -> LockStats:
+        stat = self._stats.get(key)
+        if stat is None:
+            stat = self._stats[key] = LockStats()
+        return stat
+
+    async def acquire(self, keys: Iterable[str]) -> List[str]:
+        """Take the locks for `keys` (all of the DB when empty); returns what to release."""
+        ordered = sorted(set(keys))
+        exclusive = not ordered
+        contended = self._global.busy(exclusive)
+        start = time.perf_counter()
+        await self._global.acquire(exclusive)
+        self._stat(self.GLOBAL).record(time.perf_counter() - start, contended)
+
+        held: List[str] = []
+        try:
+            for key in ordered:
+                lock = self._locks.get(key)
+                if lock is None:
+                    lock = self._locks[key] = asyncio.Lock()
+                contended = lock.locked()
+                start = time.perf_counter()
+                await lock.acquire()
+                held.append(key)
+                self._stat(key).record(time.perf_counter() - start, contended)
+        except BaseException:
+            await self._release(held, exclusive)
+            raise
+        return held
+
+    async def release(self, held: List[str]) -> None:
+        await self._release(held, not held)
+
+    async def _release(self, held: List[str], exclusive: bool) -> None:
+        for key in reversed(held):
+            self._locks[key].release()
+        await self._global.release(exclusive)
+
+    def stats(self) -> List[Tuple[str, LockStats]]:
+        """Locks ordered by total time spent waiting on them."""
+        return sorted(self._stats.items(), key=lambda kv: kv[1].wait_total, reverse=True)
@@ -1,5 +1,7 @@
-from datetime import datetime, date, time, timedelta
-from typing import Tuple
+# TEAMETO package
+from datetime import datetime, date, time, timedelta, tzinfo
+from functools import lru_cache
+from typing import Optional, Tuple
 from .. import config
 
 def now_local() -> datetime:
@@ -15,9 +17,49 @@ def parse_hhmm(hhmm: str) -> time:
     h, m = hhmm.split(":")
     return time(int(h), int(m))
 
+
+@lru_cache(maxsize=4096)
+def _day_tzinfo(year: int, month: int, day: int) -> Optional[tzinfo]:
+    """
+    The pytz tzinfo in force for a whole local day, or None when the UTC
+    offset changes during that day (then we localize per call).
+    """
+    tz = config.LOCAL_TZ
+    first = tz.localize(datetime(year, month, day, 0, 0))
+    last = tz.localize(datetime(year, month, day, 23, 59))
+    if first.utcoffset() != last.utcoffset():
+        return None
+    return first.tzinfo
+
+
+def localize(naive: datetime) -> datetime:
+    """Attach LOCAL_TZ to a naive local datetime (pytz or zoneinfo)."""
+    tz = config.LOCAL_TZ
+    if not hasattr(tz, "localize"):
+        return naive.replace(tzinfo=tz)
+    tzi = _day_tzinfo(naive.year, naive.month, naive.day)
+    if tzi is None:
+        return tz.localize(naive)
+    return naive.replace(tzinfo=tzi)
+
+
+def db_dt_fields(s: str) -> Optional[Tuple[int, int, int, int, int]]:
+    """
+    (year, month, day, hour, minute) of a strictly 'YYYY-MM-DD HH:MM' string
+    with ASCII digits, or None when it is anything else (leave that to strptime).
+    """
+    if (
+        len(s) == 16 and s[4] == "-" and s[7] == "-" and s[10] == " " and s[13] == ":"
+        and s.isascii() and (s[0:4] + s[5:7] + s[8:10] + s[11:13] + s[14:16]).isdigit()
+    ):
+        return int(s[0:4]), int(s[5:7]), int(s[8:10]), int(s[11:13]), int(s[14:16])
+    return None
+
+
 def parse_db_dt(s: str) -> datetime:
     """
     Parse 'YYYY-MM-DD HH:MM' (stored in JSON) into a timezone-aware datetime.
     """
-    naive = datetime.strptime(s, "%Y-%m-%d %H:%M")
-    return config.LOCAL_TZ.localize(naive)
+    fields = db_dt_fields(s)
+    naive = datetime(*fields) if fields else datetime.strptime(s, "%Y-%m-%d %H:%M")
+    return localize(naive)